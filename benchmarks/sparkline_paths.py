@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of the SVG trend path renderer against the loop-based
+implementation it replaced.
+
+Usage (from the repository root):
+    python -m benchmarks.sparkline_paths [points] [series] [rounds]
+
+Reports per-call time for cold renders (memo cleared), repeated renders of
+the same series (memo hits), the batch API, and the path length in bytes.
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webapp")
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+import sparkline
+from sparkline import generate_smooth_path, generate_smooth_paths
+
+
+def legacy_smooth_path(values, width=472, height=150):
+    values = [v if v is not None else 0 for v in values]
+    if sum(values) == 0:
+        values = [1 for _ in values]
+    n = len(values)
+    if n < 2:
+        raise ValueError("Need at least 2 points")
+
+    # Normalize Y values (invert SVG Y axis)
+    max_val = max(values)
+    scaled = [height - (v / max_val * height + 0.000001) for v in values]
+
+    # Evenly spaced X values
+    step = width / (n - 1)
+    pts = [(i * step, scaled[i]) for i in range(n)]
+
+    def catmull_rom_to_bezier(p0, p1, p2, p3):
+        """
+        Convert 4 Catmull-Rom points into 2 Bézier control points.
+        """
+        c1 = (p1[0] + (p2[0] - p0[0]) / 6,
+              p1[1] + (p2[1] - p0[1]) / 6)
+
+        c2 = (p2[0] - (p3[0] - p1[0]) / 6,
+              p2[1] - (p3[1] - p1[1]) / 6)
+
+        return c1, c2
+
+    # Start
+    d = [f"M{pts[0][0]},{pts[0][1]}"]
+
+    # Build smooth curve
+    for i in range(n - 1):
+        p0 = pts[i - 1] if i > 0 else pts[i]
+        p1 = pts[i]
+        p2 = pts[i + 1]
+        p3 = pts[i + 2] if i + 2 < n else pts[i + 1]
+
+        c1, c2 = catmull_rom_to_bezier(p0, p1, p2, p3)
+
+        d.append(f"C{c1[0]},{c1[1]} {c2[0]},{c2[1]} {p2[0]},{p2[1]}")
+
+    line_path = " ".join(d)
+
+    # Area path (close shape)
+    area_path = line_path + f" V{height} H0 Z"
+
+    return area_path, line_path
+
+
+def per_call(func, series, rounds, before_round=None):
+    timings = []
+    for _ in range(rounds):
+        if before_round:
+            before_round()
+        start = time.perf_counter()
+        func(series)
+        timings.append((time.perf_counter() - start) / len(series))
+    return statistics.median(timings)
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    rng = random.Random(42)
+    series = [[round(rng.uniform(0, 300), 2) for _ in range(points)] for _ in range(count)]
+    clear = sparkline._memo.clear
+
+    results = {
+        "legacy": per_call(lambda s: [legacy_smooth_path(v) for v in s], series, rounds),
+        "cold": per_call(lambda s: [generate_smooth_path(v) for v in s], series, rounds, clear),
+        "memo hit": per_call(lambda s: [generate_smooth_path(v) for v in s], series, rounds),
+        "batch cold": per_call(generate_smooth_paths, series, rounds, clear),
+    }
+
+    print(f"{count} series of {points} points, {rounds} rounds, numpy {'on' if sparkline.np else 'off'}")
+    base = results["legacy"]
+    for name, seconds in results.items():
+        print(f"{name:>10}: {seconds * 1e6:8.1f} us/path  ({base / seconds:5.1f}x)")
+
+    old = sum(len(a) + len(b) for a, b in (legacy_smooth_path(v) for v in series)) / count
+    new = sum(len(a) + len(b) for a, b in generate_smooth_paths(series)) / count
+    print(f"path bytes: {old:.0f} -> {new:.0f} ({new / old:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Synthetic data for the webapp benchmarks: nodes cloned from the
+configs/*.yaml templates with readings at their sampling_rate, and AQI-IN
+scrape history for the map.
+
+Usage (from the repository root, against a throwaway database):
+    python -m benchmarks.synthetic_data <database> [nodes] [days] [scrapes] [--bulk]
+
+The database is dropped and recreated, then provisioned with the scripts
+in webapp/db_scripts. Its name must contain "_bench" (aqi_bench,
+aqi_bench_small, ...), so a typo cannot wipe a real database. Generation is seeded, so two runs with the same
+arguments produce the same data.
+
+With --bulk, readings are generated by INSERT ... SELECT inside MySQL and
+the rollups are backfilled afterwards, which is what makes tens of
+millions of rows practical. Bulk series are a daily cycle plus uniform
+noise instead of the random walk of the default generator.
+"""
+import os
+import re
+import sys
+import glob
+import math
+import time
+import random
+import logging
+from datetime import timedelta
+import yaml
+import mysql.connector
+from dotenv import load_dotenv
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBAPP_DIR = os.path.join(ROOT_DIR, "webapp")
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_db_config
+from aqi_snapshot import AQI_COLUMNS, rebuild_latest_snapshot
+from registry import bump_version
+from webapp.db_scripts.initialize_db import init_tables
+from webapp.db_scripts.initialize_node import initialize_node, initialize_sensors
+import store
+
+CONFIG_DIR = os.path.join(ROOT_DIR, "configs")
+
+INDIA = {"min_lat": 8.0, "max_lat": 37.0, "min_lon": 68.0, "max_lon": 97.5}
+
+# Rough level and spread of each kind of measurement, matched on its unit
+LEVELS = {
+    "aqi": (120, 60),
+    "µg/m³": (60, 40),
+    "ppm": (1.5, 1.0),
+    "ppb": (30, 20),
+    "°c": (27, 6),
+    "%": (55, 20),
+}
+DEFAULT_LEVEL = (50, 25)
+
+logger = logging.getLogger(__name__)
+
+
+def load_templates(config_dir=CONFIG_DIR):
+    """Node configs found in config_dir; other YAML files (retention.yaml) are skipped."""
+    templates = []
+    for path in sorted(glob.glob(os.path.join(config_dir, "*.yaml"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+        if isinstance(data, dict) and "Node" in data and "Sensors" in data:
+            templates.append(data)
+    return templates
+
+
+def template_measurements(template):
+    for sensor in template["Sensors"].values():
+        measurements = sensor["measurements"]
+        if isinstance(measurements, dict):
+            measurements = [measurements]
+        for m in measurements:
+            yield sensor["id"], m["measurement_id"], m.get("unit", "")
+
+
+def make_nodes(templates, count, rng):
+    """`count` nodes cycling through the templates, scattered around their original site."""
+    nodes = []
+    for i in range(count):
+        template = templates[i % len(templates)]
+        node = dict(template["Node"])
+        node["id"] = f"bench{i}"
+        node["location_name"] = f"{node['location_name']} (synthetic {i})"
+        node["lat"] = float(node["lat"]) + rng.uniform(-0.05, 0.05)
+        node["lon"] = float(node["lon"]) + rng.uniform(-0.05, 0.05)
+        nodes.append({
+            "node": node,
+            "sensors": template["Sensors"],
+            "sampling_rate": int(template.get("sampling_rate") or 5000),
+            "measurements": list(template_measurements(template)),
+        })
+    return nodes
+
+
+def check_bench_name(name):
+    """Refuse any name that is not clearly a throwaway benchmark database."""
+    if not re.fullmatch(r"\w*_bench\w*", name):
+        raise ValueError(f"Refusing to drop {name!r}: benchmark databases must be named *_bench*")
+
+
+def recreate_database(name):
+    check_bench_name(name)
+    conn = mysql.connector.connect(**get_db_config(database=False))
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+    cursor.execute(f"CREATE DATABASE {name}")
+    cursor.close()
+    conn.close()
+
+
+def drop_database(name):
+    check_bench_name(name)
+    conn = mysql.connector.connect(**get_db_config(database=False))
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+    cursor.close()
+    conn.close()
+
+
+def provision(cursor, nodes):
+    init_tables(cursor, logger)
+    for spec in nodes:
+        initialize_node(spec["node"], cursor, logger)
+        initialize_sensors(spec["node"], spec["sensors"], cursor, logger)
+    bump_version(cursor)
+
+
+def level_for(unit):
+    unit = (unit or "").lower()
+    for marker, level in LEVELS.items():
+        if marker in unit:
+            return level
+    return DEFAULT_LEVEL
+
+
+def reading_series(start, step, count, unit, rng):
+    """Mean-reverting random walk with a daily cycle, never negative."""
+    mean, spread = level_for(unit)
+    value = mean
+    for i in range(count):
+        ts = start + step * i
+        daily = math.sin((ts.hour + ts.minute / 60) / 24 * 2 * math.pi) * spread * 0.3
+        value += (mean + daily - value) * 0.01 + rng.gauss(0, spread * 0.02)
+        yield ts, round(max(value, 0.0), 2)
+
+
+def generate_readings(conn, cursor, nodes, days, end, rng, chunk_size=10000):
+    """Fill every measurement of every node; returns the number of readings written."""
+    written = 0
+    for spec in nodes:
+        step = timedelta(milliseconds=spec["sampling_rate"])
+        count = int(days * 86400 * 1000 / spec["sampling_rate"])
+        start = end - step * count
+        for sensor_id, measurement_id, unit in spec["measurements"]:
+            key = (str(spec["node"]["id"]), int(sensor_id), int(measurement_id))
+            chunk = []
+            for row in reading_series(start, step, count, unit, rng):
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    store.insert_readings(cursor, key, chunk)
+                    conn.commit()
+                    written += len(chunk)
+                    chunk = []
+            if chunk:
+                store.insert_readings(cursor, key, chunk)
+                conn.commit()
+                written += len(chunk)
+    return written
+
+
+def create_sequence(cursor, size):
+    """Temporary table bench_seq holding 0..size-1, built by cross joining digits."""
+    digits = max(1, math.ceil(math.log10(max(size, 2))))
+    # A temporary table cannot appear twice in one query, so the digits are inline
+    digit = "(" + " UNION ALL ".join(f"SELECT {d} AS d" for d in range(10)) + ")"
+    cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS bench_seq (n INT PRIMARY KEY)")
+    number = " + ".join(f"d{i}.d * {10 ** i}" for i in range(digits))
+    sources = ", ".join(f"{digit} d{i}" for i in range(digits))
+    cursor.execute(f"INSERT IGNORE INTO bench_seq SELECT {number} AS n FROM {sources} HAVING n < %s", (size,))
+
+
+def bulk_generate_readings(conn, cursor, nodes, days, end, seed, chunk_size=1000000):
+    """
+    generate_readings() done by MySQL: every chunk of a series is one
+    INSERT ... SELECT over bench_seq, and rollups are backfilled per series
+    at the end. Returns the number of readings written.
+    """
+    create_sequence(cursor, chunk_size)
+    written = 0
+    chunks = 0
+    for spec in nodes:
+        rate = spec["sampling_rate"]
+        count = int(days * 86400 * 1000 / rate)
+        start = end - timedelta(milliseconds=rate) * count
+        for sensor_id, measurement_id, unit in spec["measurements"]:
+            key = (str(spec["node"]["id"]), int(sensor_id), int(measurement_id))
+            table, key_cols = (store.MEASUREMENT_TABLE, list(store.SERIES_KEY)) if store.consolidated() \
+                else (store.measurement_table(*key), [])
+            key_values = "%s, %s, %s, " if key_cols else ""
+            mean, spread = level_for(unit)
+            ts = "(%s + INTERVAL (n + %s) * %s MICROSECOND)"
+            for offset in range(0, count, chunk_size):
+                chunks += 1
+                cursor.execute(f"""
+                    INSERT INTO {table} ({"".join(f"{col}, " for col in key_cols)}timestamp, value)
+                    SELECT {key_values}{ts},
+                           ROUND(GREATEST(0, %s
+                                 + SIN((HOUR({ts}) + MINUTE({ts}) / 60) / 24 * 2 * PI()) * %s
+                                 + (RAND(%s) - 0.5) * %s), 2)
+                    FROM bench_seq
+                    WHERE n < %s
+                """, (*(key if key_cols else ()), start, offset, rate * 1000,
+                      mean, start, offset, rate * 1000, start, offset, rate * 1000, spread * 0.3,
+                      seed * 100003 + chunks, spread * 0.4, min(chunk_size, count - offset)))
+                conn.commit()
+                written += cursor.rowcount
+            store.backfill_series_rollups(cursor, key)
+            conn.commit()
+    return written
+
+
+def generate_scrapes(conn, cursor, rows, end, rng, locations=2000, interval_minutes=15, chunk_size=5000):
+    """
+    AqiInScrape history: `locations` sites across India, each scraped once
+    per round, rounds `interval_minutes` apart and ending at `end`.
+    """
+    locations = max(1, min(locations, rows))
+    sites = [
+        (rng.uniform(INDIA["min_lat"], INDIA["max_lat"]), rng.uniform(INDIA["min_lon"], INDIA["max_lon"]),
+         f"loc{i}", f"City {i % 300}", f"State {i % 30}")
+        for i in range(locations)
+    ]
+    columns = [col for col in AQI_COLUMNS if col != "scrape_id"]
+    query = f"INSERT INTO AqiInScrape ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+
+    rounds = math.ceil(rows / locations)
+    written = 0
+    batch = []
+    for r in range(rounds):
+        updated = end - timedelta(minutes=interval_minutes * (rounds - 1 - r))
+        for lat, lon, location_id, city, state in sites:
+            if written + len(batch) >= rows:
+                break
+            aqi = rng.randint(20, 400)
+            pm25 = round(aqi * rng.uniform(0.3, 0.6), 1)
+            batch.append((
+                lat, lon, location_id, city, state, "India", updated,
+                aqi, int(aqi * rng.uniform(0.8, 1.2)),
+                round(rng.uniform(200, 2000), 1), round(rng.uniform(20, 90), 1),
+                round(rng.uniform(5, 60), 1), round(rng.uniform(5, 80), 1),
+                round(pm25 * rng.uniform(1.2, 2.0), 1), pm25,
+                round(rng.uniform(1, 20), 1), round(rng.uniform(10, 40), 1),
+                round(pm25 * rng.uniform(0.5, 0.8), 1), round(rng.uniform(0.1, 2), 2),
+                round(rng.uniform(40, 80), 1),
+            ))
+            if len(batch) >= chunk_size:
+                cursor.executemany(query, batch)
+                conn.commit()
+                written += len(batch)
+                batch = []
+    if batch:
+        cursor.executemany(query, batch)
+        conn.commit()
+        written += len(batch)
+
+    rebuild_latest_snapshot(cursor)
+    conn.commit()
+    return written
+
+
+def build(database, nodes=2, days=7, scrapes=100000, seed=42, config_dir=CONFIG_DIR, bulk=False):
+    """
+    Recreate `database` and fill it. Returns a summary with the generated
+    node ids and row counts. Connects with the DB_* settings, using
+    `database` instead of DB_NAME. `bulk` generates readings in MySQL.
+    """
+    rng = random.Random(seed)
+    templates = load_templates(config_dir)
+    if not templates:
+        raise RuntimeError(f"No node configs found in {config_dir}")
+    specs = make_nodes(templates, nodes, rng)
+
+    recreate_database(database)
+    conn = mysql.connector.connect(**{**get_db_config(database=False), "database": database})
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        provision(cursor, specs)
+        conn.commit()
+
+        cursor.execute("SELECT NOW()")
+        end = cursor.fetchone()[0].replace(microsecond=0)
+        if bulk:
+            readings = bulk_generate_readings(conn, cursor, specs, days, end, seed)
+        else:
+            readings = generate_readings(conn, cursor, specs, days, end, rng)
+        scrape_rows = generate_scrapes(conn, cursor, scrapes, end, rng)
+        elapsed = time.perf_counter() - start
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        "nodes": [str(spec["node"]["id"]) for spec in specs],
+        "series": sum(len(spec["measurements"]) for spec in specs),
+        "readings": readings,
+        "scrapes": scrape_rows,
+        "days": days,
+        "bulk": bulk,
+        "generate_s": round(elapsed, 2),
+        "end": end.isoformat(),
+    }
+
+
+def main():
+    load_dotenv()
+    bulk = "--bulk" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--bulk"]
+    if not args:
+        print("Usage: python -m benchmarks.synthetic_data <database> [nodes] [days] [scrapes] [--bulk]")
+        sys.exit(1)
+    database = args[0]
+    try:
+        check_bench_name(database)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    nodes = int(args[1]) if len(args) > 1 else 2
+    days = float(args[2]) if len(args) > 2 else 7
+    scrapes = int(args[3]) if len(args) > 3 else 100000
+    summary = build(database, nodes, days, scrapes, bulk=bulk)
+    print(f"{database}: {len(summary['nodes'])} nodes, {summary['series']} series, "
+          f"{summary['readings']} readings, {summary['scrapes']} scrapes in {summary['generate_s']} s")
+
+
+if __name__ == "__main__":
+    main()
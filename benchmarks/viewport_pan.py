@@ -0,0 +1,88 @@
+"""
+Pan a map viewport across India and time the latest-AQI bounding box query
+with the geohash index against plain lat/lon range predicates.
+
+Usage (from the repository root, with the usual DB_* variables set):
+    python -m benchmarks.viewport_pan [viewport_degrees] [step_degrees]
+"""
+import os
+import sys
+import time
+import statistics
+from dotenv import load_dotenv
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webapp")
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from aqi_snapshot import LATEST_TABLE
+from api_routes import build_latest_aqi_query
+
+INDIA = {"min_lat": 8.0, "max_lat": 37.0, "min_lon": 68.0, "max_lon": 97.5}
+
+
+def range_only_query(min_lat, max_lat, min_lon, max_lon):
+    query = f"""
+        SELECT a.*
+        FROM {LATEST_TABLE} a IGNORE INDEX (idx_geohash)
+        WHERE a.lat >= %s AND a.lat <= %s AND a.lon >= %s AND a.lon <= %s
+        ORDER BY a.locationId;
+    """
+    return query, [min_lat, max_lat, min_lon, max_lon]
+
+
+def viewports(size, step):
+    lat = INDIA["min_lat"]
+    while lat + size <= INDIA["max_lat"]:
+        lon = INDIA["min_lon"]
+        while lon + size <= INDIA["max_lon"]:
+            yield lat, lat + size, lon, lon + size
+            lon += step
+        lat += step
+
+
+def time_query(cursor, query, params):
+    start = time.perf_counter()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    return time.perf_counter() - start, len(rows)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    load_dotenv()
+    size = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    step = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    timings = {"geohash": [], "range": []}
+    mismatches = 0
+    conn = get_connection()
+    cursor = conn.cursor(buffered=True)
+    try:
+        for box in viewports(size, step):
+            geo_s, geo_rows = time_query(cursor, *build_latest_aqi_query(*box))
+            range_s, range_rows = time_query(cursor, *range_only_query(*box))
+            timings["geohash"].append(geo_s)
+            timings["range"].append(range_s)
+            if geo_rows != range_rows:
+                mismatches += 1
+    finally:
+        cursor.close()
+        conn.close()
+
+    print(f"{len(timings['geohash'])} viewports of {size}° stepped by {step}°")
+    for name, values in timings.items():
+        print(f"{name:>8}: p50 {statistics.median(values) * 1000:.2f} ms, "
+              f"p95 {percentile(values, 95) * 1000:.2f} ms, "
+              f"total {sum(values):.3f} s")
+    if mismatches:
+        print(f"WARNING: {mismatches} viewports returned different row counts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Time every route of the webapp through the Flask test client against
+synthetic databases of growing size.
+
+Usage (from the repository root, with DB_* pointing at a MySQL server the
+benchmark may create and drop databases on):
+    python -m benchmarks.webapp_routes [--scales small,medium] [--repeat N]
+        [--output results.json] [--database aqi_bench] [--seed N] [--keep]
+
+Only the small scale runs by default; medium and large take minutes to
+generate even in bulk.
+
+For each scale a fresh database is generated (see synthetic_data.py) and
+every route is requested once cold and `repeat` times warm. The report is
+JSON with p50/p95 latency, the number of SQL statements the server
+executed per request and the peak Python memory allocated while serving
+it, so runs from different commits can be diffed. Routes reading tables
+that the db_scripts do not create (tvoc_data, winsen*) are reported with
+the error status they return.
+
+Each scale runs in its own process, so connection pools, caches and the
+node registry never carry over from a smaller database.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import tracemalloc
+from datetime import datetime
+from dotenv import load_dotenv
+import mysql.connector
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webapp")
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+# Larger scales generate their readings inside MySQL (see synthetic_data.py)
+SCALES = {
+    "small": {"nodes": 4, "days": 1, "scrapes": 20000},
+    "medium": {"nodes": 4, "days": 14, "scrapes": 500000, "bulk": True},
+    "large": {"nodes": 4, "days": 60, "scrapes": 3000000, "bulk": True},
+}
+
+# The live stream never ends, and static files say nothing about the app
+SKIP_ENDPOINTS = {"static", "api.stream_node"}
+
+# Query strings timed in addition to the bare URL
+VARIANTS = {
+    "hello": ["?hours=24", "?hours=168", "?hours=720"],
+    "api.get_measurement_data": ["?limit=50", "?points=500", "?since=0"],
+    "api.get_latest_aqi_data": ["?min_lat=30.6&max_lat=30.8&min_lon=76.7&max_lon=76.9"],
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def route_cases(app, summary):
+    """(name, method, url, json body) for every route the app serves."""
+    node_id = summary["nodes"][0]
+    args = {
+        "node_id": node_id,
+        "sensor_id": 1,
+        "measurement_id": 1,
+        "table": "winsen1",
+        "sensor": "pm25",
+    }
+    bodies = {
+        "api.post_data": {"timestamp": None, "value": 42.0},
+        "api.post_data_batch": {"readings": [
+            {"node_id": node_id, "sensor_id": 1, "measurement_id": 1, "value": 40.0 + i}
+            for i in range(100)
+        ]},
+    }
+
+    adapter = app.url_map.bind("localhost")
+    cases = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if rule.endpoint in SKIP_ENDPOINTS or not rule.arguments.issubset(args):
+            continue
+        method = "POST" if "POST" in rule.methods else "GET"
+        url = adapter.build(rule.endpoint, {name: args[name] for name in rule.arguments}, method=method)
+        body = bodies.get(rule.endpoint)
+        for suffix in [""] + VARIANTS.get(rule.endpoint, []):
+            cases.append((f"{method} {rule.rule}{suffix}", method, url + suffix, body))
+    return cases
+
+
+class QueryCounter:
+    """Statements executed by the server, from the global Questions counter."""
+
+    def __init__(self, connect):
+        self.conn = connect()
+        self.cursor = self.conn.cursor()
+
+    def read(self):
+        self.cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(self.cursor.fetchone()[1])
+
+    def close(self):
+        self.cursor.close()
+        self.conn.close()
+
+
+def request(client, method, url, body):
+    if method == "POST":
+        return client.post(url, json=body)
+    return client.get(url)
+
+
+def time_case(client, counter, method, url, body, repeat):
+    start = time.perf_counter()
+    response = request(client, method, url, body)
+    cold = time.perf_counter() - start
+
+    timings = []
+    before = counter.read()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = request(client, method, url, body)
+        timings.append(time.perf_counter() - start)
+    # The SHOW STATUS of read() is counted too
+    queries = (counter.read() - before - 1) / repeat
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    request(client, method, url, body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "bytes": len(response.get_data()),
+        "cold_ms": round(cold * 1000, 3),
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "queries": round(queries, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_scale(name, database, repeat, seed, keep):
+    """Generate one scale and time every route; runs in a child process."""
+    # The app reads DB_NAME when its pool is first used
+    os.environ["DB_NAME"] = database
+    # Cache warming would run queries in the background while routes are timed
+    os.environ["STATS_CACHE_WARM"] = "0"
+
+    from db import get_db_config
+    from benchmarks.synthetic_data import build, drop_database
+
+    params = SCALES[name]
+    print(f"[{name}] generating {params}", file=sys.stderr)
+    summary = build(database, seed=seed, **params)
+    print(f"[{name}] {summary['readings']} readings, {summary['scrapes']} scrapes "
+          f"in {summary['generate_s']} s", file=sys.stderr)
+
+    from app import app
+    import store
+
+    client = app.test_client()
+    counter = QueryCounter(lambda: mysql.connector.connect(**get_db_config()))
+    routes = {}
+    try:
+        for case, method, url, body in route_cases(app, summary):
+            routes[case] = time_case(client, counter, method, url, body, repeat)
+            r = routes[case]
+            print(f"[{name}] {case}: {r['status']} p50 {r['p50_ms']:.1f} ms, p95 {r['p95_ms']:.1f} ms, "
+                  f"{r['queries']:g} queries, {r['peak_kib']:.0f} KiB", file=sys.stderr)
+    finally:
+        counter.close()
+        if not keep:
+            drop_database(database)
+
+    return {"params": params, "layout": store.LAYOUT, "data": summary, "routes": routes}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark webapp routes on synthetic data")
+    parser.add_argument("--scales", default="small", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=20, help="warm requests per route")
+    parser.add_argument("--database", default="aqi_bench",
+                        help="throwaway database, dropped and recreated; must contain _bench")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the generated databases")
+    parser.add_argument("--scale", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scale:
+        # Child process: the app may print to stdout, so the result goes to a file
+        result = run_scale(args.scale, args.database, args.repeat, args.seed, args.keep)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f, default=str)
+        return
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+
+    report = {
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "scales": {},
+    }
+    for name in scales:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            result_path = tmp.name
+        try:
+            command = [sys.executable, "-m", "benchmarks.webapp_routes", "--scale", name,
+                       "--result", result_path, "--database", f"{args.database}_{name}",
+                       "--repeat", str(args.repeat), "--seed", str(args.seed)]
+            if args.keep:
+                command.append("--keep")
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            with open(result_path, 'r', encoding='utf-8') as f:
+                report["scales"][name] = json.load(f)
+        finally:
+            os.unlink(result_path)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,34 @@
-import serial
+import os
 import re
-import subprocess
 import json
+import threading
+from collections import deque
+from datetime import datetime
+
+import requests
+import serial
+
+NODE_ID = os.getenv("NODE_ID", "A01")
+SERVER_URL = os.getenv("SERVER_URL", "http://10.1.40.45")
+SERIAL_PORT = os.getenv("SERIAL_PORT", "/dev/ttyACM0")
+BAUDRATE = int(os.getenv("SERIAL_BAUDRATE", "9600"))
+
+BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.getenv("UPLOAD_FLUSH_INTERVAL", "5"))
+QUEUE_LIMIT = int(os.getenv("UPLOAD_QUEUE_LIMIT", "5000"))
+REQUEST_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "10"))
+SPOOL_PATH = os.getenv("UPLOAD_SPOOL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpi_spool.jsonl"))
+# Batches the server refuses (4xx) are kept here for inspection, not retried
+REJECTED_PATH = os.getenv("UPLOAD_REJECTED", SPOOL_PATH + ".rejected")
+
+# 4xx answers that mean "try again later" rather than "bad data"
+RETRY_STATUSES = {408, 429}
+
+LINE_RE = re.compile(r"sensor=(\d+), measurement=(\d+), value=([\d.]+), ts=(\d+)")
+
 
 def extract_numbers(input_string):
-    match = re.search(r"sensor=(\d+), measurement=(\d+), value=([\d.]+), ts=(\d+)", line)
+    match = LINE_RE.search(input_string)
     if match:
         sensor = int(match.group(1))
         measurement = int(match.group(2))
@@ -14,41 +38,203 @@ def extract_numbers(input_string):
         return sensor, measurement, value, ts
     else:
         return None, None, None, None
-    
-def send_curl(url, data):
-    subprocess.Popen([
-        "curl",
-        "-X", "POST",
-        "-H", "Content-Type: application/json",
-        "-d", json.dumps(data),
-        url
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class Spool:
+    """
+    Append-only JSON-lines file holding readings that could not be sent.
+    A sidecar file records the byte offset up to which lines have already
+    been replayed, so a restart during replay does not resend them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.lock = threading.Lock()
+
+    def append(self, readings):
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            for reading in readings:
+                f.write(json.dumps(reading) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _offset(self):
+        try:
+            with open(self.offset_path, encoding="utf-8") as f:
+                raw = f.read().strip()
+        except OSError:
+            return 0
+        try:
+            return int(raw or 0)
+        except ValueError:
+            # Resending the spool beats losing it
+            print(f"Ignoring unreadable spool offset {raw[:40]!r}, replaying from the start")
+            return 0
+
+    def _set_offset(self, offset):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(tmp, self.offset_path)
+
+    def pending(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def replay(self, send, batch_size):
+        """Send spooled readings oldest first; stops at the first failure."""
+        offset = self._offset()
+        while True:
+            # Only the next batch is read, from where the last one ended; the
+            # reader thread may append meanwhile
+            with self.lock:
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    lines = []
+                    while len(lines) < batch_size:
+                        line = f.readline()
+                        if not line:
+                            break
+                        lines.append(line)
+                    next_offset = f.tell()
+                if not lines:
+                    os.remove(self.path)
+                    if os.path.exists(self.offset_path):
+                        os.remove(self.offset_path)
+                    return True
+
+            chunk = [json.loads(line) for line in lines if line.strip()]
+            if chunk and not send(chunk):
+                return False
+            offset = next_offset
+            self._set_offset(offset)
+
+
+class Uploader:
+    """
+    Buffers readings in a bounded in-memory queue and posts them to the
+    batch ingest endpoint over one keep-alive session, flushing when
+    BATCH_SIZE readings are waiting or FLUSH_INTERVAL seconds have passed.
+    Failed batches, and readings that overflow the queue, go to the spool
+    and are replayed in order once the server answers again. Batches the
+    server rejects are appended to the `rejected` spool, which is never
+    replayed.
+    """
+
+    def __init__(self, url, spool, rejected):
+        self.url = url
+        self.spool = spool
+        self.rejected = rejected
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+        self.sent = 0
+        self.spooled = 0
+        self.rejected_count = 0
+
+    def start(self):
+        self.thread.start()
+
+    def add(self, reading):
+        with self.lock:
+            self.queue.append(reading)
+            overflow = len(self.queue) > QUEUE_LIMIT
+            full = len(self.queue) >= BATCH_SIZE
+            if overflow:
+                spill = [self.queue.popleft() for _ in range(BATCH_SIZE)]
+        if overflow:
+            self._to_spool(spill)
+        if full:
+            self.wakeup.set()
+
+    def _to_spool(self, readings):
+        self.spool.append(readings)
+        self.spooled += len(readings)
+
+    def _send(self, readings):
+        try:
+            response = self.session.post(self.url, data=json.dumps({"readings": readings}),
+                                         timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            print(f"Upload failed: {e}")
+            return False
+        if response.status_code >= 500 or response.status_code in RETRY_STATUSES:
+            print(f"Upload failed with status {response.status_code}")
+            return False
+        # Other 4xx means the server rejected the data itself; retrying will
+        # not help, so keep the batch aside instead of blocking the spool
+        if response.status_code >= 400:
+            print(f"Upload rejected with status {response.status_code}: {response.text[:200]}; "
+                  f"{len(readings)} readings kept in {self.rejected.path}")
+            self.rejected.append(readings)
+            self.rejected_count += len(readings)
+            return True
+        self.sent += len(readings)
+        return True
+
+    def flush(self):
+        with self.lock:
+            batch = list(self.queue)
+            self.queue.clear()
+
+        # Older spooled readings must reach the server before newer ones
+        if self.spool.pending() and not self.spool.replay(self._send, BATCH_SIZE):
+            if batch:
+                self._to_spool(batch)
+            return False
+
+        for i in range(0, len(batch), BATCH_SIZE):
+            chunk = batch[i:i + BATCH_SIZE]
+            if not self._send(chunk):
+                self._to_spool(batch[i:])
+                return False
+        return True
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join(timeout=REQUEST_TIMEOUT * 2)
+        if not self.flush():
+            print("Server unreachable, remaining readings kept in the spool")
+        self.session.close()
+
 
 if __name__ == "__main__":
-    node_id = "A01"
-    port = '/dev/ttyACM0'
-    baudrate = 9600
     timeout = 1
-    ser = serial.Serial(port, baudrate, timeout=timeout)
+    ser = serial.Serial(SERIAL_PORT, BAUDRATE, timeout=timeout)
+    uploader = Uploader(f"{SERVER_URL}/api/postdata/batch", Spool(SPOOL_PATH), Spool(REJECTED_PATH))
+    uploader.start()
 
     try:
         while True:
-            line = ser.readline().decode('utf-8').strip()
+            line = ser.readline().decode('utf-8', errors='replace').strip()
 
             if line:
                 sensor, measurement, value, ts = extract_numbers(line)
                 if sensor is None:
                     continue
-                url = f"http://10.1.40.45/api/postdata/{node_id}/{sensor}/{measurement}"
-                data = {
+                # Stamp the reading here so buffered/spooled data keeps its real time
+                uploader.add({
+                    "node_id": NODE_ID,
+                    "sensor_id": sensor,
+                    "measurement_id": measurement,
                     "value": value,
-                    "timestamp": None
-                }
-                send_curl(url, data)
-                print(f"Sent data to {url}: {data}")
-                
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                })
 
     except KeyboardInterrupt:
         print("Stopped by user.")
     finally:
-        ser.close()
\ No newline at end of file
+        uploader.stop()
+        print(f"Sent {uploader.sent} readings, spooled {uploader.spooled}, rejected {uploader.rejected_count}")
+        ser.close()
@@ -1,16 +1,40 @@
 import os
+import sys
 import requests
 from dotenv import load_dotenv
 import json
+import hashlib
+import yaml
 from datetime import datetime
 import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from logging_config import setup_logging
 import logging
+import mysql.connector
+
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webapp")
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from aqi_snapshot import ensure_latest_snapshot, latest_scrape_id, sync_latest_snapshot
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+# The settings below are read at import time, so the deployed .env has to
+# be loaded first; variables already set in the environment still win
+load_dotenv("/home/studentiotlab/aqi-dashboard/.env")
+
 def format_datetime(dt_str):
     try:
         parsed = datetime.strptime(dt_str, "%d %b %Y, %I:%M%p")
@@ -18,7 +42,7 @@ def format_datetime(dt_str):
     except Exception:
         return None
 
-def login():
+def login(session=None, timeout=None):
     email = os.getenv("EMAIL")
     password = os.getenv("PASSWORD")
 
@@ -34,7 +58,7 @@ def login():
         "password": password
     }
 
-    response = requests.post(url, headers=headers, data=data)
+    response = (session or requests).post(url, headers=headers, data=data, timeout=timeout)
     response.raise_for_status()
     response = response.json()
 
@@ -44,13 +68,13 @@ def login():
 
     return token
 
-def get_sensors(token):
+def get_sensors(token, session=None, timeout=None):
     url = "https://airquality.aqi.in/api/v1/GetAllUserDevices"
     headers = {
         "Authorization": f"Bearer {token}"
     }
 
-    response = requests.get(url, headers=headers)
+    response = (session or requests).get(url, headers=headers, timeout=timeout)
     response.raise_for_status()
 
     return response.json()
@@ -60,7 +84,7 @@ def options_request(url):
     response.raise_for_status()
     return response.headers
 
-def request_mass(token):
+def request_mass(token, session=None, timeout=None):
     url = "https://airquality.aqi.in/api/v1/getNearestMapLocation"
 
     headers = {
@@ -72,7 +96,7 @@ def request_mass(token):
         "Type": "1"
     }
 
-    response = requests.get(url, headers=headers)
+    response = (session or requests).get(url, headers=headers, timeout=timeout)
     response.raise_for_status()
     return response.json()
 
@@ -94,150 +118,412 @@ def get_row(location):
     return row
 
 
-def data_to_sql(mass_data, logger):
-    rows = []
-    for location in mass_data["Locations"]:
-        row = get_row(location)
-        rows.append(row)
+FINGERPRINT_PATH = os.getenv("SCRAPE_FINGERPRINTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fingerprints.json"))
+CHANGE_DETECTION = os.getenv("SCRAPE_CHANGE_DETECTION", "1") == "1"
 
-    config = {
-        'host': os.getenv("DB_HOST", "localhost"),
-        'user': os.getenv("DB_USER"),
-        'password': os.getenv("DB_PASSWORD", ""),
-        'database': os.getenv("DB_NAME", "SMAQI")
-    }
+
+class FingerprintCache:
+    """
+    Compact per-location digest of the last stored row, kept in memory and
+    persisted to a JSON file so one-shot runs also benefit. A location
+    whose digest matches is unchanged since the previous cycle and is not
+    written again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.digests = None
+
+    @staticmethod
+    def digest(params):
+        return hashlib.blake2b(repr(params).encode("utf-8"), digest_size=8).hexdigest()
+
+    def load(self):
+        if self.digests is not None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.digests = json.load(f)
+        except (OSError, ValueError):
+            self.digests = {}
+
+    def changed(self, params_list):
+        """Split params into the changed rows and their {locationId: digest}."""
+        self.load()
+        changed, digests = [], {}
+        for params in params_list:
+            location_id = str(params[2])
+            digest = self.digest(params)
+            if self.digests.get(location_id) != digest:
+                changed.append(params)
+                digests[location_id] = digest
+        return changed, digests
+
+    def update(self, digests):
+        self.digests.update(digests)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.digests, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+
+fingerprints = FingerprintCache(FINGERPRINT_PATH)
+
+
+def data_to_sql(mass_data, logger, chunk_size=None):
+    """
+    Store the scraped locations and sync the snapshot in one transaction.
+    Returns (inserted, skipped); database errors are raised, so the caller
+    (the daemon loop) counts the cycle as failed.
+    """
+    params = [scraped_row_params(get_row(location)) for location in mass_data["Locations"]]
+    total = len(params)
+    digests = {}
+    if CHANGE_DETECTION:
+        params, digests = fingerprints.changed(params)
+        ratio = len(params) / total if total else 0.0
+        logger.info(f"AqiInScrape: {len(params)}/{total} locations changed ({ratio:.1%})")
+        if not params:
+            return 0, 0
+
+    conn = None
+    cursor = None
 
     try:
-        import mysql.connector
-        conn = mysql.connector.connect(**config)
+        conn = get_connection()
         cursor = conn.cursor()
+        ensure_latest_snapshot(conn, cursor)
 
-        for row in rows:
-            insert_scraped_row(row, cursor)
+        since_scrape_id = latest_scrape_id(cursor)
+        inserted, skipped = insert_scraped_params(params, cursor, chunk_size, logger)
+        sync_latest_snapshot(cursor, since_scrape_id)
 
         conn.commit()
+        # Only remember what is actually stored, so a failed write is retried
+        if digests:
+            fingerprints.update(digests)
+        logger.info(f"AqiInScrape: {inserted} rows inserted, {skipped} duplicates skipped")
+        return inserted, skipped
 
     except mysql.connector.Error as e:
-        logger.error(f"Failed to connect to the database: {str(e)}")
-        return
-    
+        logger.error(f"Failed to store scraped locations: {str(e)}")
+        if conn:
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+        raise
+
     finally:
-        cursor.close()
-        conn.close()
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
 
-    
 
-def insert_scraped_row(row, cursor):
-    query = """
-        INSERT INTO AqiInScrape (
-            lat, lon, locationId, city, state, country, last_updated,
-            AQI_IN, AQI_US, CO_PPB, H_PERCENT, NO2_PPB, O3_PPB,
-            PM10_UGM3, PM2_5_UGM3, SO2_PPB, T_C, PM1_UGM3, TVOC_PPM, Noise_DB
-        )
-        VALUES (
-            %(lat)s, %(lon)s, %(locationId)s, %(city)s, %(state)s, %(country)s, %(last_updated)s,
-            %(AQI_IN)s, %(AQI_US)s, %(CO_PPB)s, %(H_PERCENT)s, %(NO2_PPB)s, %(O3_PPB)s,
-            %(PM10_UGM3)s, %(PM2_5_UGM3)s, %(SO2_PPB)s, %(T_C)s, %(PM1_UGM3)s, %(TVOC_PPM)s, %(Noise_DB)s
-        );
+
+# AqiInScrape column -> key in the row built by get_row()
+SCRAPE_COLUMNS = [
+    ("lat", "lat"), ("lon", "lon"), ("locationId", "locationId"),
+    ("city", "city"), ("state", "state"), ("country", "country"),
+    ("last_updated", "last_updated"),
+    ("AQI_IN", "aqi-in"), ("AQI_US", "aqi"), ("CO_PPB", "co"), ("H_PERCENT", "h"),
+    ("NO2_PPB", "no2"), ("O3_PPB", "o3"), ("PM10_UGM3", "pm10"), ("PM2_5_UGM3", "pm25"),
+    ("SO2_PPB", "so2"), ("T_C", "t"), ("PM1_UGM3", "pm1"), ("TVOC_PPM", "tvoc"),
+    ("Noise_DB", "noise"),
+]
+
+# A (locationId, last_updated) pair that is already stored is the same
+# reading, so duplicates are skipped rather than inserted again
+INSERT_SCRAPED_ROWS = f"""
+    INSERT INTO AqiInScrape ({", ".join(col for col, _ in SCRAPE_COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(SCRAPE_COLUMNS))})
+    ON DUPLICATE KEY UPDATE scrape_id = scrape_id
+"""
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("AQI_INSERT_CHUNK", "1000"))
+
+
+def scraped_row_params(row):
+    params = [row.get(key) for _, key in SCRAPE_COLUMNS]
+    params[6] = format_datetime(row.get('last_updated'))
+    return tuple(params)
+
+
+def insert_scraped_rows(rows, cursor, chunk_size=None, logger=None):
     """
-    cursor.execute(query, {
-        'lat': row.get('lat'),
-        'lon': row.get('lon'),
-        'locationId': row.get('locationId'),
-        'city': row.get('city'),
-        'state': row.get('state'),
-        'country': row.get('country'),
-        'last_updated': format_datetime(row.get('last_updated')),
-        'AQI_IN': row.get('aqi-in', None),
-        'AQI_US': row.get('aqi', None),
-        'CO_PPB': row.get('co', None),
-        'H_PERCENT': row.get('h', None),
-        'NO2_PPB': row.get('no2', None),
-        'O3_PPB': row.get('o3', None),
-        'PM10_UGM3': row.get('pm10', None),
-        'PM2_5_UGM3': row.get('pm25', None),
-        'SO2_PPB': row.get('so2', None),
-        'T_C': row.get('t', None),
-        'PM1_UGM3': row.get('pm1', None),
-        'TVOC_PPM': row.get('tvoc', None),
-        'Noise_DB': row.get('noise', None)
-    })
-
-
-def insert_sensor_data_api(node_id, sensor_id, measurement_id, data, logger):
-    request_url = f"http://10.1.40.45/api/postdata/{node_id}/{sensor_id}/{measurement_id}"
-    
-    response = requests.post(request_url, json=data)
-    logger.info(f"{node_id}_{sensor_id}_{measurement_id} response status: {response.status_code}, body: {response.text}")
-
-def sensor_data_to_sql(sensors_data, logger):
-    sensor_map = {
-        "84530304be06c": "1",
-        "48F6EE5481E0": "2",
-        "48F6EE546F34": "3"
-    }
+    Write scraped rows with one multi-row INSERT per chunk. Relies on the
+    uq_location_updated key of AqiInScrape to skip rows that are already
+    stored. Returns (inserted, skipped).
+    """
+    params = [scraped_row_params(row) for row in rows]
+    return insert_scraped_params(params, cursor, chunk_size, logger)
 
-    sensor_id_map = {
-        1: (1,1),
-        2: (2,1),
-        3: (3,1),
-        4: (3,2),
-        5: (3,3),
-        11: (4,1),
-        12: (5,1),
-        13: (6,1),
-        18: (7,1),
-        20: (8,1),
-        21: (9,1),
-        22: (10,1),
-        23: (11,1),
-        25: (12,1),
-        26: (13,1),
-        27: (14,1),
-        71: (3,4),
-        72: (3,5),
-        73: (3,6),
-        74: (3,7),
-        75: (3,8),
-        76: (3,9),
-        78: (15,1)
-    }
 
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def insert_scraped_params(params, cursor, chunk_size=None, logger=None):
+    """insert_scraped_rows() for rows already converted by scraped_row_params()."""
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    inserted = 0
+    for i in range(0, len(params), chunk_size):
+        chunk = params[i:i + chunk_size]
+        cursor.executemany(INSERT_SCRAPED_ROWS, chunk)
+        # No-op updates report 0 affected rows, so this counts new rows only
+        chunk_inserted = max(cursor.rowcount, 0)
+        inserted += chunk_inserted
+        if logger:
+            logger.debug(f"Chunk {i // chunk_size}: {chunk_inserted} inserted, "
+                         f"{len(chunk) - chunk_inserted} skipped")
+    return inserted, len(params) - inserted
+
+
+CONFIG_DIR = os.getenv("NODE_CONFIG_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs"))
+WEBAPP_URL = os.getenv("WEBAPP_URL", "http://10.1.40.45")
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "30"))
 
+
+def load_device_map(config_dir=CONFIG_DIR):
+    """
+    Build {serialNo: (node_id, {aqi.in sensorid: (sensor_id, measurement_id)})}
+    from the node YAMLs. Only nodes with an `aqi_in_serial` and measurements
+    with an `aqi_in_sensor_id` take part.
+    """
+    device_map = {}
+    for name in sorted(os.listdir(config_dir)):
+        if not name.endswith((".yaml", ".yml")):
+            continue
+        with open(os.path.join(config_dir, name), 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+
+        node = config.get('Node') or {}
+        serial = node.get('aqi_in_serial')
+        if not serial:
+            continue
+
+        sensor_ids = {}
+        for sensor in (config.get('Sensors') or {}).values():
+            measurements = sensor['measurements']
+            if isinstance(measurements, dict):
+                measurements = [measurements]
+            for measurement in measurements:
+                if 'aqi_in_sensor_id' in measurement:
+                    sensor_ids[int(measurement['aqi_in_sensor_id'])] = (sensor['id'], measurement['measurement_id'])
+
+        device_map[str(serial)] = (str(node['id']), sensor_ids)
+    return device_map
+
+
+def sensor_readings(sensors_data, device_map, timestamp):
+    """Map the realtime values of every known device to batch ingest readings."""
+    readings = []
     for device in sensors_data['data']:
-        node_id = sensor_map.get(device['serialNo'])
+        if device['serialNo'] not in device_map:
+            continue
+        node_id, sensor_ids = device_map[device['serialNo']]
 
         for sensor in device['realtime']:
-            if sensor['sensorid'] not in sensor_id_map:
+            if sensor['sensorid'] not in sensor_ids:
                 continue
-            sensor_id, measurement_id = sensor_id_map[sensor['sensorid']]
-
-            data = {
+            sensor_id, measurement_id = sensor_ids[sensor['sensorid']]
+            readings.append({
+                'node_id': node_id,
+                'sensor_id': sensor_id,
+                'measurement_id': measurement_id,
                 'value': sensor['sensorvalue'],
                 'timestamp': timestamp,
-            }
+            })
+    return readings
 
-            insert_sensor_data_api(node_id, sensor_id, measurement_id, data, logger)
 
+def sensor_data_to_sql(sensors_data, logger, session=None, device_map=None):
+    """Send every device reading of this cycle in one batch ingest request."""
+    if device_map is None:
+        device_map = load_device_map()
 
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    readings = sensor_readings(sensors_data, device_map, timestamp)
+    if not readings:
+        logger.info("No device readings to upload")
+        return
 
-    
+    poster = session or requests
+    response = poster.post(f"{WEBAPP_URL}/api/postdata/batch", json={'readings': readings}, timeout=UPLOAD_TIMEOUT)
+    try:
+        result = response.json()
+    except ValueError:
+        result = {}
+    if 'results' not in result:
+        logger.error(f"Batch upload failed with status {response.status_code}: {response.text[:200]}")
+        return
 
-def main(logger):
-    load_dotenv("/home/studentiotlab/aqi-dashboard/.env")
+    for item in result['results']:
+        if item['status'] != "ok":
+            reading = readings[item['index']]
+            logger.warning(f"{reading['node_id']}_{reading['sensor_id']}_{reading['measurement_id']} "
+                           f"rejected: {item.get('error')}")
+    logger.info(f"Device readings: {result.get('inserted', 0)} inserted, "
+                f"{result.get('rejected', 0)} rejected (status {response.status_code})")
+
+
+# Daemon mode settings
+SCRAPE_INTERVAL = float(os.getenv("SCRAPE_INTERVAL", "300"))
+HTTP_TIMEOUT = float(os.getenv("SCRAPE_HTTP_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("SCRAPE_HTTP_RETRIES", "4"))
+TOKEN_TTL = float(os.getenv("AQI_IN_TOKEN_TTL", "3000"))
+ALERT_AFTER_FAILURES = int(os.getenv("SCRAPE_ALERT_AFTER", "3"))
+LOCK_PATH = os.getenv("SCRAPE_LOCK", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".scrape.lock"))
 
-    token = login()
-    logger.info("Logged in successfully")
-    sensors = get_sensors(token)
-    logger.debug(f"Fetched {len(sensors['data'])} sensors")
-    mass = request_mass(token)
-    logger.info(f"Fetched mass data with {len(mass['Locations'])} locations")
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AqiInClient:
+    """
+    Keeps one keep-alive session and a cached bearer token across cycles.
+    The token is refreshed after TOKEN_TTL seconds, or straight away when
+    the API answers 401. Network errors and 429/5xx are retried with
+    jittered backoff.
+    """
+
+    def __init__(self, logger, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, token_ttl=TOKEN_TTL):
+        self.logger = logger
+        self.timeout = timeout
+        self.retries = retries
+        self.token_ttl = token_ttl
+        self.session = requests.Session()
+        self.token = None
+        self.token_time = 0.0
+        self.token_lock = threading.Lock()
+
+    def get_token(self, force=False):
+        with self.token_lock:
+            if force or self.token is None or time.monotonic() - self.token_time > self.token_ttl:
+                self.token = self._retry(lambda: login(self.session, self.timeout), "login")
+                self.token_time = time.monotonic()
+                self.logger.info("Logged in successfully")
+            return self.token
+
+    def _retry(self, call, name):
+        for attempt in range(self.retries + 1):
+            try:
+                return call()
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRYABLE_STATUS or attempt == self.retries:
+                    raise
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                error = e
+            delay = backoff_delay(attempt)
+            self.logger.warning(f"{name} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def fetch(self, func, name):
+        """Call func(token, session, timeout), logging in again once on 401."""
+        token = self.get_token()
+        try:
+            return self._retry(lambda: func(token, self.session, self.timeout), name)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 401:
+                raise
+            token = self.get_token(force=True)
+            return self._retry(lambda: func(token, self.session, self.timeout), name)
+
+    def close(self):
+        self.session.close()
+
+
+def run_cycle(client, logger, executor, device_map=None):
+    """One scrape: fetch devices and map data concurrently, then write both."""
+    timings = {}
+    start = time.monotonic()
+
+    client.get_token()
+    timings['login'] = time.monotonic() - start
+
+    phase = time.monotonic()
+    sensors_future = executor.submit(client.fetch, get_sensors, "GetAllUserDevices")
+    mass_future = executor.submit(client.fetch, request_mass, "getNearestMapLocation")
+    sensors = sensors_future.result()
+    mass = mass_future.result()
+    timings['fetch'] = time.monotonic() - phase
+    logger.info(f"Fetched {len(sensors['data'])} devices and {len(mass['Locations'])} locations")
+
+    phase = time.monotonic()
     data_to_sql(mass, logger)
-    logger.info("Data inserted into database successfully")
+    timings['write_mass'] = time.monotonic() - phase
+
+    phase = time.monotonic()
+    sensor_data_to_sql(sensors, logger, client.session, device_map)
+    timings['write_devices'] = time.monotonic() - phase
+
+    timings['total'] = time.monotonic() - start
+    logger.info("Cycle timings: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
 
-    sensor_data_to_sql(sensors, logger)
+
+def acquire_lock(path):
+    """
+    Exclusive lock so a cron run and a daemon (or two daemons) never
+    scrape at the same time. Returns the open lock file, or None if taken.
+    """
+    lock_file = open(path, 'w')
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def run_daemon(logger, interval=SCRAPE_INTERVAL):
+    """
+    Scrape every `interval` seconds on a fixed schedule. A cycle that runs
+    past its slot skips the missed ticks instead of starting overlapping
+    runs.
+    """
+    client = AqiInClient(logger)
+    device_map = load_device_map()
+    failures = 0
+    next_run = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="scrape-fetch") as executor:
+        try:
+            while True:
+                try:
+                    run_cycle(client, logger, executor, device_map)
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    logger.error(f"Scrape cycle failed ({failures} in a row): {e}", exc_info=True)
+                    if failures == ALERT_AFTER_FAILURES:
+                        alert_mail(f"Scraper failed {failures} cycles in a row, last error: {e}")
+
+                next_run += interval
+                now = time.monotonic()
+                if next_run < now:
+                    skipped = int((now - next_run) // interval) + 1
+                    logger.warning(f"Cycle overran its slot, skipping {skipped} tick(s)")
+                    next_run += skipped * interval
+                time.sleep(next_run - now)
+        finally:
+            client.close()
+
+
+def main(logger):
+    client = AqiInClient(logger)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            run_cycle(client, logger, executor)
+    finally:
+        client.close()
 
 def alert_mail(body):
     msg = MIMEMultipart()
@@ -258,11 +544,24 @@ def alert_mail(body):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape aqi.in map and device data")
+    parser.add_argument("--daemon", action="store_true", help="keep running on a fixed cadence")
+    parser.add_argument("--interval", type=float, default=SCRAPE_INTERVAL, help="seconds between daemon cycles")
+    args = parser.parse_args()
+
     setup_logging()
     logger = logging.getLogger(__name__)
 
+    lock = acquire_lock(LOCK_PATH)
+    if lock is None:
+        logger.warning("Another scrape is still running, exiting")
+        raise SystemExit(0)
+
     try:
-        main(logger)
+        if args.daemon:
+            run_daemon(logger, args.interval)
+        else:
+            main(logger)
     except Exception as e:
         logger.error(f"Error occurred: {e}", exc_info=True)
         alert_mail(str(e))
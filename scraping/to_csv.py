@@ -1,10 +1,24 @@
 from dotenv import load_dotenv
 import os
+import csv
+import gzip
+import argparse
 import mysql.connector
-import pandas as pd
+from decimal import Decimal
+from mysql.connector import FieldType
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 load_dotenv("/home/studentiotlab/aqi-dashboard/.env")
 
+TABLE = "AqiInScrape"
+DEFAULT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+FORMATS = ("csv", "csv.gz", "parquet")
+
 def login():
     db = os.getenv("DB_NAME")
     user = os.getenv("DB_USER")
@@ -20,15 +34,191 @@ def login():
 
     return conn
 
-def export_to_csv(conn):
-    query = "SELECT * FROM AqiInScrape"
-    df = pd.read_sql(query, conn)
-    df.to_csv("aqi_in_data.csv", index=False)
+
+def table_columns(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {TABLE} LIMIT 0")
+    cursor.fetchall()
+    columns = list(cursor.column_names)
+    cursor.close()
+    return columns
+
+
+def build_query(columns, since_id=None, start=None, end=None, bbox=None):
+    """
+    SELECT for the requested columns plus scrape_id (needed for the
+    watermark), ordered by scrape_id so an export can be resumed from it.
+    """
+    select = columns if "scrape_id" in columns else columns + ["scrape_id"]
+    where, params = [], []
+    if since_id is not None:
+        where.append("scrape_id > %s")
+        params.append(since_id)
+    if start is not None:
+        where.append("last_updated >= %s")
+        params.append(start)
+    if end is not None:
+        where.append("last_updated < %s")
+        params.append(end)
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        where.append("lat BETWEEN %s AND %s AND lon BETWEEN %s AND %s")
+        params.extend([min_lat, max_lat, min_lon, max_lon])
+
+    query = f"SELECT {', '.join(f'`{c}`' for c in select)} FROM {TABLE}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query + " ORDER BY scrape_id", params
+
+
+def stream_rows(conn, query, params, chunk_size):
+    """
+    Yield lists of up to chunk_size rows from an unbuffered cursor, so rows
+    are pulled from the server as they are written out instead of being
+    loaded all at once.
+    """
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        yield cursor.description
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+class CsvSink:
+    def __init__(self, path, columns, compress):
+        self.file = gzip.open(path, "wt", newline="", encoding="utf-8") if compress \
+            else open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+def arrow_type(type_code):
+    if type_code in (FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG, FieldType.LONGLONG):
+        return pa.int64()
+    if type_code in (FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL):
+        return pa.float64()
+    if type_code in (FieldType.DATETIME, FieldType.TIMESTAMP):
+        return pa.timestamp("us")
+    if type_code == FieldType.DATE:
+        return pa.date32()
+    return pa.string()
+
+
+class ParquetSink:
+    """Writes each chunk as one row group against a schema fixed up front."""
+
+    def __init__(self, path, columns, description):
+        types = {d[0]: arrow_type(d[1]) for d in description}
+        self.schema = pa.schema([(c, types[c]) for c in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        arrays = []
+        for i, field in enumerate(self.schema):
+            values = [row[i] for row in rows]
+            if pa.types.is_floating(field.type):
+                values = [float(v) if isinstance(v, Decimal) else v for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def read_watermark(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def write_watermark(path, scrape_id):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(scrape_id))
+    os.replace(tmp, path)
+
+
+def export_to_csv(conn, output="aqi_in_data.csv", fmt="csv", columns=None, since_id=None,
+                  start=None, end=None, bbox=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream AqiInScrape to `output` in chunks of chunk_size rows. Memory use
+    depends on chunk_size, not on the size of the table. Returns
+    (rows written, highest scrape_id written or None).
+    """
+    available = table_columns(conn)
+    columns = columns or available
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("Parquet export needs pyarrow installed")
+
+    query, params = build_query(columns, since_id, start, end, bbox)
+    chunks = stream_rows(conn, query, params, chunk_size)
+    description = next(chunks)
+    id_index = [d[0] for d in description].index("scrape_id")
+    keep = len(columns)
+
+    sink = ParquetSink(output, columns, description) if fmt == "parquet" \
+        else CsvSink(output, columns, compress=fmt == "csv.gz")
+    written, max_id = 0, None
+    try:
+        for rows in chunks:
+            max_id = rows[-1][id_index]
+            sink.write(rows if len(rows[0]) == keep else [row[:keep] for row in rows])
+            written += len(rows)
+    finally:
+        sink.close()
+    return written, max_id
+
+
+def parse_bbox(value):
+    parts = [float(p) for p in value.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("bbox must be min_lat,min_lon,max_lat,max_lon")
+    return parts
+
 
 def main():
+    parser = argparse.ArgumentParser(description=f"Export {TABLE} without loading it into memory")
+    parser.add_argument("--output", default=None, help="defaults to aqi_in_data.<format>")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--columns", type=lambda v: [c.strip() for c in v.split(",") if c.strip()], default=None)
+    parser.add_argument("--start", help="last_updated >= this (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--end", help="last_updated < this")
+    parser.add_argument("--bbox", type=parse_bbox, help="min_lat,min_lon,max_lat,max_lon")
+    parser.add_argument("--watermark", help="file holding the last exported scrape_id; only newer rows are exported")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    output = args.output or f"aqi_in_data.{args.format}"
+    since_id = read_watermark(args.watermark) if args.watermark else None
+
     conn = login()
-    export_to_csv(conn)
-    conn.close()
+    try:
+        written, max_id = export_to_csv(conn, output, args.format, args.columns, since_id,
+                                        args.start, args.end, args.bbox, args.chunk_size)
+    finally:
+        conn.close()
+
+    print(f"Exported {written} rows to {output}")
+    # Advance the watermark only after the file is complete
+    if args.watermark and max_id is not None:
+        write_watermark(args.watermark, max_id)
 
 if __name__ == "__main__":
     main()
@@ -1,116 +1,204 @@
 import os
-from datetime import datetime
+import sys
+import time
+import json
+import argparse
 import mysql.connector
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from scraping.scrape_aqi_in import DEFAULT_CHUNK_SIZE, get_row, insert_scraped_params, scraped_row_params
 from logging_config import setup_logging
 import logging
-import json
 
-def format_datetime(dt_str):
-    try:
-        parsed = datetime.strptime(dt_str, "%d %b %Y, %I:%M%p")
-        return parsed.strftime("%Y-%m-%d %H:%M:%S")
-    except Exception:
-        return None
-
-def get_row(location):
-    row = {}
-
-    row['lat'] = location['lat']
-    row['lon'] = location['lon']
-    row['locationId'] = location['locationId']
-    row['city'] = location['city']
-    row['state'] = location['state']
-    row['country'] = location['country']
-    row['last_updated'] = location['last_updated']
-
-    for sensor in location['airquality']:
-        key = f"{sensor['senDevId'].lower()}"
-        row[key] = sensor['sensorData']
-
-    return row
-
-
-def data_to_sql(mass_data, logger, i):
-    rows = []
-    for location in mass_data["Locations"]:
-        row = get_row(location)
-        rows.append(row)
-
-    config = {
-        'host': os.getenv("DB_HOST", "localhost"),
-        'user': os.getenv("DB_USER"),
-        'password': os.getenv("DB_PASSWORD", ""),
-        'database': os.getenv("DB_NAME", "SMAQI")
-    }
+WEBAPP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webapp")
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
 
-    try:
-        import mysql.connector
-        conn = mysql.connector.connect(**config)
-        cursor = conn.cursor()
+from db import get_connection
+from aqi_snapshot import rebuild_latest_snapshot
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-        for row in rows:
-            insert_scraped_row(row, cursor)
 
-        conn.commit()
+def iter_locations(file_path):
+    """Stream Locations out of a dump; falls back to json.load without ijson."""
+    with open(file_path, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, "Locations.item", use_float=True)
+        else:
+            yield from json.load(f)["Locations"]
 
-    except mysql.connector.Error as e:
-        logger.error(f"Failed to connect to the database: {str(e)}")
-        return
-    
+
+def load_file(file_path, chunk_size):
+    """
+    Runs in a worker process: stream a dump into AqiInScrape, committing
+    every chunk_size rows on the worker's long-lived pooled connection, so
+    neither the worker nor the parent ever holds a whole file in memory.
+    Returns (file_path, rows, inserted, skipped).
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    conn = get_connection()
+    cursor = conn.cursor()
+    rows = inserted = 0
+    try:
+        chunk = []
+        for location in iter_locations(file_path):
+            chunk.append(scraped_row_params(get_row(location)))
+            if len(chunk) >= chunk_size:
+                inserted += insert_scraped_params(chunk, cursor, chunk_size)[0]
+                conn.commit()
+                rows += len(chunk)
+                chunk = []
+        if chunk:
+            inserted += insert_scraped_params(chunk, cursor, chunk_size)[0]
+            conn.commit()
+            rows += len(chunk)
+        return file_path, rows, inserted, rows - inserted
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
     finally:
-        logger.info(f"Batch insert completed {i}")
         cursor.close()
         conn.close()
 
 
-def insert_scraped_row(row, cursor):
-    query = """
-        INSERT INTO AqiInScrape (
-            lat, lon, locationId, city, state, country, last_updated,
-            AQI_IN, AQI_US, CO_PPB, H_PERCENT, NO2_PPB, O3_PPB,
-            PM10_UGM3, PM2_5_UGM3, SO2_PPB, T_C, PM1_UGM3, TVOC_PPM, Noise_DB
-        )
-        VALUES (
-            %(lat)s, %(lon)s, %(locationId)s, %(city)s, %(state)s, %(country)s, %(last_updated)s,
-            %(AQI_IN)s, %(AQI_US)s, %(CO_PPB)s, %(H_PERCENT)s, %(NO2_PPB)s, %(O3_PPB)s,
-            %(PM10_UGM3)s, %(PM2_5_UGM3)s, %(SO2_PPB)s, %(T_C)s, %(PM1_UGM3)s, %(TVOC_PPM)s, %(Noise_DB)s
-        );
+def manifest_key(file_path):
+    stat = os.stat(file_path)
+    return f"{os.path.basename(file_path)}\t{stat.st_size}"
+
+
+# Manifest lines recording whether AqiInScrapeLatest still has to be
+# rebuilt, so a run interrupted after loading files repeats the rebuild
+SNAPSHOT_STALE = "#snapshot-stale"
+SNAPSHOT_REBUILT = "#snapshot-rebuilt"
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def snapshot_pending(path):
+    """True when the last snapshot marker in the manifest says stale."""
+    if not os.path.exists(path):
+        return False
+    pending = False
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line in (SNAPSHOT_STALE, SNAPSHOT_REBUILT):
+                pending = line == SNAPSHOT_STALE
+    return pending
+
+
+def backfill(files, manifest_path, workers, chunk_size, logger):
+    """
+    Load dumps in a pool of `workers` processes, each parsing and writing
+    its files through one pooled connection. Completed files are appended
+    to the manifest so a rerun skips them; since inserts are idempotent, a
+    file that failed halfway or was not yet recorded is simply re-applied,
+    its committed rows counting as duplicates. The snapshot is marked
+    stale in the manifest before anything is written.
     """
-    cursor.execute(query, {
-        'lat': row.get('lat'),
-        'lon': row.get('lon'),
-        'locationId': row.get('locationId'),
-        'city': row.get('city'),
-        'state': row.get('state'),
-        'country': row.get('country'),
-        'last_updated': format_datetime(row.get('last_updated')),
-        'AQI_IN': row.get('aqi-in', None),
-        'AQI_US': row.get('aqi', None),
-        'CO_PPB': row.get('co', None),
-        'H_PERCENT': row.get('h', None),
-        'NO2_PPB': row.get('no2', None),
-        'O3_PPB': row.get('o3', None),
-        'PM10_UGM3': row.get('pm10', None),
-        'PM2_5_UGM3': row.get('pm25', None),
-        'SO2_PPB': row.get('so2', None),
-        'T_C': row.get('t', None),
-        'PM1_UGM3': row.get('pm1', None),
-        'TVOC_PPM': row.get('tvoc', None),
-        'Noise_DB': row.get('noise', None)
-    })
+    done = load_manifest(manifest_path)
+    todo = [f for f in files if manifest_key(f) not in done]
+    logger.info(f"{len(files) - len(todo)} files already in manifest, {len(todo)} to load")
+
+    stats = {"files": 0, "failed": 0, "rows": 0, "inserted": 0}
+    start = last_report = time.monotonic()
+    pending_files = iter(todo)
+    loading = set()
+
+    with ProcessPoolExecutor(workers) as loaders, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest:
+        if todo:
+            manifest.write(SNAPSHOT_STALE + "\n")
+            manifest.flush()
+
+        def fill():
+            while len(loading) < workers * 2:
+                file_path = next(pending_files, None)
+                if file_path is None:
+                    return
+                loading.add(loaders.submit(load_file, file_path, chunk_size))
+
+        fill()
+        while loading:
+            finished, loading = wait(loading, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                try:
+                    file_path, rows, inserted, skipped = fut.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.error(f"Failed to load dump: {e}")
+                    continue
+                stats["files"] += 1
+                stats["rows"] += rows
+                stats["inserted"] += inserted
+                manifest.write(manifest_key(file_path) + "\n")
+                manifest.flush()
+            fill()
+
+            now = time.monotonic()
+            if now - last_report >= 10:
+                last_report = now
+                elapsed = now - start
+                logger.info(f"{stats['files']}/{len(todo)} files, "
+                            f"{stats['files'] / elapsed:.1f} files/s, {stats['rows'] / elapsed:.0f} rows/s")
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    logger.info(f"Loaded {stats['files']} files ({stats['failed']} failed), "
+                f"{stats['rows']} rows, {stats['inserted']} new, in {elapsed:.1f}s: "
+                f"{stats['files'] / elapsed:.1f} files/s, {stats['rows'] / elapsed:.0f} rows/s")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill AqiInScrape from saved getNearestMapLocation dumps")
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "mass"))
+    parser.add_argument("--manifest", default=None, help="defaults to <data-dir>/.backfill_manifest")
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 2, 4),
+                        help="loader processes, each with its own DB connection")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    if ijson is None:
+        logger.warning("ijson not installed, dumps will be loaded whole")
+
+    # Each loader process needs one connection, held for the whole run; the
+    # pool opens all of its connections up front, so a .env value meant for
+    # the webapp would multiply them by the number of workers
+    os.environ["DB_POOL_SIZE"] = "1"
+
+    files = sorted(
+        os.path.join(args.data_dir, name) for name in os.listdir(args.data_dir)
+        if os.path.isfile(os.path.join(args.data_dir, name)) and not name.startswith(".")
+    )
+    manifest_path = args.manifest or os.path.join(args.data_dir, ".backfill_manifest")
+    backfill(files, manifest_path, args.workers, args.chunk_size, logger)
+
+    # Rebuilt once at the end rather than synced per chunk: the loaders run
+    # in parallel and would all upsert the same locations. An interrupted
+    # run leaves the stale marker behind, so the next run rebuilds.
+    if snapshot_pending(manifest_path):
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            rows = rebuild_latest_snapshot(cursor)
+            conn.commit()
+            logger.info(f"AqiInScrapeLatest rebuilt with {rows} locations")
+        finally:
+            cursor.close()
+            conn.close()
+        with open(manifest_path, 'a', encoding='utf-8') as manifest:
+            manifest.write(SNAPSHOT_REBUILT + "\n")
 
 
 if __name__ == "__main__":
-    files = []
-    logger = setup_logging()
-    data_dir = os.path.join(os.path.dirname(__file__), "data", "mass")
-    for filename in os.listdir(data_dir):
-        file_path = os.path.join(data_dir, filename)
-        if os.path.isfile(file_path):
-            files.append(file_path)
-    
-    for i, file_path in enumerate(files):
-        with open(file_path, 'r') as f:
-            mass_data = json.load(f)
-            data_to_sql(mass_data, logger, i)
-
+    setup_logging()
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The webapp modules import each other by bare name (see webapp/app.py),
+# and rpi.py lives at the repository root.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "webapp")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,85 @@
+import json
+import math
+import struct
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+import encoding
+
+
+def decode(body):
+    """Reference reader for the layout documented in encoding.py."""
+    magic, version, width, k, n, m = struct.unpack_from("<4sBBHII", body)
+    assert (magic, version) == (encoding.MAGIC, encoding.VERSION)
+    meta = json.loads(body[16:16 + m])
+    offset = 16 + m
+    assert offset % 8 == 0
+    timestamps = list(struct.unpack_from(f"<{n}d", body, offset))
+    offset += 8 * n
+    code = "f" if width == 4 else "d"
+    columns = {}
+    for name in meta.pop("columns"):
+        columns[name] = list(struct.unpack_from(f"<{n}{code}", body, offset))
+        offset += width * n
+    assert offset == len(body) and len(columns) == k
+    return timestamps, columns, meta
+
+
+def test_round_trip():
+    stamps = [datetime(2024, 1, 1), datetime(2024, 1, 1, 0, 0, 1, 500000)]
+    body = encoding.encode_columnar(stamps, {"pm25": [12.5, None], "pm10": [3, 4]}, meta={"node_id": "A01"})
+    timestamps, columns, meta = decode(body)
+    assert timestamps == [1704067200000.0, 1704067201500.0]
+    assert columns["pm10"] == [3.0, 4.0]
+    assert columns["pm25"][0] == 12.5 and math.isnan(columns["pm25"][1])
+    assert meta == {"node_id": "A01"}
+
+
+def test_epoch_ms_passed_through():
+    timestamps, _, _ = decode(encoding.encode_columnar([0, 1.5], {"v": [1, 2]}))
+    assert timestamps == [0.0, 1.5]
+
+
+def test_float32_values():
+    body = encoding.encode_columnar([0], {"v": [0.1]}, width=4)
+    assert struct.unpack_from("<B", body, 5) == (4,)
+    _, columns, _ = decode(body)
+    assert columns["v"] == [pytest.approx(0.1, rel=1e-6)]
+
+
+def test_empty_series():
+    timestamps, columns, meta = decode(encoding.encode_columnar([], {"v": []}))
+    assert timestamps == [] and columns == {"v": []} and meta == {}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.after_request(encoding.vary_on_accept)
+
+    @app.route("/negotiated")
+    def negotiated():
+        if encoding.wants_columnar():
+            return encoding.columnar_response([0], {"v": [1]})
+        return {"v": [1]}
+
+    @app.route("/plain")
+    def plain():
+        return {"v": [1]}
+
+    return app.test_client()
+
+
+def test_negotiated_responses_vary_on_accept(client):
+    columnar = client.get("/negotiated", headers={"Accept": encoding.COLUMNAR_MIME + "; precision=32"})
+    assert columnar.mimetype == encoding.COLUMNAR_MIME
+    assert columnar.headers["Vary"] == "Accept"
+    assert struct.unpack_from("<B", columnar.data, 5) == (4,)
+
+    json_response = client.get("/negotiated")
+    assert json_response.is_json
+    assert json_response.headers["Vary"] == "Accept"
+
+    assert "Vary" not in client.get("/plain").headers
@@ -0,0 +1,52 @@
+import pytest
+
+import geo
+
+
+def in_ranges(geohash, ranges):
+    return any(low <= geohash and (high is None or geohash < high) for low, high in ranges)
+
+
+def test_encode_known_value():
+    assert geo.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_next_prefix():
+    assert geo._next_prefix("u4p") == "u4q"
+    assert geo._next_prefix("u4z") == "u5"
+    assert geo._next_prefix("zz") is None
+
+
+@pytest.mark.parametrize("box", [
+    (12.90, 13.10, 77.50, 77.70),     # a city
+    (8.0, 37.0, 68.0, 97.0),          # a country
+    (-0.05, 0.05, -0.05, 0.05),       # around the origin, four quadrants
+    (-90.0, 90.0, -180.0, 180.0),     # the whole world
+])
+def test_cover_ranges_contain_every_point_in_the_box(box):
+    min_lat, max_lat, min_lon, max_lon = box
+    ranges = geo.cover_ranges(*box)
+    assert len(ranges) <= geo.MAX_COVER_CELLS
+    for i in range(11):
+        for j in range(11):
+            lat = min_lat + (max_lat - min_lat) * i / 10
+            lon = min_lon + (max_lon - min_lon) * j / 10
+            assert in_ranges(geo.encode(lat, lon), ranges), (lat, lon)
+
+
+def test_cover_ranges_are_sorted_and_disjoint():
+    ranges = geo.cover_ranges(8.0, 37.0, 68.0, 97.0)
+    for (_, high), (low, _) in zip(ranges, ranges[1:]):
+        assert high is not None and high < low
+
+
+def test_adjacent_cells_are_merged():
+    ranges = geo.cover_ranges(-90.0, 90.0, -180.0, 180.0)
+    assert ranges == [("0", None)]
+
+
+def test_max_cells_limits_precision():
+    coarse = geo.cover(12.90, 13.10, 77.50, 77.70, max_cells=1)
+    fine = geo.cover(12.90, 13.10, 77.50, 77.70)
+    assert len(coarse) == 1
+    assert max(map(len, fine)) > len(coarse[0])
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+import ingest
+
+
+class FakeCursor:
+    """Answers the two clock queries of ingest with fixed values."""
+
+    def __init__(self, now, offset_s):
+        self.now = now
+        self.offset_s = offset_s
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return (self.offset_s,) if "TIMESTAMPDIFF" in self.queries[-1] else (self.now,)
+
+
+def reading(**overrides):
+    return {"node_id": "A01", "sensor_id": "1", "measurement_id": 2, "value": "12.5", **overrides}
+
+
+def test_parse_reading():
+    key, timestamp, value = ingest.parse_reading(reading(timestamp="2024-05-01 10:00:00"))
+    assert key == ("A01", 1, 2)
+    assert timestamp == datetime(2024, 5, 1, 10)
+    assert value == 12.5
+
+
+def test_parse_reading_without_timestamp():
+    assert ingest.parse_reading(reading())[1] is None
+    assert ingest.parse_reading(reading(timestamp=""))[1] is None
+
+
+@pytest.mark.parametrize("item, message", [
+    ([], "reading must be an object"),
+    ({"node_id": "A01", "value": 1}, "missing sensor_id, measurement_id"),
+    (reading(sensor_id="x"), "sensor_id and measurement_id must be integers"),
+    (reading(value=None), "value must be a number"),
+    (reading(value="high"), "value must be a number"),
+    (reading(timestamp="yesterday"), "invalid timestamp"),
+    (reading(timestamp=True), "invalid timestamp"),
+    (reading(timestamp=1e20), "invalid timestamp"),
+])
+def test_parse_reading_rejects(item, message):
+    with pytest.raises(ValueError, match=message):
+        ingest.parse_reading(item)
+
+
+def test_parse_timestamp():
+    assert ingest.parse_timestamp(0) == datetime(1970, 1, 1, tzinfo=timezone.utc)
+    assert ingest.parse_timestamp(1.5) == datetime(1970, 1, 1, 0, 0, 1, 500000, tzinfo=timezone.utc)
+    assert ingest.parse_timestamp("2024-05-01T10:00:00Z") == datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    assert ingest.parse_timestamp("2024-05-01T10:00:00").tzinfo is None
+
+
+def test_resolve_timestamps():
+    now = datetime(2024, 5, 1, 12)
+    cursor = FakeCursor(now, 2 * 3600)
+    grouped = {
+        ("A01", 1, 2): [(None, 1.0), (datetime(2024, 5, 1, 9), 2.0)],
+        ("A01", 1, 3): [(datetime(2024, 5, 1, 10, tzinfo=timezone.utc), 3.0),
+                        (datetime(2024, 5, 1, 10, tzinfo=timezone(timedelta(hours=5))), 4.0)],
+    }
+    ingest.resolve_timestamps(cursor, grouped)
+    assert grouped == {
+        ("A01", 1, 2): [(now, 1.0), (datetime(2024, 5, 1, 9), 2.0)],
+        ("A01", 1, 3): [(datetime(2024, 5, 1, 12), 3.0), (datetime(2024, 5, 1, 7), 4.0)],
+    }
+    assert len(cursor.queries) == 2
+
+
+def test_resolve_timestamps_skips_queries_when_naive():
+    cursor = FakeCursor(None, 0)
+    grouped = {("A01", 1, 2): [(datetime(2024, 5, 1, 9), 2.0)]}
+    ingest.resolve_timestamps(cursor, grouped)
+    assert grouped == {("A01", 1, 2): [(datetime(2024, 5, 1, 9), 2.0)]}
+    assert cursor.queries == []
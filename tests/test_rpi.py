@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip("serial")
+pytest.importorskip("requests")
+import rpi
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return rpi.Spool(str(tmp_path / "spool.jsonl"))
+
+
+def readings(start, stop):
+    return [{"value": i} for i in range(start, stop)]
+
+
+class Recorder:
+    """send() callback that records batches and can be told to fail."""
+
+    def __init__(self, fail_after=None):
+        self.batches = []
+        self.fail_after = fail_after
+
+    def __call__(self, batch):
+        if self.fail_after is not None and len(self.batches) >= self.fail_after:
+            return False
+        self.batches.append(batch)
+        return True
+
+
+def test_append_and_replay_in_order(spool, tmp_path):
+    assert not spool.pending()
+    spool.append(readings(0, 3))
+    spool.append(readings(3, 5))
+    assert spool.pending()
+
+    send = Recorder()
+    assert spool.replay(send, batch_size=2)
+    assert send.batches == [readings(0, 2), readings(2, 4), readings(4, 5)]
+    assert not spool.pending()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_replay_resumes_after_failure(spool):
+    spool.append(readings(0, 5))
+    assert not spool.replay(Recorder(fail_after=1), batch_size=2)
+    assert spool.pending()
+
+    # The first batch went through, and the offset survives a new Spool object
+    send = Recorder()
+    assert rpi.Spool(spool.path).replay(send, batch_size=2)
+    assert send.batches == [readings(2, 4), readings(4, 5)]
+
+
+def test_offset_is_a_byte_position(spool):
+    spool.append(readings(0, 2))
+    spool.replay(Recorder(fail_after=1), batch_size=1)
+    with open(spool.path, "rb") as f:
+        first_line = f.readline()
+    assert spool._offset() == len(first_line)
+    with open(spool.offset_path, encoding="utf-8") as f:
+        assert f.read() == str(len(first_line))
+
+
+def test_unreadable_offset_replays_everything(spool):
+    spool.append(readings(0, 2))
+    with open(spool.offset_path, "w", encoding="utf-8") as f:
+        f.write('{"lines": 1}')
+    assert spool._offset() == 0
+
+    send = Recorder()
+    assert spool.replay(send, batch_size=10)
+    assert send.batches == [readings(0, 2)]
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ""
+
+
+class FakeSession:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.posts = 0
+
+    def post(self, url, data, timeout):
+        self.posts += 1
+        return FakeResponse(self.status_code)
+
+
+@pytest.mark.parametrize("status, delivered, rejected", [
+    (200, True, False),
+    (400, True, True),
+    (429, False, False),
+    (503, False, False),
+])
+def test_upload_statuses(tmp_path, status, delivered, rejected):
+    uploader = rpi.Uploader("http://server/api/postdata/batch",
+                            rpi.Spool(str(tmp_path / "spool.jsonl")),
+                            rpi.Spool(str(tmp_path / "rejected.jsonl")))
+    uploader.session = FakeSession(status)
+    uploader.add({"value": 1})
+
+    assert uploader.flush() is delivered
+    assert uploader.spool.pending() is not delivered
+    assert uploader.rejected.pending() is rejected
+    assert uploader.rejected_count == int(rejected)
+    assert uploader.sent == int(delivered and not rejected)
@@ -0,0 +1,69 @@
+import pytest
+
+import sparkline
+
+
+@pytest.fixture(autouse=True)
+def empty_memo():
+    sparkline._memo.clear()
+    yield
+    sparkline._memo.clear()
+
+
+def test_path_shape():
+    area, line = sparkline.generate_smooth_path([1, 2, 3], width=100, height=50)
+    assert line.startswith("M0.00,")
+    assert line.count("C") == 2
+    assert area == line + " V50 H0 Z"
+
+
+def test_python_path_matches_reference():
+    # Catmull-Rom controls for the points (0, 50), (50, 0), (100, 50); the
+    # maximum sits a hair above the top edge, hence -0.00
+    line = sparkline._path_python([0, 1, 0], width=100, height=50)
+    assert line == ("M0.00,50.00 "
+                    "C8.33,41.67 33.33,-0.00 50.00,-0.00 "
+                    "C66.67,-0.00 91.67,41.67 100.00,50.00")
+
+
+def test_flat_and_missing_values():
+    _, zeros = sparkline.generate_smooth_path([0, 0, 0], width=100, height=50)
+    _, nones = sparkline.generate_smooth_path([None, 0, None], width=100, height=50)
+    assert zeros == nones
+    assert zeros.startswith("M0.00,-0.00 ")
+
+
+def test_needs_two_points():
+    with pytest.raises(ValueError):
+        sparkline.generate_smooth_path([1])
+
+
+@pytest.mark.parametrize("values", [
+    [1, 2],
+    [3, 1, 4, 1, 5, 9, 2, 6],
+    [0.5, None, 12.25, 7, 7, 0],
+    [0, 0, 0, 0],
+])
+def test_vectorized_matches_fallback(values):
+    np = pytest.importorskip("numpy")
+    quantized = [q * sparkline.QUANTUM for q in sparkline._quantize(values)]
+    vectorized = sparkline._paths_numpy(np.array([quantized], dtype=float), 472, 150)
+    assert vectorized == [sparkline._path_python(quantized, 472, 150)]
+
+
+def test_batch_without_numpy(monkeypatch):
+    series = [[1, 2, 3], [4, 5, 6, 7], [1, 2, 3]]
+    with_numpy = sparkline.generate_smooth_paths(series)
+    sparkline._memo.clear()
+    monkeypatch.setattr(sparkline, "np", None)
+    assert sparkline.generate_smooth_paths(series) == with_numpy
+
+
+def test_memo_serves_repeats_and_is_bounded(monkeypatch):
+    monkeypatch.setattr(sparkline, "MEMO_SIZE", 2)
+    first = sparkline.generate_smooth_path([1, 2, 3])
+    assert sparkline.generate_smooth_path([1, 2, 3]) is first
+    sparkline.generate_smooth_path([2, 3, 4])
+    sparkline.generate_smooth_path([3, 4, 5])
+    assert len(sparkline._memo) == 2
+    assert sparkline.generate_smooth_path([1, 2, 3]) is not first
@@ -1,18 +1,67 @@
 import os
-from mysql.connector import connect, Error
+import json
+from mysql.connector import Error
 from typing import List
-from flask import request, Blueprint
+from flask import request, Blueprint, Response, stream_with_context
+from db import get_connection, pool_stats
+from store import has_rollups, has_minute_rollup, latest_values
+from ingest import parse_timestamp, parse_reading, known_measurements, write_grouped
+import series
+import write_behind
+from encoding import wants_columnar, columnar_response, vary_on_accept
+from cache import invalidate_node, cache_stats
+from aqi_snapshot import LATEST_TABLE, latest_scrape_id, ensure_latest_snapshot
+from geo import cover_ranges
+import pubsub
+import registry
+from http_cache import conditional, marker_query, compress_response, http_cache_stats
 
 api_bp = Blueprint("api", __name__)
-def get_connection():
-    return connect(
-        host=os.getenv("DB_HOST", "localhost"),
-        user=os.getenv("DB_USER", ""),
-        password=os.getenv("DB_PASSWORD", ""),
-        database=os.getenv("DB_NAME", "SMAQI")
-    )
-
-def get_data(table: str, cols: List[str]):
+api_bp.after_request(compress_response)
+api_bp.after_request(vary_on_accept)
+
+MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "10000"))
+
+# Change markers for conditional requests: cheap lookups that move whenever
+# the response of the endpoint would change
+
+def registry_marker(**_):
+    version = registry.version()
+    return None if version is None else (version,)
+
+
+def tvoc_marker():
+    return marker_query("SELECT MAX(id) FROM tvoc_data")
+
+
+def latest_aqi_marker():
+    # The snapshot is updated in the same transaction as the history insert
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+        scrape_id = latest_scrape_id(cursor)
+        cursor.close()
+        return (scrape_id,)
+    finally:
+        connection.close()
+
+
+def measurement_marker(node_id, sensor_id, measurement_id):
+    # The registry version moves when rollups are built or data is compacted
+    version = registry.version()
+    if version is None:
+        return None
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+        last = series.last_id(cursor, (node_id, sensor_id, measurement_id))
+        cursor.close()
+        return (version, last)
+    finally:
+        connection.close()
+
+
+def get_data(table: str, cols: List[str], ts_col: str = None):
     connection = get_connection()
     cols_str = ",".join(cols)
     try:
@@ -25,6 +74,12 @@ def get_data(table: str, cols: List[str]):
             return {"error": "No data found"}, 404
 
         columns = [desc[0] for desc in cursor.description]
+        if ts_col and wants_columnar():
+            ts_idx = columns.index(ts_col)
+            return columnar_response(
+                [row[ts_idx] for row in result],
+                {col: [row[i] for row in result] for i, col in enumerate(columns) if i != ts_idx}
+            )
         data = [dict(zip(columns, row)) for row in result]
         return {"data": data}, 200
 
@@ -36,9 +91,10 @@ def get_data(table: str, cols: List[str]):
         connection.close()
 
 @api_bp.route("/api/tvoc")
+@conditional(tvoc_marker)
 def get_tvoc_data():
     cols = ["val", "ts"]
-    data = get_data("tvoc_data", cols)
+    data = get_data("tvoc_data", cols, ts_col="ts")
     return data
 
 
@@ -60,9 +116,14 @@ def get_sensor_data(table, sensor):
         if not result:
             return {"error": "No data found"}, 404
 
+        rows = [row for row in result if row[0] is not None and row[0] <= 4000]
+        if wants_columnar():
+            return columnar_response(
+                [row[1] for row in rows], {"sensor_value": [row[0] for row in rows]}
+            )
         data = [
             {"sensor_value": row[0], "timestamp": row[1].isoformat()}
-            for row in result if row[0] is not None and row[0] <= 4000
+            for row in rows
         ]
         return {"data": data}, 200
 
@@ -74,92 +135,93 @@ def get_sensor_data(table, sensor):
         connection.close()
 
 @api_bp.route("/api/get_all_nodes")
+@conditional(registry_marker)
 def get_all_nodes():
-    connection = get_connection()
-    cursor = connection.cursor(buffered=True)
-
-    cursor.execute("SELECT DISTINCT node_id FROM Node;")
+    try:
+        return {"nodes": list(registry.nodes())}, 200
 
-    result = cursor.fetchall()
-    return {"nodes": [row[0] for row in result]}, 200
+    except Error as e:
+        print(e)
+        return {"error": str(e)}, 500
 
 @api_bp.route("/api/get_all_nodes_with_locations")
+@conditional(registry_marker)
 def get_all_nodes_with_locations():
-    connection = get_connection()
     try:
-        cursor = connection.cursor(buffered=True)
-        cursor.execute("SELECT node_id, location, latitude, longitude FROM Node;")
-        result = cursor.fetchall()
-        
         nodes = [
-            {
-                "node_id": row[0],
-                "location": row[1],
-                "latitude": float(row[2]),
-                "longitude": float(row[3])
-            }
-            for row in result
+            {"node_id": node_id, **node}
+            for node_id, node in registry.nodes().items()
         ]
         return {"nodes": nodes}, 200
-    
+
     except Error as e:
         print(e)
         return {"error": str(e)}, 500
-    
-    finally:
-        cursor.close()
-        connection.close()
+
+def build_latest_aqi_query(min_lat=None, max_lat=None, min_lon=None, max_lon=None):
+    """
+    Build the snapshot query for an optional bounding box. A full box is
+    turned into geohash ranges so MySQL can use idx_geohash; the exact
+    lat/lon predicates then trim the edges of the covering cells.
+    """
+    where_clauses = []
+    params = []
+
+    if None not in (min_lat, max_lat, min_lon, max_lon):
+        range_clauses = []
+        for low, high in cover_ranges(min_lat, max_lat, min_lon, max_lon):
+            if high is None:
+                range_clauses.append("a.geohash >= %s")
+                params.append(low)
+            else:
+                range_clauses.append("(a.geohash >= %s AND a.geohash < %s)")
+                params.extend([low, high])
+        where_clauses.append("(" + (" OR ".join(range_clauses) or "FALSE") + ")")
+
+    if min_lat is not None:
+        where_clauses.append("a.lat >= %s")
+        params.append(min_lat)
+    if max_lat is not None:
+        where_clauses.append("a.lat <= %s")
+        params.append(max_lat)
+    if min_lon is not None:
+        where_clauses.append("a.lon >= %s")
+        params.append(min_lon)
+    if max_lon is not None:
+        where_clauses.append("a.lon <= %s")
+        params.append(max_lon)
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = "WHERE " + " AND ".join(where_clauses)
+
+    # The snapshot table holds exactly one (the latest) row per locationId
+    query = f"""
+        SELECT a.*
+        FROM {LATEST_TABLE} a
+        {where_sql}
+        ORDER BY a.locationId;
+    """
+    return query, params
 
 @api_bp.route("/api/get_latest_aqi_data")
+@conditional(latest_aqi_marker)
 def get_latest_aqi_data():
     """
-    Get the most recent AQI data for each location from AqiInScrape table.
-    Returns only the latest record for each locationId.
+    Get the most recent AQI data for each location from the AqiInScrapeLatest
+    snapshot, which the scrapers keep in sync with AqiInScrape.
     """
     connection = get_connection()
     try:
         cursor = connection.cursor(buffered=True)
+        ensure_latest_snapshot(connection, cursor)
 
         min_lat = request.args.get("min_lat", type=float)
         max_lat = request.args.get("max_lat", type=float)
         min_lon = request.args.get("min_lon", type=float)
         max_lon = request.args.get("max_lon", type=float)
 
-        where_clauses = []
-        params = []
-
-        if min_lat is not None:
-            where_clauses.append("a.lat >= %s")
-            params.append(min_lat)
-        if max_lat is not None:
-            where_clauses.append("a.lat <= %s")
-            params.append(max_lat)
-        if min_lon is not None:
-            where_clauses.append("a.lon >= %s")
-            params.append(min_lon)
-        if max_lon is not None:
-            where_clauses.append("a.lon <= %s")
-            params.append(max_lon)
-
-        where_sql = ""
-        if where_clauses:
-            where_sql = "WHERE " + " AND ".join(where_clauses)
-
-        # Get the most recent record for each locationId
-        # Using a subquery to find max scrape_id for each locationId
-        query = f"""
-            SELECT a.* 
-            FROM AqiInScrape a
-            INNER JOIN (
-                SELECT locationId, MAX(scrape_id) as max_scrape_id
-                FROM AqiInScrape
-                WHERE lat IS NOT NULL AND lon IS NOT NULL
-                GROUP BY locationId
-            ) b ON a.locationId = b.locationId AND a.scrape_id = b.max_scrape_id
-            {where_sql}
-            ORDER BY a.locationId;
-        """
-        
+        query, params = build_latest_aqi_query(min_lat, max_lat, min_lon, max_lon)
         cursor.execute(query, params)
         result = cursor.fetchall()
         
@@ -209,63 +271,178 @@ def get_latest_aqi_data():
         connection.close()
 
 @api_bp.route("/api/node/<string:node_id>")
+@conditional(registry_marker)
 def get_all_sensors(node_id):
-    connection = get_connection()
-    cursor = connection.cursor(buffered=True)
-
-    cursor.execute("SELECT sensor_id FROM Sensor WHERE node_id = %s;", (node_id,))
+    try:
+        sensors = [m["sensor_id"] for m in registry.node_measurements(node_id)]
+        return {"sensors": sensors}, 200
 
-    result = cursor.fetchall()
-    return {"sensors": [row[0] for row in result]}, 200
+    except Error as e:
+        print(e)
+        return {"error": str(e)}, 500
 
 @api_bp.route("/api/sensor/<string:node_id>/<int:sensor_id>")
+@conditional(registry_marker)
 def get_all_measurements(node_id, sensor_id):
-    connection = get_connection()
-    cursor = connection.cursor(buffered=True)
+    try:
+        measurements = [
+            m["measurement_id"] for m in registry.node_measurements(node_id)
+            if m["sensor_id"] == sensor_id
+        ]
+        return {"measurements": measurements}, 200
 
-    cursor.execute(
-        "SELECT measurement_id FROM Sensor WHERE node_id = %s AND sensor_id = %s;",
-        (node_id, sensor_id)
-    )
+    except Error as e:
+        print(e)
+        return {"error": str(e)}, 500
 
-    result = cursor.fetchall()
-    return {"measurements": [row[0] for row in result]}, 200
+@api_bp.route("/api/node/<string:node_id>/manifest")
+def get_node_manifest(node_id):
+    """
+    Everything a node page needs before plotting: node location, its
+    sensors with their measurements and units, and the latest value of
+    each measurement. Metadata comes from the registry; the latest values
+    are read in one batched query.
+    """
+    try:
+        node = registry.nodes().get(node_id)
+        if node is None:
+            return {"error": "Unknown node"}, 404
+
+        keys = registry.node_keys(node_id)
+        stored, _ = registry.provisioned(keys)
+        node_measurements = registry.node_measurements(node_id)
+    except Error as e:
+        print(e)
+        return {"error": str(e)}, 500
+
+    connection = get_connection()
+    try:
+        cursor = connection.cursor(buffered=True)
+        latest = latest_values(cursor, [key for key in keys if key in stored])
+        cursor.close()
+    except Error as e:
+        print(e)
+        return {"error": str(e)}, 500
+    finally:
+        connection.close()
+
+    sensors = {}
+    for m, key in zip(node_measurements, keys):
+        sensor = sensors.setdefault(m["sensor_id"], {
+            "sensor_id": m["sensor_id"],
+            "sensor_type": m["sensor_type"],
+            "sensor_model": m["sensor_model"],
+            "measurements": [],
+        })
+        value, timestamp = latest.get(key, (None, None))
+        sensor["measurements"].append({
+            "measurement_id": m["measurement_id"],
+            "name": m["measurement_name"],
+            "unit": m["unit"],
+            "latest": {"value": value, "timestamp": timestamp.isoformat()} if timestamp else None,
+        })
+
+    return {"node_id": node_id, **node, "sensors": list(sensors.values())}, 200
 
 @api_bp.route("/api/measurement/<string:node_id>/<int:sensor_id>/<int:measurement_id>")
+@conditional(measurement_marker)
 def get_measurement_data(node_id, sensor_id, measurement_id):
+    """
+    Time series of one measurement.
+
+    Query parameters (all optional, checked in this order):
+        since:  only rows stored after this cursor (from a previous response)
+        points: downsample [start, end] to about this many min/avg/max buckets
+        start, end: ISO timestamps bounding the raw rows returned
+        limit:  only the last `limit` rows
+    With none of them the whole table is returned, as before. Every response
+    carries a `cursor` to pass as `since` on the next poll.
+    """
+    key = (node_id, sensor_id, measurement_id)
+    last = request.args.get("since", type=int)
+    points = request.args.get("points", type=int)
+    limit = request.args.get("limit", type=int)
+    start = series.parse_time(request.args.get("start"))
+    end = series.parse_time(request.args.get("end"))
+
     connection = get_connection()
-    cursor = connection.cursor(buffered=True)
+    try:
+        cursor = connection.cursor(buffered=True)
+        response = {}
+
+        if last is not None:
+            rows = series.since(cursor, key, last)
+        elif points:
+            first, latest = series.time_range(cursor, key, start, end)
+            rows = []
+            if first is not None:
+                rows, bucket_s = series.downsample(
+                    cursor, key, start or first, end or latest, points,
+                    use_rollup=has_rollups(cursor, key),
+                    use_minutes=has_minute_rollup(cursor, key)
+                )
+                response["bucket_seconds"] = bucket_s
+        elif start or end:
+            rows = series.in_range(cursor, key, start, end)
+        elif limit:
+            rows = series.tail(cursor, key, limit)
+        else:
+            rows = series.all_rows(cursor, key)
 
-    cursor.execute(f"""SELECT timestamp, value FROM {node_id}_{sensor_id}_{measurement_id};""")
+        if rows and "id" in rows[-1]:
+            response["cursor"] = max(row["id"] for row in rows)
+        else:
+            response["cursor"] = max(last or 0, series.last_id(cursor, key))
+        cursor.close()
 
-    result = cursor.fetchall()
-    data = [{"timestamp": row[0].isoformat(), "value": row[1]} for row in result]
-    return {"data": data}, 200
+        if wants_columnar():
+            value_cols = ["value", "min", "max"] if "bucket_seconds" in response else ["value"]
+            return columnar_response(
+                [row["timestamp"] for row in rows],
+                {col: [row[col] for row in rows] for col in value_cols},
+                meta=response
+            )
+
+        for row in rows:
+            row.pop("id", None)
+            row["timestamp"] = row["timestamp"].isoformat()
+        response["data"] = rows
+        return response, 200
+
+    except Error as e:
+        print(e)
+        return {"error": str(e)}, 500
+
+    finally:
+        connection.close()
 
 
 @api_bp.route("/api/postdata/<string:node_id>/<int:sensor_id>/<int:measurement_id>", methods=["POST"])
 def post_data(node_id, sensor_id, measurement_id):
+    connection = None
+    cursor = None
     try:
         data = request.get_json()
         if not data or "timestamp" not in data or "value" not in data:
             return {"error": "Invalid data"}, 400
 
-        timestamp = data["timestamp"]
-        value = data["value"]
+        try:
+            timestamp = parse_timestamp(data["timestamp"])
+            value = float(data["value"])
+        except (TypeError, ValueError, OverflowError, OSError):
+            return {"error": "Invalid data"}, 400
+
+        if write_behind.ENABLED and write_behind.enqueue(node_id, sensor_id, measurement_id, timestamp, value):
+            return {"message": "Data queued"}, 202
 
         connection = get_connection()
         cursor = connection.cursor()
 
-        table_name = f"{node_id}_{sensor_id}_{measurement_id}"
-
-        if not timestamp:
-            query = f"INSERT INTO {table_name} (timestamp, value) VALUES (CURRENT_TIMESTAMP, %s);"
-            cursor.execute(query, (value,))
-        else:
-            query = f"INSERT INTO {table_name} (timestamp, value) VALUES (%s, %s);"
-            cursor.execute(query, (timestamp, value))
-
+        grouped = {(node_id, sensor_id, measurement_id): [(timestamp, value)]}
+        write_grouped(cursor, grouped)
         connection.commit()
+        invalidate_node(node_id)
+        pubsub.publish(grouped)
 
         return {"message": "Data inserted successfully"}, 200
 
@@ -274,35 +451,159 @@ def post_data(node_id, sensor_id, measurement_id):
         return {"error": str(e)}, 500
 
     finally:
-        cursor.close()
-        connection.close()
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
 
 
-@api_bp.route("/api/get_sensor_mapping/<string:node_id>")
-def get_sensor_mapping(node_id):
-    query = f"""
-        SELECT sensor_id, measurement_id, measurement_name, unit, sensor_type FROM Sensor WHERE node_id = %s;
+@api_bp.route("/api/postdata/batch", methods=["POST"])
+def post_data_batch():
     """
+    Bulk ingest. Body: {"readings": [{node_id, sensor_id, measurement_id,
+    value, timestamp?}, ...]} (a bare list is accepted too). Readings are
+    checked against the Sensor table and written grouped by measurement
+    table in one transaction. Returns one status entry per reading.
+    """
+    data = request.get_json(silent=True)
+    readings = data.get("readings") if isinstance(data, dict) else data
+    if not isinstance(readings, list) or not readings:
+        return {"error": "Invalid data"}, 400
+    if len(readings) > MAX_BATCH:
+        return {"error": f"Batch larger than {MAX_BATCH} readings"}, 413
+
+    results = [{"index": i, "status": "ok"} for i in range(len(readings))]
+    parsed = []
+    for i, item in enumerate(readings):
+        try:
+            parsed.append((i, *parse_reading(item)))
+        except ValueError as e:
+            results[i] = {"index": i, "status": "error", "error": str(e)}
+
+    connection = None
+    cursor = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
 
-    connection = get_connection()
+        known = known_measurements(cursor, [key[0] for _, key, _, _ in parsed])
+        grouped = {}
+        for i, key, timestamp, value in parsed:
+            if key not in known:
+                results[i] = {"index": i, "status": "error", "error": "unknown node/sensor/measurement"}
+                continue
+            grouped.setdefault(key, []).append((timestamp, value))
+
+        inserted = write_grouped(cursor, grouped)
+        connection.commit()
+
+    except Error as e:
+        print(e)
+        if connection:
+            connection.rollback()
+        for i, _, _, _ in parsed:
+            if results[i]["status"] == "ok":
+                results[i] = {"index": i, "status": "error", "error": str(e)}
+        return {"inserted": 0, "rejected": len(readings), "results": results}, 500
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+    for node_id in {key[0] for key in grouped}:
+        invalidate_node(node_id)
+    pubsub.publish(grouped)
+
+    return {"inserted": inserted, "rejected": len(readings) - inserted, "results": results}, 200
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+@api_bp.route("/api/stream/<string:node_id>")
+def stream_node(node_id):
+    """
+    Server-Sent Events stream of the readings stored for node_id from now
+    on. Each `readings` event carries
+    {"readings": [[sensor_id, measurement_id, timestamp, value], ...]}; a
+    `resync` event means readings were dropped for a slow client, which
+    should reload its series. Nothing is read from the database.
+    """
+    sub = pubsub.subscribe(node_id)
+    if sub is None:
+        return {"error": "Too many live streams, poll instead"}, 503
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                readings, lagged = sub.get(pubsub.KEEPALIVE)
+                if lagged:
+                    yield _sse("resync", {})
+                if readings:
+                    yield _sse("readings", {"readings": [
+                        [sensor_id, measurement_id, timestamp.isoformat(), value]
+                        for sensor_id, measurement_id, timestamp, value in readings
+                    ]})
+                elif not lagged:
+                    yield ": keepalive\n\n"
+        finally:
+            pubsub.unsubscribe(sub)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@api_bp.route("/api/get_sensor_mapping/<string:node_id>")
+@conditional(registry_marker)
+def get_sensor_mapping(node_id):
     try:
-        cursor = connection.cursor(buffered=True)
-        cursor.execute(query, (node_id,))
-        result = cursor.fetchall()
+        measurements = registry.node_measurements(node_id)
 
-        if not result:
+        if not measurements:
             return {"error": "No data found"}, 404
 
         mapping = {
-            f"{row[0]},{row[1]}": [row[2], row[3], row[4]]
-            for row in result
+            f"{m['sensor_id']},{m['measurement_id']}": [m["measurement_name"], m["unit"], m["sensor_type"]]
+            for m in measurements
         }
         return {"mapping": mapping}, 200
-    
+
     except Error as e:
         print(e)
         return {"error": str(e)}, 500
-    
-    finally:
-        cursor.close()
-        connection.close()
+
+
+@api_bp.route("/api/stats/pool")
+def get_pool_stats():
+    return pool_stats(), 200
+
+
+@api_bp.route("/api/stats/cache")
+def get_cache_stats():
+    return cache_stats(), 200
+
+
+@api_bp.route("/api/stats/ingest")
+def get_ingest_stats():
+    return write_behind.write_behind_stats(), 200
+
+
+@api_bp.route("/api/stats/registry")
+def get_registry_stats():
+    return registry.registry_stats(), 200
+
+
+@api_bp.route("/api/stats/http")
+def get_http_stats():
+    return http_cache_stats(), 200
+
+
+@api_bp.route("/api/stats/live")
+def get_live_stats():
+    return pubsub.pubsub_stats(), 200
@@ -3,7 +3,10 @@ from mysql.connector import connect, Error
 import os
 from dotenv import load_dotenv
 import matplotlib.pyplot as plt
-from utils import get_index_stats, get_node_stats
+
+load_dotenv()
+
+from cache import cached_index_stats, cached_node_stats, warm_caches
 
 
 app = Flask(__name__)
@@ -12,7 +15,7 @@ app = Flask(__name__)
 @app.route("/")
 def hello():
     hours = request.args.get("hours", default=24, type=int)
-    stats = get_index_stats(hours)
+    stats = cached_index_stats(hours)
     print(stats)
     return render_template('index.html', stats=stats)
 
@@ -22,7 +25,7 @@ def plot(node_id):
 
 @app.route('/node/<string:node_id>')
 def node(node_id):
-    return render_template('node.html', stats=get_node_stats(node_id), node_id=node_id)
+    return render_template('node.html', stats=cached_node_stats(node_id), node_id=node_id)
 
 @app.route('/map')
 def map_redirect():
@@ -73,7 +76,7 @@ def map_tricity():
 from api_routes import api_bp
 app.register_blueprint(api_bp)
 
-load_dotenv()
+warm_caches()
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,149 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# AqiInScrapeLatest keeps one row per locationId: the most recent
+# (highest scrape_id) AqiInScrape row that has coordinates. Scrapers call
+# sync_latest_snapshot() in the same transaction as their history insert;
+# rebuild_latest_snapshot() regenerates it from the full history.
+LATEST_TABLE = "AqiInScrapeLatest"
+
+# Set once ensure_latest_snapshot() has checked the schema in this process
+_ensured = False
+_ensure_lock = threading.Lock()
+
+AQI_COLUMNS = [
+    "scrape_id", "lat", "lon", "locationId", "city", "state", "country", "last_updated",
+    "AQI_IN", "AQI_US", "CO_PPB", "H_PERCENT", "NO2_PPB", "O3_PPB",
+    "PM10_UGM3", "PM2_5_UGM3", "SO2_PPB", "T_C", "PM1_UGM3", "TVOC_PPM", "Noise_DB",
+]
+
+CREATE_LATEST_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {LATEST_TABLE} (
+        locationId VARCHAR(50) PRIMARY KEY,
+        scrape_id INT NOT NULL,
+        lat DOUBLE NOT NULL,
+        lon DOUBLE NOT NULL,
+        city VARCHAR(100),
+        state VARCHAR(100),
+        country VARCHAR(100),
+        last_updated DATETIME,
+        AQI_IN INT,
+        AQI_US INT,
+        CO_PPB DOUBLE,
+        H_PERCENT DOUBLE,
+        NO2_PPB DOUBLE,
+        O3_PPB DOUBLE,
+        PM10_UGM3 DOUBLE,
+        PM2_5_UGM3 DOUBLE,
+        SO2_PPB DOUBLE,
+        T_C DOUBLE,
+        PM1_UGM3 DOUBLE,
+        TVOC_PPM DOUBLE,
+        Noise_DB DOUBLE,
+        geohash CHAR(12) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+        INDEX idx_geohash (geohash)
+    );
+"""
+
+# Computed by MySQL from lat/lon whenever a row is written; see webapp/geo.py
+GEOHASH_SQL = "ST_GeoHash({lon}, {lat}, 12)"
+
+
+def ensure_geohash_column(cursor):
+    """Add the indexed geohash column to snapshots created before it existed."""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'geohash'
+    """, (LATEST_TABLE,))
+    if cursor.fetchone()[0]:
+        return False
+    cursor.execute(f"""
+        ALTER TABLE {LATEST_TABLE}
+            ADD COLUMN geohash CHAR(12) CHARACTER SET ascii COLLATE ascii_bin NOT NULL DEFAULT '',
+            ADD INDEX idx_geohash (geohash)
+    """)
+    cursor.execute(f"UPDATE {LATEST_TABLE} SET geohash = {GEOHASH_SQL.format(lon='lon', lat='lat')}")
+    logger.info(f"Added geohash column to {LATEST_TABLE}")
+    return True
+
+
+def ensure_latest_snapshot(conn, cursor):
+    """
+    Bring a database that predates the snapshot up to date: create and fill
+    AqiInScrapeLatest from the history, or add its geohash column. Checked
+    once per process. DDL commits implicitly, so call this before starting
+    a transaction.
+    """
+    global _ensured
+    if _ensured:
+        return
+    with _ensure_lock:
+        if _ensured:
+            return
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (LATEST_TABLE,))
+        if cursor.fetchone()[0]:
+            ensure_geohash_column(cursor)
+        else:
+            rows = rebuild_latest_snapshot(cursor)
+            logger.warning(f"{LATEST_TABLE} was missing, built it with {rows} locations")
+        conn.commit()
+        _ensured = True
+
+
+def latest_scrape_id(cursor):
+    """Highest scrape_id in the history table, read before inserting a batch."""
+    cursor.execute("SELECT COALESCE(MAX(scrape_id), 0) FROM AqiInScrape")
+    return cursor.fetchone()[0]
+
+
+def _upsert_sql(select_cols, from_sql):
+    cols = ", ".join(AQI_COLUMNS + ["geohash"])
+    updates = ", ".join(
+        f"{col} = VALUES({col})" for col in AQI_COLUMNS + ["geohash"] if col != "locationId"
+    )
+    return f"""
+        INSERT INTO {LATEST_TABLE} ({cols})
+        SELECT {select_cols}
+        {from_sql}
+        ON DUPLICATE KEY UPDATE {updates}
+    """
+
+
+def sync_latest_snapshot(cursor, since_scrape_id):
+    """
+    Upsert every history row inserted after `since_scrape_id` into the
+    snapshot. Rows are applied in scrape_id order so the newest row for a
+    location wins.
+    """
+    select_cols = ", ".join(AQI_COLUMNS + [GEOHASH_SQL.format(lon="lon", lat="lat")])
+    cursor.execute(_upsert_sql(select_cols, """
+        FROM AqiInScrape
+        WHERE scrape_id > %s
+          AND locationId IS NOT NULL AND lat IS NOT NULL AND lon IS NOT NULL
+        ORDER BY scrape_id
+    """), (since_scrape_id,))
+    return cursor.rowcount
+
+
+def rebuild_latest_snapshot(cursor):
+    """Regenerate the snapshot from the whole AqiInScrape history."""
+    cursor.execute(CREATE_LATEST_TABLE)
+    ensure_geohash_column(cursor)
+    cursor.execute(f"DELETE FROM {LATEST_TABLE}")
+    cursor.execute(f"""
+        INSERT INTO {LATEST_TABLE} ({", ".join(AQI_COLUMNS)}, geohash)
+        SELECT {", ".join(f"a.{col}" for col in AQI_COLUMNS)}, {GEOHASH_SQL.format(lon="a.lon", lat="a.lat")}
+        FROM AqiInScrape a
+        INNER JOIN (
+            SELECT locationId, MAX(scrape_id) AS max_scrape_id
+            FROM AqiInScrape
+            WHERE lat IS NOT NULL AND lon IS NOT NULL
+            GROUP BY locationId
+        ) b ON a.locationId = b.locationId AND a.scrape_id = b.max_scrape_id
+    """)
+    return cursor.rowcount
@@ -0,0 +1,223 @@
+import os
+import time
+import pickle
+import threading
+import logging
+from utils import get_index_stats, get_node_stats
+
+logger = logging.getLogger(__name__)
+
+# Cache settings (seconds):
+#   STATS_CACHE_TTL           age after which homepage stats are refreshed
+#   NODE_STATS_CACHE_TTL      same for node pages
+#   STATS_CACHE_MAX_STALE     oldest value still served while refreshing
+#   STATS_CACHE_MIN_REFRESH   minimum gap between refreshes of one key
+#   STATS_CACHE_REDIS_URL     optional Redis shared between workers
+#   STATS_CACHE_WARM          load homepage stats in the background at startup, 1/0
+
+
+class SharedBackend:
+    """Thin Redis wrapper so workers can reuse each other's results."""
+
+    def __init__(self, url, prefix):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        return pickle.loads(raw) if raw else None
+
+    def set(self, key, entry, ttl):
+        try:
+            self.client.set(self._key(key), pickle.dumps(entry), ex=max(1, int(ttl)))
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"Shared cache delete failed: {e}")
+
+
+class SWRCache:
+    """
+    Stale-while-revalidate cache around a loader function.
+
+    Fresh entries are returned directly. Entries past their TTL (or
+    invalidated) are still returned while a background thread reloads them,
+    so only the very first load of a key blocks the caller. Entries older
+    than max_stale are treated as missing.
+    """
+
+    def __init__(self, name, loader, ttl, max_stale, min_refresh=5,
+                 shared=None, should_cache=None):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.min_refresh = min_refresh
+        self.shared = shared
+        self.should_cache = should_cache or (lambda value: True)
+
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0,
+                          "refreshes": 0, "refresh_errors": 0, "invalidations": 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _store(self, key, value):
+        entry = {"value": value, "loaded_at": time.time(), "stale": False}
+        if self.should_cache(value):
+            with self._lock:
+                self._entries[key] = entry
+            if self.shared:
+                self.shared.set(key, entry, self.max_stale)
+        return entry
+
+    def _load(self, key):
+        return self._store(key, self.loader(key))
+
+    def _refresh(self, key):
+        try:
+            self._load(key)
+            self._count("refreshes")
+        except Exception as e:
+            self._count("refresh_errors")
+            logger.error(f"{self.name} cache refresh of {key!r} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh_async(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key,), daemon=True,
+                         name=f"{self.name}-refresh").start()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None and self.shared:
+            entry = self.shared.get(key)
+            if entry is not None:
+                with self._lock:
+                    self._entries[key] = entry
+
+        if entry is None or now - entry["loaded_at"] > self.max_stale:
+            self._count("misses")
+            return self._load(key)["value"]
+
+        age = now - entry["loaded_at"]
+        if age <= self.ttl and not entry["stale"]:
+            self._count("hits")
+            return entry["value"]
+
+        self._count("stale_hits")
+        if age >= self.min_refresh:
+            self.refresh_async(key)
+        return entry["value"]
+
+    def invalidate(self, key=None):
+        """Mark one key (or every key) stale; readers keep the old value until reloaded."""
+        self._count("invalidations")
+        with self._lock:
+            keys = list(self._entries) if key is None else [key]
+            for k in keys:
+                if k in self._entries:
+                    self._entries[k] = dict(self._entries[k], stale=True)
+        if self.shared:
+            for k in keys:
+                self.shared.delete(k)
+
+    def warm(self, keys):
+        for key in keys:
+            self.refresh_async(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["refreshing"] = len(self._refreshing)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else None
+        return stats
+
+
+def _shared_backend(prefix):
+    url = os.getenv("STATS_CACHE_REDIS_URL")
+    if not url:
+        return None
+    try:
+        return SharedBackend(url, prefix)
+    except ImportError:
+        logger.warning("STATS_CACHE_REDIS_URL set but redis is not installed, using local cache only")
+        return None
+
+
+INDEX_INTERVALS = [24, 168, 720]
+
+index_stats_cache = SWRCache(
+    "index_stats",
+    get_index_stats,
+    ttl=float(os.getenv("STATS_CACHE_TTL", "60")),
+    max_stale=float(os.getenv("STATS_CACHE_MAX_STALE", "3600")),
+    min_refresh=float(os.getenv("STATS_CACHE_MIN_REFRESH", "5")),
+    shared=_shared_backend("aqi:index_stats"),
+    should_cache=lambda value: "error" not in value,
+)
+
+node_stats_cache = SWRCache(
+    "node_stats",
+    get_node_stats,
+    ttl=float(os.getenv("NODE_STATS_CACHE_TTL", "30")),
+    max_stale=float(os.getenv("STATS_CACHE_MAX_STALE", "3600")),
+    min_refresh=float(os.getenv("STATS_CACHE_MIN_REFRESH", "5")),
+    shared=_shared_backend("aqi:node_stats"),
+    should_cache=lambda value: "error" not in value,
+)
+
+
+def cached_index_stats(hours):
+    if hours not in INDEX_INTERVALS:
+        hours = 24
+    return index_stats_cache.get(hours)
+
+
+def cached_node_stats(node_id):
+    return node_stats_cache.get(node_id)
+
+
+def invalidate_node(node_id):
+    """
+    Called after new readings for `node_id` are stored. Homepage stats are
+    left to their TTL: with every node posting every few seconds, clearing
+    them on each ingest would mean they are almost never served from cache.
+    """
+    node_stats_cache.invalidate(node_id)
+
+
+def warm_caches():
+    if os.getenv("STATS_CACHE_WARM", "1") != "1":
+        return
+    index_stats_cache.warm(INDEX_INTERVALS)
+
+
+def cache_stats():
+    return {"index_stats": index_stats_cache.stats(), "node_stats": node_stats_cache.stats()}
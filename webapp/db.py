@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+import logging
+from mysql.connector import pooling, errors
+
+logger = logging.getLogger(__name__)
+
+# Pool settings, read per worker process when the pool is first used.
+#   DB_POOL_SIZE            connections kept open per worker (max 32)
+#   DB_POOL_NAME            name prefix for the pool
+#   DB_POOL_TIMEOUT         seconds to wait for a free connection before failing
+#   DB_CONNECT_TIMEOUT      seconds allowed for the TCP/auth handshake
+#   DB_POOL_HEALTH_CHECK    ping (and reconnect) connections on checkout, 1/0
+#   DB_POOL_SLOW_WAIT       log checkouts that waited longer than this (seconds)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "checkouts": 0,
+    "timeouts": 0,
+    "reconnects": 0,
+    "wait_total_s": 0.0,
+    "wait_max_s": 0.0,
+}
+
+
+def get_db_config(database=True):
+    config = {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "user": os.getenv("DB_USER", ""),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "connection_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+    }
+    if database:
+        config["database"] = os.getenv("DB_NAME", "SMAQI")
+    return config
+
+
+def _create_pool():
+    size = min(int(os.getenv("DB_POOL_SIZE", "5")), pooling.CNX_POOL_MAXSIZE)
+    name = f"{os.getenv('DB_POOL_NAME', 'aqi')}-{os.getpid()}"
+    logger.info(f"Creating MySQL connection pool {name} with {size} connections")
+    return pooling.MySQLConnectionPool(
+        pool_name=name,
+        pool_size=size,
+        pool_reset_session=True,
+        **get_db_config()
+    )
+
+
+def get_pool():
+    """
+    Return the connection pool for this process, creating it on first use.
+    The pool is keyed on the pid so forked workers never share sockets
+    with their parent.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = _create_pool()
+                _pool_pid = pid
+    return _pool
+
+
+def get_connection():
+    """
+    Check a connection out of the pool. Calling close() on the returned
+    connection hands it back to the pool instead of closing the socket.
+    Waits up to DB_POOL_TIMEOUT seconds when every connection is in use.
+    """
+    pool = get_pool()
+    timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+    health_check = os.getenv("DB_POOL_HEALTH_CHECK", "1") == "1"
+
+    start = time.monotonic()
+    delay = 0.005
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except errors.PoolError:
+            waited = time.monotonic() - start
+            if waited >= timeout:
+                with _stats_lock:
+                    _stats["timeouts"] += 1
+                raise
+            time.sleep(min(delay, timeout - waited))
+            delay = min(delay * 2, 0.1)
+
+    if health_check:
+        try:
+            conn.ping(reconnect=False)
+        except errors.Error:
+            try:
+                conn.reconnect(attempts=2, delay=0)
+            except errors.Error:
+                # Hand the slot back, or every failed reconnect shrinks the pool
+                try:
+                    conn.close()
+                except errors.Error:
+                    pass
+                raise
+            with _stats_lock:
+                _stats["reconnects"] += 1
+
+    waited = time.monotonic() - start
+    with _stats_lock:
+        _stats["checkouts"] += 1
+        _stats["wait_total_s"] += waited
+        _stats["wait_max_s"] = max(_stats["wait_max_s"], waited)
+
+    if waited > float(os.getenv("DB_POOL_SLOW_WAIT", "0.5")):
+        logger.warning(f"Waited {waited:.3f}s for a pooled DB connection")
+
+    return conn
+
+
+def pool_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    checkouts = stats["checkouts"]
+    stats["wait_avg_s"] = stats["wait_total_s"] / checkouts if checkouts else 0.0
+    stats["pool_size"] = _pool.pool_size if _pool is not None else 0
+    stats["pid"] = os.getpid()
+    return stats
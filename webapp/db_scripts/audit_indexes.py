@@ -0,0 +1,181 @@
+"""
+Audit the indexes of the per-measurement tables against the queries the
+webapp runs on them, and add the missing timestamp index online.
+
+Usage (from the repository root):
+    python -m webapp.db_scripts.audit_indexes [node_id] [--apply]
+        [--batch-size N] [--pause S] [--repeat N]
+
+For every table the latest-value, 24 hour window and time range queries
+are EXPLAINed and timed. Tables without an index leading on timestamp are
+reported; with --apply they get idx_timestamp_value via an in-place,
+lock-free ALTER, a few tables at a time, and the queries are timed again.
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+import statistics
+from dotenv import load_dotenv
+import mysql.connector
+from logging_config import setup_logging
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+import store
+
+
+def get_series(cursor, node_id=None):
+    query = "SELECT node_id, sensor_id, measurement_id FROM Sensor"
+    params = ()
+    if node_id is not None:
+        query += " WHERE node_id = %s"
+        params = (node_id,)
+    cursor.execute(query, params)
+    return [(str(row[0]), int(row[1]), int(row[2])) for row in cursor.fetchall()]
+
+
+def app_queries(key):
+    """The raw-table queries of the webapp for one series, as (name, query, params)."""
+    table, where, params = store.source(key)
+    range_where = " AND ".join(where + ["timestamp >= NOW() - INTERVAL 1 DAY"])
+    return [
+        ("latest", *store.latest_values_query([key])),
+        ("window_24h", *store.hourly_average_query(key, 24)),
+        ("range_1d", f"SELECT id, timestamp, value FROM {table} WHERE {range_where} ORDER BY timestamp LIMIT 10000",
+         tuple(params)),
+    ]
+
+
+def timestamp_indexed(cursor, tables):
+    """Tables having an index whose first column is timestamp."""
+    if not tables:
+        return set()
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor.execute(f"""
+        SELECT DISTINCT TABLE_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+          AND SEQ_IN_INDEX = 1 AND COLUMN_NAME = 'timestamp'
+    """, tuple(tables))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def explain(cursor, query, params):
+    """Problems EXPLAIN reports for the query: full scans and filesorts."""
+    cursor.execute("EXPLAIN " + query, params)
+    columns = [d[0] for d in cursor.description]
+    problems = []
+    for row in cursor.fetchall():
+        plan = dict(zip(columns, row))
+        if (plan.get("table") or "<").startswith("<"):
+            continue
+        extra = plan.get("Extra") or ""
+        if plan.get("type") == "ALL":
+            problems.append(f"full scan of {plan['table']} (~{plan.get('rows')} rows)")
+        if "filesort" in extra:
+            problems.append(f"filesort on {plan['table']}")
+    return problems
+
+
+def time_query(cursor, query, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def measure(cursor, key, repeat):
+    return {name: time_query(cursor, query, params, repeat) for name, query, params in app_queries(key)}
+
+
+def add_index(cursor, table):
+    cursor.execute(f"""
+        ALTER TABLE {table}
+        ADD INDEX {store.TIMESTAMP_INDEX} ({", ".join(store.TIMESTAMP_INDEX_COLUMNS)}),
+        ALGORITHM=INPLACE, LOCK=NONE
+    """)
+
+
+def format_timings(before, after=None):
+    parts = []
+    for name, seconds in before.items():
+        if after:
+            parts.append(f"{name} {seconds * 1000:.1f} -> {after[name] * 1000:.1f} ms")
+        else:
+            parts.append(f"{name} {seconds * 1000:.1f} ms")
+    return ", ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit and provision indexes of measurement tables")
+    parser.add_argument("node_id", nargs="?", default=None)
+    parser.add_argument("--apply", action="store_true", help="add missing indexes")
+    parser.add_argument("--batch-size", type=int, default=5, help="tables altered per batch")
+    parser.add_argument("--pause", type=float, default=5.0, help="seconds between batches")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        keys = get_series(cursor, args.node_id)
+        stored, _ = store.provisioned(cursor, keys)
+        keys = [key for key in keys if key in stored]
+
+        if store.consolidated():
+            # Measurement is clustered on (series, timestamp); nothing to add
+            for key in keys:
+                for name, query, params in app_queries(key):
+                    for problem in explain(cursor, query, params):
+                        logger.warning(f"{store.measurement_table(*key)} {name}: {problem}")
+            return
+
+        tables = {key: store.measurement_table(*key) for key in keys}
+        indexed = timestamp_indexed(cursor, list(tables.values()))
+        missing = []
+        for key, table in tables.items():
+            problems = [f"{name}: {p}" for name, query, params in app_queries(key)
+                        for p in explain(cursor, query, params)]
+            if table in indexed and not problems:
+                continue
+            before = measure(cursor, key, args.repeat)
+            logger.info(f"{table}: {'; '.join(problems) or 'no problems'} | {format_timings(before)}")
+            if table not in indexed:
+                missing.append((key, table, before))
+
+        logger.info(f"{len(missing)} of {len(tables)} tables lack a timestamp index")
+        if not args.apply or not missing:
+            return
+
+        for i in range(0, len(missing), args.batch_size):
+            if i:
+                time.sleep(args.pause)
+            for key, table, before in missing[i:i + args.batch_size]:
+                try:
+                    start = time.perf_counter()
+                    add_index(cursor, table)
+                    took = time.perf_counter() - start
+                except mysql.connector.Error as err:
+                    logger.error(f"Failed to index {table}: {err}")
+                    continue
+                after = measure(cursor, key, args.repeat)
+                logger.info(f"{table}: added {store.TIMESTAMP_INDEX} in {took:.1f}s | {format_timings(before, after)}")
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+from dotenv import load_dotenv
+import mysql.connector
+from logging_config import setup_logging
+import logging
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from store import measurement_table, backfill_series_rollups
+from registry import bump_version
+
+
+def get_measurement_series(cursor, node_id=None):
+    query = "SELECT node_id, sensor_id, measurement_id FROM Sensor"
+    params = ()
+    if node_id is not None:
+        query += " WHERE node_id = %s"
+        params = (node_id,)
+    cursor.execute(query, params)
+    return [(str(row[0]), int(row[1]), int(row[2])) for row in cursor.fetchall()]
+
+
+def main():
+    logger = logging.getLogger(__name__)
+    node_id = sys.argv[1] if len(sys.argv) > 1 else None
+    logger.info(f"Rollup backfill started for {node_id or 'all nodes'}")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        for key in get_measurement_series(cursor, node_id):
+            table = measurement_table(*key)
+            try:
+                hours = backfill_series_rollups(cursor, key)
+                conn.commit()
+                logger.info(f"Backfilled rollups for {table} ({hours} hourly buckets)")
+            except mysql.connector.Error as err:
+                conn.rollback()
+                logger.error(f"Failed to backfill {table}: {err}")
+
+        # Workers cache which series have rollups
+        bump_version(cursor)
+        conn.commit()
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    main()
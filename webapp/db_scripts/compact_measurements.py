@@ -0,0 +1,187 @@
+"""
+Apply the retention policies of configs/retention.yaml to every measurement.
+
+Usage (from the repository root):
+    python -m webapp.db_scripts.compact_measurements [node_id] [--policies FILE]
+        [--chunk-size N] [--sleep S] [--dry-run]
+
+Raw readings older than raw_days are folded into 1-minute aggregates and
+deleted, one chunk per transaction, so each chunk is either fully
+compacted or untouched. Minute aggregates older than minute_days are then
+deleted in chunks as well. Hourly and daily rollups are left alone, which
+is why series without rollups are skipped. A short pause between chunks
+keeps the job from starving ingest of locks and I/O.
+
+InnoDB reuses freed pages but does not shrink its files; the reported
+bytes are estimated from the average row length of each table.
+
+In the consolidated layout the job also adds the monthly partitions of the
+coming months (store.ensure_partitions), so readings never pile up in the
+catch-all pmax partition. Run it at least monthly, e.g. nightly from cron:
+    30 3 * * * cd /path/to/repo && python -m webapp.db_scripts.compact_measurements
+"""
+import os
+import sys
+import time
+import fnmatch
+import argparse
+import logging
+from datetime import timedelta
+import yaml
+from dotenv import load_dotenv
+import mysql.connector
+from logging_config import setup_logging
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from rollups import MINUTE_PERIODS
+import store
+from registry import bump_version
+
+DEFAULT_POLICIES = os.path.join(os.path.dirname(WEBAPP_DIR), "configs", "retention.yaml")
+
+
+def load_policies(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    default = config.get('default') or {}
+    rules = list((config.get('measurements') or {}).items())
+
+    def policy_for(key):
+        name = store.measurement_table(*key)
+        for pattern, rule in rules:
+            if fnmatch.fnmatchcase(name, str(pattern)):
+                return {**default, **(rule or {})}
+        return default
+
+    return policy_for
+
+
+def get_series(cursor, node_id=None):
+    query = "SELECT node_id, sensor_id, measurement_id FROM Sensor"
+    params = ()
+    if node_id is not None:
+        query += " WHERE node_id = %s"
+        params = (node_id,)
+    cursor.execute(query, params)
+    return [(str(row[0]), int(row[1]), int(row[2])) for row in cursor.fetchall()]
+
+
+def compact_raw(conn, cursor, key, cutoff, chunk_size, pause, dry_run):
+    """Fold raw rows older than cutoff into minute buckets and delete them."""
+    if dry_run:
+        return store.count_older(cursor, key, cutoff)
+    removed = 0
+    while True:
+        rows = store.oldest_rows(cursor, key, cutoff, chunk_size)
+        if not rows:
+            break
+        store.fold_into_rollups(cursor, key, [(ts, value) for _, ts, value in rows], periods=MINUTE_PERIODS)
+        removed += store.delete_rows(cursor, key, [row[0] for row in rows])
+        conn.commit()
+        if len(rows) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return removed
+
+
+def expire_minutes(conn, cursor, key, cutoff, chunk_size, pause, dry_run):
+    if dry_run:
+        return store.count_older(cursor, key, cutoff, period="minute")
+    removed = 0
+    while True:
+        deleted = store.delete_rollup_buckets(cursor, key, "minute", cutoff, chunk_size)
+        conn.commit()
+        removed += deleted
+        if deleted < chunk_size:
+            return removed
+        if pause:
+            time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old sensor readings according to retention policies")
+    parser.add_argument("node_id", nargs="?", default=None)
+    parser.add_argument("--policies", default=DEFAULT_POLICIES)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per transaction")
+    parser.add_argument("--sleep", type=float, default=0.2, help="pause between chunks (seconds)")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be compacted")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    policy_for = load_policies(args.policies)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if store.consolidated() and not args.dry_run:
+            added = store.ensure_partitions(cursor)
+            if added:
+                logger.info(f"Added partitions {', '.join(added)} to {store.MEASUREMENT_TABLE}")
+
+        keys = get_series(cursor, args.node_id)
+        stored, rolled = store.provisioned(cursor, keys)
+        cursor.execute("SELECT NOW()")
+        now = cursor.fetchone()[0]
+
+        raw_sizes = store.table_sizes(cursor, [store.source(key)[0] for key in keys])
+        totals = {"raw_rows": 0, "minute_rows": 0, "bytes": 0}
+
+        for key in keys:
+            name = store.measurement_table(*key)
+            if key not in stored:
+                continue
+            if key not in rolled:
+                logger.warning(f"Skipping {name}: no rollups yet, run backfill_rollups.py first")
+                continue
+
+            policy = policy_for(key)
+            raw_days = policy.get('raw_days')
+            minute_days = policy.get('minute_days')
+            try:
+                raw_removed = minute_removed = 0
+                if raw_days is not None:
+                    # Hour-aligned so a minute bucket is never split between runs
+                    cutoff = (now - timedelta(days=raw_days)).replace(minute=0, second=0, microsecond=0)
+                    if not args.dry_run:
+                        store.create_series_rollups(cursor, key, periods=MINUTE_PERIODS)
+                    raw_removed = compact_raw(conn, cursor, key, cutoff, args.chunk_size, args.sleep, args.dry_run)
+                if minute_days is not None and store.has_minute_rollup(cursor, key):
+                    cutoff = now - timedelta(days=minute_days)
+                    minute_removed = expire_minutes(conn, cursor, key, cutoff, args.chunk_size, args.sleep, args.dry_run)
+            except mysql.connector.Error as err:
+                conn.rollback()
+                logger.error(f"Failed to compact {name}: {err}")
+                continue
+
+            _, avg_row, _ = raw_sizes.get(store.source(key)[0], (0, 0, 0))
+            reclaimed = raw_removed * avg_row
+            totals["raw_rows"] += raw_removed
+            totals["minute_rows"] += minute_removed
+            totals["bytes"] += reclaimed
+            if raw_removed or minute_removed:
+                logger.info(f"{name}: {raw_removed} raw rows compacted, {minute_removed} minute buckets expired, "
+                            f"~{reclaimed / 1024 ** 2:.1f} MiB")
+
+        if not args.dry_run and (totals["raw_rows"] or totals["minute_rows"]):
+            # Invalidates the validators of cached measurement responses
+            bump_version(cursor)
+            conn.commit()
+
+        verb = "would compact" if args.dry_run else "compacted"
+        logger.info(f"Retention {verb} {totals['raw_rows']} raw rows and expired {totals['minute_rows']} "
+                    f"minute buckets, ~{totals['bytes'] / 1024 ** 2:.1f} MiB reclaimed")
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    main()
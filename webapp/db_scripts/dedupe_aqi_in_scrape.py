@@ -0,0 +1,92 @@
+import os
+import sys
+from dotenv import load_dotenv
+import mysql.connector
+from logging_config import setup_logging
+import logging
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from aqi_snapshot import rebuild_latest_snapshot
+
+CHUNK = 100000
+# Non-unique index the duplicate search runs on; uq_location_updated
+# covers the same columns, so it is dropped again once that exists
+HELPER_INDEX = "ix_dedupe_location_updated"
+
+
+def has_index(cursor, name):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'AqiInScrape'
+          AND INDEX_NAME = %s
+    """, (name,))
+    return cursor.fetchone()[0] > 0
+
+
+def delete_duplicates(conn, cursor, logger):
+    """Keep the first-scraped row of every (locationId, last_updated) pair."""
+    cursor.execute("SELECT COALESCE(MIN(scrape_id), 0), COALESCE(MAX(scrape_id), 0) FROM AqiInScrape")
+    low, high = cursor.fetchone()
+    deleted = 0
+    for start in range(low, high + 1, CHUNK):
+        cursor.execute("""
+            DELETE a FROM AqiInScrape a
+            JOIN AqiInScrape b
+              ON a.locationId = b.locationId
+             AND a.last_updated = b.last_updated
+             AND a.scrape_id > b.scrape_id
+            WHERE a.scrape_id >= %s AND a.scrape_id < %s
+        """, (start, start + CHUNK))
+        deleted += cursor.rowcount
+        conn.commit()
+        logger.info(f"Scanned scrape_id < {start + CHUNK}, {deleted} duplicates deleted so far")
+    return deleted
+
+
+def main():
+    logger = logging.getLogger(__name__)
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if has_index(cursor, "uq_location_updated"):
+            logger.info("AqiInScrape already has uq_location_updated")
+            return
+
+        # Without an index every chunk of the self-join scans the whole table
+        if not has_index(cursor, HELPER_INDEX):
+            logger.info(f"Adding {HELPER_INDEX}")
+            cursor.execute(f"""
+                ALTER TABLE AqiInScrape
+                ADD INDEX {HELPER_INDEX} (locationId, last_updated, scrape_id)
+            """)
+
+        deleted = delete_duplicates(conn, cursor, logger)
+        cursor.execute("""
+            ALTER TABLE AqiInScrape
+            ADD UNIQUE KEY uq_location_updated (locationId, last_updated)
+        """)
+        logger.info(f"Added uq_location_updated after deleting {deleted} duplicates")
+        cursor.execute(f"ALTER TABLE AqiInScrape DROP INDEX {HELPER_INDEX}")
+
+        rows = rebuild_latest_snapshot(cursor)
+        conn.commit()
+        logger.info(f"AqiInScrapeLatest rebuilt with {rows} locations")
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Failed to deduplicate AqiInScrape: {err}")
+        raise
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    main()
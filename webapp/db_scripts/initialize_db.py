@@ -1,13 +1,23 @@
 import mysql.connector
 from dotenv import load_dotenv
 import os
+import sys
 from logging_config import setup_logging
 import logging
 
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from aqi_snapshot import CREATE_LATEST_TABLE
+from registry import CREATE_VERSION_TABLE
+
 def init_tables(cursor, logger):
     create_node_table(cursor, logger)
     create_sensor_table(cursor, logger)
     create_aqi_in_scrape_table(cursor, logger)
+    create_aqi_in_latest_table(cursor, logger)
+    create_registry_version_table(cursor, logger)
 
 def create_node_table(cursor, logger):
     create_table_query = """
@@ -62,12 +72,21 @@ def create_aqi_in_scrape_table(cursor, logger):
         T_C DOUBLE,
         PM1_UGM3 DOUBLE,
         TVOC_PPM DOUBLE,
-        Noise_DB DOUBLE
+        Noise_DB DOUBLE,
+        UNIQUE KEY uq_location_updated (locationId, last_updated)
     );
     """
     cursor.execute(create_table_query)
     logger.info("AqiInScrape table created successfully.")
 
+def create_aqi_in_latest_table(cursor, logger):
+    cursor.execute(CREATE_LATEST_TABLE)
+    logger.info("AqiInScrapeLatest table created successfully.")
+
+def create_registry_version_table(cursor, logger):
+    cursor.execute(CREATE_VERSION_TABLE)
+    logger.info("RegistryVersion table created successfully.")
+
 def main():
     logger = logging.getLogger(__name__)
     DB_NAME = os.getenv("DB_NAME")
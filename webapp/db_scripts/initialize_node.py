@@ -6,6 +6,14 @@ import mysql.connector
 from logging_config import setup_logging
 import logging
 
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+import store
+from rollups import create_rollup_tables
+from registry import bump_version
+
 def initialize_node(node, cursor, logger):
     query = """INSERT INTO Node (node_id, location, latitude, longitude) 
                VALUES (%s, %s, %s, %s);"""
@@ -23,14 +31,21 @@ def create_sensor_table(node_id, sensor_id, measurement_id, cursor, logger):
     query = f"""CREATE TABLE {node_id}_{sensor_id}_{measurement_id} (
         id INT PRIMARY KEY AUTO_INCREMENT,
         value DOUBLE NOT NULL,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        INDEX {store.TIMESTAMP_INDEX} ({", ".join(store.TIMESTAMP_INDEX_COLUMNS)})
         );"""
     cursor.execute(query)
+    create_rollup_tables(cursor, f"{node_id}_{sensor_id}_{measurement_id}")
     logger.info(f"Created node {node_id}_{sensor_id}_{measurement_id} table")
 
 
 def initialize_sensors(node, sensors, cursor, logger):
     node_id = node['id']
+    # The consolidated layout keeps every measurement in one shared table
+    if store.consolidated():
+        store.create_measurement_store(cursor)
+        # The table may predate this node; extend its partitions if needed
+        store.ensure_partitions(cursor)
     for _, sensor in sensors.items():
         sensor_id = sensor['id']
         sensor_type = sensor['type']
@@ -45,7 +60,8 @@ def initialize_sensors(node, sensors, cursor, logger):
             measurement_name = measurement['name']
             unit = measurement['unit']
             insert_measurement(sensor_id, measurement_id, sensor_type, sensor_model, measurement_name, unit, node_id, cursor, logger)
-            create_sensor_table(node_id, sensor_id, measurement_id, cursor, logger)
+            if not store.consolidated():
+                create_sensor_table(node_id, sensor_id, measurement_id, cursor, logger)
 
 def main():
     logger = logging.getLogger(__name__)
@@ -77,6 +93,11 @@ def main():
         initialize_node(data['Node'], cursor, logger)
         initialize_sensors(data['Node'], data['Sensors'], cursor, logger)
 
+        # Running webapp workers reload their node registry on the next check
+        bump_version(cursor)
+        conn.commit()
+        logger.info(f"Registered node {data['Node']['id']}")
+
     except mysql.connector.Error as err:
         print(f"Error: {err}")
         sys.exit(1)
@@ -0,0 +1,194 @@
+"""
+Copy the per-measurement {node}_{sensor}_{measurement} tables into the
+consolidated, month-partitioned Measurement table.
+
+Usage (from the repository root):
+    python -m webapp.db_scripts.migrate_to_consolidated [node_id] [--batch-size N] [--sleep S]
+
+Rows are copied in id order, one batch per transaction, and the last copied
+id of every series is kept in MeasurementMigration in the same transaction.
+An interrupted run resumes where it stopped, and a later run only copies
+rows that arrived since, so the usual switch-over is:
+    1. run the migration while the webapp still writes the old tables
+    2. set STORAGE_LAYOUT=consolidated and restart the webapp
+    3. run the migration again to pick up the readings written in between
+Rollups are carried over rather than recomputed where raw rows are gone:
+compact_measurements.py deletes old raw rows but keeps their hourly, daily
+and minute rollups, so those buckets are copied from the old rollup tables
+up to the hour of the oldest raw row left, and only later buckets are
+rebuilt from the copied raw rows.
+Polling clients should reload after the switch, since series cursors are
+Measurement ids from then on.
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+from datetime import timedelta
+from dotenv import load_dotenv
+import mysql.connector
+from logging_config import setup_logging
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from rollups import (
+    MINUTE_PERIODS, SERIES_KEY, SERIES_KEY_DDL, rollup_table, has_rollups, create_rollup_tables,
+    backfill_rollups, copy_rollups,
+)
+from store import (
+    MEASUREMENT_TABLE, measurement_table, existing_tables,
+    create_measurement_store, ensure_partitions,
+)
+
+PROGRESS_TABLE = "MeasurementMigration"
+
+
+def create_progress_table(cursor):
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} (
+        {SERIES_KEY_DDL},
+        last_id BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY ({", ".join(SERIES_KEY)})
+        );""")
+
+
+def get_series(cursor, node_id=None):
+    query = "SELECT node_id, sensor_id, measurement_id FROM Sensor"
+    params = ()
+    if node_id is not None:
+        query += " WHERE node_id = %s"
+        params = (node_id,)
+    cursor.execute(query, params)
+    keys = [(str(row[0]), int(row[1]), int(row[2])) for row in cursor.fetchall()]
+    tables = existing_tables(cursor, [measurement_table(*key) for key in keys])
+    return [key for key in keys if measurement_table(*key) in tables]
+
+
+def oldest_timestamp(cursor, keys):
+    if not keys:
+        return None
+    cursor.execute(" UNION ALL ".join(
+        f"(SELECT MIN(timestamp) FROM {measurement_table(*key)})" for key in keys
+    ))
+    stamps = [row[0] for row in cursor.fetchall() if row[0] is not None]
+    return min(stamps) if stamps else None
+
+
+def copied_up_to(cursor, key):
+    cursor.execute(
+        f"SELECT last_id FROM {PROGRESS_TABLE} WHERE node_id = %s AND sensor_id = %s AND measurement_id = %s",
+        key
+    )
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def copy_series(conn, cursor, key, batch_size, pause, logger):
+    """Copy the rows of one series past its saved position. Returns rows copied."""
+    table = measurement_table(*key)
+    last_id = copied_up_to(cursor, key)
+    cursor.execute(f"SELECT MAX(id) FROM {table}")
+    max_id = cursor.fetchone()[0] or 0
+
+    copied = 0
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        # Rows without a timestamp cannot be placed in a partition
+        cursor.execute(f"""
+            INSERT INTO {MEASUREMENT_TABLE} ({", ".join(SERIES_KEY)}, timestamp, value)
+            SELECT %s, %s, %s, timestamp, value FROM {table}
+            WHERE id > %s AND id <= %s AND timestamp IS NOT NULL
+            ORDER BY id
+        """, (*key, last_id, upper))
+        copied += cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO {PROGRESS_TABLE} ({", ".join(SERIES_KEY)}, last_id)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)
+        """, (*key, upper))
+        conn.commit()
+        last_id = upper
+        if pause:
+            time.sleep(pause)
+
+    if copied:
+        logger.info(f"{table}: copied {copied} rows (up to id {last_id})")
+    return copied
+
+
+def copy_rollup_history(cursor, key, logger):
+    """
+    Copy the rollups of one series that raw rows can no longer reproduce.
+    Returns the hour from which rollups are rebuilt from raw rows instead,
+    or None when the old table has no rollups and all are rebuilt.
+    """
+    table = measurement_table(*key)
+    if not has_rollups(cursor, table):
+        return None
+    cursor.execute(f"SELECT MIN(timestamp) FROM {table}")
+    oldest = cursor.fetchone()[0]
+    if oldest is None:
+        # Everything was compacted away; the rollups are all there is
+        cursor.execute(f"SELECT MAX(bucket) FROM {rollup_table(table, 'hourly')}")
+        oldest = cursor.fetchone()[0]
+        if oldest is None:
+            return None
+    since = oldest.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+    create_rollup_tables(cursor, MEASUREMENT_TABLE, keyed=True)
+    hours = copy_rollups(cursor, table, MEASUREMENT_TABLE, key, "hourly", "bucket < %s", (since,))
+    copy_rollups(cursor, table, MEASUREMENT_TABLE, key, "daily", "bucket < DATE(%s)", (since,))
+    if existing_tables(cursor, [rollup_table(table, "minute")]):
+        create_rollup_tables(cursor, MEASUREMENT_TABLE, keyed=True, periods=MINUTE_PERIODS)
+        copy_rollups(cursor, table, MEASUREMENT_TABLE, key, "minute")
+    logger.info(f"{table}: copied rollups before {since} ({hours} hourly rows affected)")
+    return since
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate per-measurement tables into the Measurement table")
+    parser.add_argument("node_id", nargs="?", default=None)
+    parser.add_argument("--batch-size", type=int, default=20000, help="source ids per transaction")
+    parser.add_argument("--sleep", type=float, default=0.0, help="pause between batches (seconds)")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.info(f"Migration to {MEASUREMENT_TABLE} started for {args.node_id or 'all nodes'}")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        keys = get_series(cursor, args.node_id)
+        create_measurement_store(cursor, oldest_timestamp(cursor, keys))
+        added = ensure_partitions(cursor)
+        if added:
+            logger.info(f"Added partitions {', '.join(added)}")
+        create_progress_table(cursor)
+
+        total = 0
+        for key in keys:
+            try:
+                copied = copy_series(conn, cursor, key, args.batch_size, args.sleep, logger)
+                total += copied
+                if copied:
+                    since = copy_rollup_history(cursor, key, logger)
+                    backfill_rollups(cursor, MEASUREMENT_TABLE, key=key, since=since)
+                    conn.commit()
+            except mysql.connector.Error as err:
+                conn.rollback()
+                logger.error(f"Failed to migrate {measurement_table(*key)}: {err}")
+
+        logger.info(f"Migrated {total} rows from {len(keys)} tables")
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    main()
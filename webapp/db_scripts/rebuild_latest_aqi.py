@@ -0,0 +1,40 @@
+import os
+import sys
+from dotenv import load_dotenv
+import mysql.connector
+from logging_config import setup_logging
+import logging
+
+WEBAPP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEBAPP_DIR not in sys.path:
+    sys.path.insert(0, WEBAPP_DIR)
+
+from db import get_connection
+from aqi_snapshot import rebuild_latest_snapshot
+
+
+def main():
+    logger = logging.getLogger(__name__)
+    logger.info("Rebuilding AqiInScrapeLatest from AqiInScrape")
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        rows = rebuild_latest_snapshot(cursor)
+        conn.commit()
+        logger.info(f"AqiInScrapeLatest rebuilt with {rows} locations")
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        logger.error(f"Failed to rebuild AqiInScrapeLatest: {err}")
+        raise
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging()
+    main()
@@ -0,0 +1,88 @@
+import re
+import sys
+import json
+import struct
+from array import array
+from datetime import datetime, timedelta
+from flask import g, request, Response
+
+# Opt-in binary time-series format, selected with
+#   Accept: application/vnd.aqi.columnar[; precision=32]
+#
+# Layout (little-endian):
+#   0   4s   magic b"AQTS"
+#   4   u8   version (1)
+#   5   u8   value width in bytes (4 = float32, 8 = float64)
+#   6   u16  number of value columns k
+#   8   u32  number of rows n
+#   12  u32  length m of the JSON metadata
+#   16  m    metadata: {"columns": [...], ...extra response fields}, padded to 8 bytes
+#   ..  n    float64 timestamps, milliseconds since epoch of the stored wall-clock time
+#   ..  k*n  values per column, NaN for NULL
+#
+# Every section starts on an 8-byte boundary so the browser can wrap it in a
+# Float64Array/Float32Array without copying (see static/columnar.js).
+COLUMNAR_MIME = "application/vnd.aqi.columnar"
+MAGIC = b"AQTS"
+VERSION = 1
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MS = timedelta(milliseconds=1)
+NAN = float("nan")
+
+
+def wants_columnar():
+    # Whatever the answer, the response now depends on Accept
+    g.negotiated_accept = True
+    accept = request.headers.get("Accept", "")
+    return COLUMNAR_MIME in accept
+
+
+def vary_on_accept(response):
+    """after_request hook: mark responses of views that negotiated the format."""
+    if g.get("negotiated_accept"):
+        response.vary.add("Accept")
+    return response
+
+
+def requested_width():
+    match = re.search(r"precision\s*=\s*(\d+)", request.headers.get("Accept", ""))
+    return 4 if match and match.group(1) == "32" else 8
+
+
+def to_epoch_ms(ts):
+    return (ts - EPOCH) / ONE_MS
+
+
+def encode_columnar(timestamps, columns, meta=None, width=8):
+    """
+    timestamps: datetimes (naive, as stored) or epoch-ms numbers
+    columns: {name: sequence of numbers or None}
+    """
+    n = len(timestamps)
+    names = list(columns)
+    meta = dict(meta or {}, columns=names)
+    meta_bytes = json.dumps(meta, default=str).encode("utf-8")
+    meta_bytes += b" " * (-(16 + len(meta_bytes)) % 8)
+
+    ts = array("d", (to_epoch_ms(t) if isinstance(t, datetime) else float(t) for t in timestamps))
+    typecode = "f" if width == 4 else "d"
+    value_arrays = [
+        array(typecode, (NAN if v is None else float(v) for v in columns[name]))
+        for name in names
+    ]
+    if sys.byteorder != "little":
+        for arr in [ts, *value_arrays]:
+            arr.byteswap()
+
+    parts = [struct.pack("<4sBBHII", MAGIC, VERSION, width, len(names), n, len(meta_bytes)),
+             meta_bytes, ts.tobytes()]
+    parts.extend(arr.tobytes() for arr in value_arrays)
+    return b"".join(parts)
+
+
+def columnar_response(timestamps, columns, meta=None, status=200):
+    body = encode_columnar(timestamps, columns, meta, width=requested_width())
+    response = Response(body, status=status, mimetype=COLUMNAR_MIME)
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,108 @@
+import math
+
+# Geohash helpers for viewport queries. AqiInScrapeLatest stores
+# ST_GeoHash(lon, lat, GEOHASH_PRECISION) in an indexed column, so a
+# bounding box can be answered with a handful of index range scans over
+# the geohash cells that cover it.
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+
+# Upper bound on cells used to cover one bounding box
+MAX_COVER_CELLS = 16
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    n_bits = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = bits * 2 + 1
+                lon_lo = mid
+            else:
+                bits = bits * 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = bits * 2 + 1
+                lat_lo = mid
+            else:
+                bits = bits * 2
+                lat_hi = mid
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            n_bits = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(lat_height, lon_width) in degrees of a geohash cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _cells_needed(min_lat, max_lat, min_lon, max_lon, precision):
+    lat_h, lon_w = cell_size(precision)
+    rows = math.floor(max_lat / lat_h) - math.floor(min_lat / lat_h) + 1
+    cols = math.floor(max_lon / lon_w) - math.floor(min_lon / lon_w) + 1
+    return rows * cols
+
+
+def cover(min_lat, max_lat, min_lon, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose cells together cover the bounding box, using the
+    finest precision that needs at most `max_cells` cells.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+
+    precision = 1
+    while (precision < GEOHASH_PRECISION and
+           _cells_needed(min_lat, max_lat, min_lon, max_lon, precision + 1) <= max_cells):
+        precision += 1
+
+    lat_h, lon_w = cell_size(precision)
+    prefixes = set()
+    lat = (math.floor(min_lat / lat_h) + 0.5) * lat_h
+    while lat - lat_h / 2 <= max_lat:
+        lon = (math.floor(min_lon / lon_w) + 0.5) * lon_w
+        while lon - lon_w / 2 <= max_lon:
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                prefixes.add(encode(lat, lon, precision))
+            lon += lon_w
+        lat += lat_h
+    return sorted(prefixes)
+
+
+def _next_prefix(prefix):
+    """Smallest string greater than every string starting with `prefix`."""
+    prefix = prefix.rstrip(BASE32[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def cover_ranges(min_lat, max_lat, min_lon, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    The cover as half-open [low, high) string ranges on the geohash column,
+    merging cells that are adjacent in geohash order. `high` is None when
+    the range runs to the end of the keyspace.
+    """
+    ranges = []
+    for prefix in cover(min_lat, max_lat, min_lon, max_lon, max_cells):
+        high = _next_prefix(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((prefix, high))
+    return ranges
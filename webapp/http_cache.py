@@ -0,0 +1,189 @@
+import os
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import request, make_response
+from mysql.connector import Error
+from db import get_connection
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# HTTP caching and compression of API responses:
+#   HTTP_CACHE_MAX_AGE      seconds browsers may reuse a response without asking (0: always revalidate)
+#   HTTP_COMPRESS_MIN_SIZE  bodies smaller than this many bytes are sent as is
+#   HTTP_COMPRESS_LEVEL     gzip level (1-9); brotli uses HTTP_BROTLI_QUALITY (0-11)
+#   HTTP_VALIDATOR_KEYS     responses whose Last-Modified time is remembered (LRU)
+MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+COMPRESS_MIN_SIZE = int(os.getenv("HTTP_COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_LEVEL = int(os.getenv("HTTP_COMPRESS_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+VALIDATOR_KEYS = int(os.getenv("HTTP_VALIDATOR_KEYS", "4096"))
+
+_lock = threading.Lock()
+# response key -> (etag, last_modified) of the newest version seen
+_seen = OrderedDict()
+_stats = {
+    "not_modified": 0,
+    "validated": 0,
+    "marker_errors": 0,
+    "compressed": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+
+
+def _count(counter, n=1):
+    with _lock:
+        _stats[counter] += n
+
+
+def marker_query(query, params=()):
+    """Run a cheap change-marker query on a pooled connection; returns its first row."""
+    connection = get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+    finally:
+        connection.close()
+
+
+def _last_modified(key, etag):
+    """
+    Time this process first served `etag` for `key`. Markers are ids and
+    versions, not times, so Last-Modified is derived from when a new
+    marker was first seen; it only ever moves forward, one second at a
+    time at least, so If-Modified-Since never hides a newer version.
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    with _lock:
+        seen = _seen.get(key)
+        if seen is None or seen[0] != etag:
+            last = now if seen is None else max(now, seen[1] + timedelta(seconds=1))
+            seen = (etag, last)
+        _seen[key] = seen
+        _seen.move_to_end(key)
+        while len(_seen) > VALIDATOR_KEYS:
+            _seen.popitem(last=False)
+    return seen[1]
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = f"max-age={MAX_AGE}, must-revalidate"
+    response.vary.add("Accept")
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified <= since
+
+
+def conditional(marker):
+    """
+    Decorator answering conditional GETs without running the view.
+
+    marker(**view_args) returns a small tuple that changes whenever the
+    response would (a max id, a version number), or None when no cheap
+    marker is available. The ETag hashes it together with the endpoint,
+    its arguments, the query string and the Accept header, so every
+    variant of the response has its own validator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                parts = marker(**kwargs)
+            except Error as e:
+                _count("marker_errors")
+                logger.warning(f"Change marker of {request.endpoint} failed: {e}")
+                parts = None
+            if parts is None:
+                return view(*args, **kwargs)
+
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   request.query_string, request.headers.get("Accept", ""))
+            etag = hashlib.blake2b(repr((key, parts)).encode(), digest_size=12).hexdigest()
+            last_modified = _last_modified(key, etag)
+
+            if _not_modified(etag, last_modified):
+                _count("not_modified")
+                response = make_response("", 304)
+                _set_validators(response, etag, last_modified)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _count("validated")
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def _choose_encoding():
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress_response(response):
+    """
+    after_request hook: gzip or brotli encode large bodies when the client
+    accepts it. Streams (SSE) and already encoded responses pass through.
+    """
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype == "text/event-stream"):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add("Accept-Encoding")
+
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    start = time.perf_counter()
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    with _lock:
+        _stats["compressed"] += 1
+        _stats["bytes_in"] += len(body)
+        _stats["bytes_out"] += len(compressed)
+    logger.debug(f"{request.endpoint}: {encoding} {len(body)} -> {len(compressed)} bytes, "
+                 f"saved {len(body) - len(compressed)} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return response
+
+
+def http_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["validator_keys"] = len(_seen)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    stats["compression_ratio"] = round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else None
+    stats["brotli"] = brotli is not None
+    return stats
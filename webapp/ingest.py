@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from store import measurement_table, insert_readings
+
+
+def parse_timestamp(value):
+    """
+    Accept None/"" (store the current DB time), an ISO-8601 / MySQL
+    'YYYY-MM-DD HH:MM:SS' string, or epoch seconds. Naive strings are
+    stored as given; epoch seconds and strings with a UTC offset come back
+    timezone-aware and are converted to the database's time zone on write
+    (see resolve_timestamps). Raises ValueError.
+    """
+    if value is None or value == "":
+        return None
+    # bool is an int subclass, and True would otherwise mean 1970
+    if isinstance(value, bool):
+        raise ValueError("timestamp must not be a boolean")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def parse_reading(item):
+    """
+    Validate one reading dict of a batch upload.
+    Returns ((node_id, sensor_id, measurement_id), timestamp, value).
+    """
+    if not isinstance(item, dict):
+        raise ValueError("reading must be an object")
+    missing = [k for k in ("node_id", "sensor_id", "measurement_id", "value") if k not in item]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    try:
+        key = (str(item["node_id"]), int(item["sensor_id"]), int(item["measurement_id"]))
+    except (TypeError, ValueError):
+        raise ValueError("sensor_id and measurement_id must be integers")
+    try:
+        value = float(item["value"])
+    except (TypeError, ValueError):
+        raise ValueError("value must be a number")
+    try:
+        timestamp = parse_timestamp(item.get("timestamp"))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError("invalid timestamp")
+    return key, timestamp, value
+
+
+def known_measurements(cursor, node_ids):
+    """(node_id, sensor_id, measurement_id) triples registered in Sensor."""
+    node_ids = sorted(set(node_ids))
+    if not node_ids:
+        return set()
+    cursor.execute(f"""
+        SELECT node_id, sensor_id, measurement_id FROM Sensor
+        WHERE node_id IN ({", ".join(["%s"] * len(node_ids))})
+    """, tuple(node_ids))
+    return {(str(row[0]), int(row[1]), int(row[2])) for row in cursor.fetchall()}
+
+
+def db_now(cursor):
+    cursor.execute("SELECT NOW()")
+    return cursor.fetchone()[0]
+
+
+def db_utc_offset(cursor):
+    """Offset of the session time zone, which NOW() and stored timestamps use."""
+    cursor.execute("SELECT TIMESTAMPDIFF(SECOND, UTC_TIMESTAMP(), NOW())")
+    return timedelta(seconds=cursor.fetchone()[0])
+
+
+def resolve_timestamps(cursor, grouped):
+    """
+    Turn the timestamps of grouped into naive database times, in place:
+    missing ones get NOW(), like the CURRENT_TIMESTAMP default of the
+    single-reading endpoint, and timezone-aware ones are shifted into the
+    session time zone. Naive ones are kept as given.
+    """
+    now = offset = None
+    for key, rows in grouped.items():
+        if any(ts is None for ts, _ in rows):
+            now = now or db_now(cursor)
+        if offset is None and any(ts is not None and ts.tzinfo is not None for ts, _ in rows):
+            offset = db_utc_offset(cursor)
+        if now is not None or offset is not None:
+            grouped[key] = [(_to_db_time(ts, now, offset), value) for ts, value in rows]
+
+
+def _to_db_time(ts, now, offset):
+    if ts is None:
+        return now
+    if ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) + offset
+
+
+def write_grouped(cursor, grouped):
+    """
+    grouped: {(node_id, sensor_id, measurement_id): [(timestamp|None, value), ...]}
+    Timestamps are resolved with resolve_timestamps() in grouped itself,
+    so callers can publish what was stored.
+    """
+    resolve_timestamps(cursor, grouped)
+    written = 0
+    for key, rows in grouped.items():
+        insert_readings(cursor, key, rows)
+        written += len(rows)
+    return written
@@ -0,0 +1,132 @@
+import os
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# In-process fan-out of newly stored readings to live plot pages:
+#   LIVE_BUFFER_SIZE        readings held per subscriber before the oldest are dropped
+#   LIVE_MAX_SUBSCRIBERS    open streams per process; further clients keep polling
+#   LIVE_KEEPALIVE          seconds between keepalive comments on an idle stream
+#
+# Every open stream occupies one worker thread for as long as the page is
+# open, so LIVE_MAX_SUBSCRIBERS must stay well below the threads of a
+# worker process (mod_wsgi defaults to 15 per daemon process) or streams
+# starve ingest and page requests. Raise it only together with the thread
+# count (WSGIDaemonProcess threads=...) or on a threaded/async server.
+#
+# Only readings ingested by this process are published, so with several
+# worker processes a stream misses uploads handled by the others; plot.js
+# keeps a slow cursor poll running next to the stream to catch those.
+BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", "1000"))
+MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "4"))
+KEEPALIVE = float(os.getenv("LIVE_KEEPALIVE", "15"))
+
+_lock = threading.Lock()
+_subscribers = {}
+_stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+
+class Subscription:
+    """
+    Bounded buffer of readings for one stream. A slow client never blocks
+    ingest: when the buffer is full the oldest readings are discarded and
+    the subscription is marked lagged, so the client can reload instead.
+    """
+
+    def __init__(self, node_id, size):
+        self.node_id = node_id
+        self.buffer = deque()
+        self.size = size
+        self.lagged = False
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, readings):
+        with self.cond:
+            dropped = max(0, len(self.buffer) + len(readings) - self.size)
+            for _ in range(min(dropped, len(self.buffer))):
+                self.buffer.popleft()
+            self.buffer.extend(readings[-self.size:])
+            if dropped:
+                self.lagged = True
+            self.cond.notify()
+        return dropped
+
+    def get(self, timeout):
+        """
+        Wait up to timeout for readings. Returns (readings, lagged); both are
+        reset, so the next call only sees what arrived afterwards.
+        """
+        with self.cond:
+            if not self.buffer and not self.lagged and not self.closed:
+                self.cond.wait(timeout)
+            readings = list(self.buffer)
+            self.buffer.clear()
+            lagged, self.lagged = self.lagged, False
+        return readings, lagged
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+
+def subscribe(node_id):
+    """Register a stream for node_id, or return None when the process is at capacity."""
+    with _lock:
+        if sum(len(subs) for subs in _subscribers.values()) >= MAX_SUBSCRIBERS:
+            return None
+        sub = Subscription(node_id, BUFFER_SIZE)
+        _subscribers.setdefault(node_id, set()).add(sub)
+    return sub
+
+
+def unsubscribe(sub):
+    sub.close()
+    with _lock:
+        subs = _subscribers.get(sub.node_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del _subscribers[sub.node_id]
+
+
+def publish(grouped):
+    """
+    Hand freshly committed readings to the streams of their nodes.
+    grouped: {(node_id, sensor_id, measurement_id): [(timestamp, value), ...]}
+    """
+    by_node = {}
+    for (node_id, sensor_id, measurement_id), rows in grouped.items():
+        by_node.setdefault(node_id, []).extend(
+            (sensor_id, measurement_id, timestamp, value) for timestamp, value in rows
+        )
+
+    with _lock:
+        targets = [(list(_subscribers.get(node_id, ())), readings) for node_id, readings in by_node.items()]
+
+    published = delivered = dropped = 0
+    for subs, readings in targets:
+        published += len(readings)
+        for sub in subs:
+            dropped += sub.put(readings)
+            delivered += len(readings)
+    if dropped:
+        logger.warning(f"Live streams lagging, dropped {dropped} readings")
+
+    with _lock:
+        _stats["published"] += published
+        _stats["delivered"] += delivered
+        _stats["dropped"] += dropped
+
+
+def pubsub_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["subscribers"] = sum(len(subs) for subs in _subscribers.values())
+        stats["nodes"] = len(_subscribers)
+    stats["max_subscribers"] = MAX_SUBSCRIBERS
+    stats["buffer_size"] = BUFFER_SIZE
+    return stats
@@ -0,0 +1,180 @@
+import os
+import time
+import logging
+import threading
+from mysql.connector import Error
+from db import get_connection
+import store
+
+logger = logging.getLogger(__name__)
+
+# In-memory copy of the Node and Sensor tables, plus which series have
+# storage and rollups. Provisioning scripts bump RegistryVersion; every
+# worker re-reads the version at most once per REGISTRY_CHECK_INTERVAL
+# seconds and reloads when it changed.
+VERSION_TABLE = "RegistryVersion"
+CHECK_INTERVAL = float(os.getenv("REGISTRY_CHECK_INTERVAL", "10"))
+
+CREATE_VERSION_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+        id TINYINT PRIMARY KEY,
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+"""
+
+# MySQL error for a missing table
+NO_SUCH_TABLE = 1146
+
+
+def bump_version(cursor):
+    """Tell every worker to reload; call in the provisioning transaction."""
+    query = f"""
+        INSERT INTO {VERSION_TABLE} (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """
+    try:
+        cursor.execute(query)
+    except Error as e:
+        if e.errno != NO_SUCH_TABLE:
+            raise
+        cursor.execute(CREATE_VERSION_TABLE)
+        cursor.execute(query)
+
+
+def read_version(cursor):
+    """Current registry version, or None before the version table exists."""
+    try:
+        cursor.execute(f"SELECT version FROM {VERSION_TABLE} WHERE id = 1")
+    except Error as e:
+        if e.errno != NO_SUCH_TABLE:
+            raise
+        return None
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def load_snapshot(cursor, version):
+    cursor.execute("SELECT node_id, location, latitude, longitude FROM Node")
+    nodes = {
+        str(row[0]): {"location": row[1], "latitude": float(row[2]), "longitude": float(row[3])}
+        for row in cursor.fetchall()
+    }
+
+    cursor.execute("""
+        SELECT node_id, sensor_id, measurement_id, measurement_name, unit, sensor_type, sensor_model
+        FROM Sensor ORDER BY node_id, sensor_id, measurement_id
+    """)
+    measurements = {}
+    for row in cursor.fetchall():
+        measurements.setdefault(str(row[0]), []).append({
+            "sensor_id": int(row[1]),
+            "measurement_id": int(row[2]),
+            "measurement_name": row[3],
+            "unit": row[4],
+            "sensor_type": row[5],
+            "sensor_model": row[6],
+        })
+
+    keys = [(node_id, m["sensor_id"], m["measurement_id"])
+            for node_id, items in measurements.items() for m in items]
+    stored, rolled = store.provisioned(cursor, keys)
+    return {
+        "version": version,
+        "nodes": nodes,
+        "measurements": measurements,
+        "stored": frozenset(stored),
+        "rolled": frozenset(rolled),
+    }
+
+
+class Registry:
+    """
+    Snapshot of node metadata shared by all requests of a worker. Readers
+    get an immutable snapshot; a reload replaces it as a whole.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"loads": 0, "checks": 0, "errors": 0}
+
+    def _due(self):
+        return self._snapshot is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    def snapshot(self):
+        if not self._due():
+            return self._snapshot
+        with self._lock:
+            if not self._due():
+                return self._snapshot
+            connection = None
+            cursor = None
+            try:
+                connection = get_connection()
+                cursor = connection.cursor()
+                version = read_version(cursor)
+                self._counters["checks"] += 1
+                # Without a version table there is nothing to compare, so reload
+                if self._snapshot is None or version is None or version != self._snapshot["version"]:
+                    self._snapshot = load_snapshot(cursor, version)
+                    self._counters["loads"] += 1
+                    logger.info(f"Loaded registry version {version}: {len(self._snapshot['nodes'])} nodes")
+                self._checked_at = time.monotonic()
+            except Error as e:
+                self._counters["errors"] += 1
+                if self._snapshot is None:
+                    raise
+                logger.error(f"Registry refresh failed, keeping version {self._snapshot['version']}: {e}")
+            finally:
+                if cursor:
+                    cursor.close()
+                if connection:
+                    connection.close()
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["version"] = self._snapshot["version"] if self._snapshot else None
+        stats["check_interval"] = self.check_interval
+        return stats
+
+
+registry = Registry(CHECK_INTERVAL)
+
+
+def nodes():
+    """{node_id: {"location", "latitude", "longitude"}}"""
+    return registry.snapshot()["nodes"]
+
+
+def node_measurements(node_id):
+    """Sensor rows of one node, ordered by sensor_id and measurement_id."""
+    return registry.snapshot()["measurements"].get(str(node_id), [])
+
+
+def node_keys(node_id):
+    return [(str(node_id), m["sensor_id"], m["measurement_id"]) for m in node_measurements(node_id)]
+
+
+def provisioned(keys):
+    """Same split as store.provisioned(), answered from the snapshot."""
+    snapshot = registry.snapshot()
+    keys = list(keys)
+    return ({key for key in keys if key in snapshot["stored"]},
+            {key for key in keys if key in snapshot["rolled"]})
+
+
+def version():
+    return registry.snapshot()["version"]
+
+
+def registry_stats():
+    return registry.stats()
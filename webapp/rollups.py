@@ -0,0 +1,269 @@
+import logging
+from mysql.connector import errors
+
+logger = logging.getLogger(__name__)
+
+# Every {node}_{sensor}_{measurement} table has two summary tables next to it,
+# {table}_hourly and {table}_daily, holding min/max/sum/count per bucket plus
+# the number of readings in each AQI band. They are kept up to date by
+# update_rollups() on ingest and rebuilt from raw data by backfill_rollups().
+ROLLUP_PERIODS = {
+    "hourly": ("DATETIME", "%Y-%m-%d %H:00:00"),
+    "daily": ("DATE", "%Y-%m-%d"),
+}
+
+# Same thresholds as the homepage category breakdown, as SQL for backfills
+# and as Python for folding in freshly ingested rows
+AQI_BANDS = {
+    "good_count": "{v} < 50",
+    "moderate_count": "{v} >= 50 AND {v} <= 100",
+    "unhealthy_count": "{v} > 100 AND {v} <= 200",
+    "hazardous_count": "{v} > 200",
+}
+AQI_BAND_TESTS = [
+    lambda v: v < 50,
+    lambda v: 50 <= v <= 100,
+    lambda v: 100 < v <= 200,
+    lambda v: v > 200,
+]
+
+# Minute aggregates are only written by the retention job for the raw rows
+# it removes (see db_scripts/compact_measurements.py), not on ingest
+MINUTE_PERIODS = {
+    "minute": ("DATETIME", "%Y-%m-%d %H:%i:00"),
+}
+
+BUCKET_KEYS = {
+    "minute": lambda ts: ts.replace(second=0, microsecond=0),
+    "hourly": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "daily": lambda ts: ts.date(),
+}
+
+ER_NO_SUCH_TABLE = 1146
+
+# Rollups of the consolidated Measurement table hold every series in one
+# table, so their rows are prefixed with the series key
+SERIES_KEY = ("node_id", "sensor_id", "measurement_id")
+SERIES_KEY_DDL = "node_id VARCHAR(50) NOT NULL, sensor_id INT NOT NULL, measurement_id INT NOT NULL"
+
+
+def window_start_sql(interval_hours, period):
+    """
+    SQL for the first bucket of `period` overlapping the last
+    `interval_hours` hours. Compared with >=, the rollups then cover the
+    partial first hour or day that the raw `timestamp >= NOW() - INTERVAL`
+    window reads as well.
+    """
+    start = f"NOW() - INTERVAL {int(interval_hours)} HOUR"
+    if period == "daily":
+        return f"DATE({start})"
+    return f"DATE_FORMAT({start}, '{ROLLUP_PERIODS['hourly'][1]}')"
+
+
+def rollup_table(table, period):
+    return f"{table}_{period}"
+
+
+def rollup_tables(table):
+    return [rollup_table(table, period) for period in ROLLUP_PERIODS]
+
+
+def has_rollups(cursor, table):
+    names = rollup_tables(table)
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({", ".join(["%s"] * len(names))})
+    """, tuple(names))
+    return cursor.fetchone()[0] == len(names)
+
+
+def create_rollup_tables(cursor, table, keyed=False, periods=ROLLUP_PERIODS):
+    band_cols = ",\n        ".join(f"{col} INT NOT NULL DEFAULT 0" for col in AQI_BANDS)
+    for period, (bucket_type, _) in periods.items():
+        if keyed:
+            bucket_cols = f"{SERIES_KEY_DDL},\n        bucket {bucket_type} NOT NULL"
+            primary_key = f",\n        PRIMARY KEY ({', '.join(SERIES_KEY)}, bucket)"
+        else:
+            bucket_cols = f"bucket {bucket_type} PRIMARY KEY"
+            primary_key = ""
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS {rollup_table(table, period)} (
+        {bucket_cols},
+        min_value DOUBLE NOT NULL,
+        max_value DOUBLE NOT NULL,
+        sum_value DOUBLE NOT NULL,
+        count INT NOT NULL,
+        {band_cols}{primary_key}
+        );""")
+
+
+def _merge_sql():
+    cols = ["min_value = LEAST(min_value, VALUES(min_value))",
+            "max_value = GREATEST(max_value, VALUES(max_value))",
+            "sum_value = sum_value + VALUES(sum_value)",
+            "count = count + VALUES(count)"]
+    cols += [f"{col} = {col} + VALUES({col})" for col in AQI_BANDS]
+    return ", ".join(cols)
+
+
+def _overwrite_sql():
+    return ", ".join(
+        f"{col} = VALUES({col})"
+        for col in ["min_value", "max_value", "sum_value", "count", *AQI_BANDS]
+    )
+
+
+def _aggregate(rows, bucket_key):
+    buckets = {}
+    for ts, value in rows:
+        key = bucket_key(ts)
+        agg = buckets.get(key)
+        if agg is None:
+            agg = buckets[key] = [value, value, 0.0, 0] + [0] * len(AQI_BAND_TESTS)
+        agg[0] = min(agg[0], value)
+        agg[1] = max(agg[1], value)
+        agg[2] += value
+        agg[3] += 1
+        for i, test in enumerate(AQI_BAND_TESTS):
+            if test(value):
+                agg[4 + i] += 1
+    return [(key, *agg) for key, agg in buckets.items()]
+
+
+def update_rollups(cursor, table, rows, key=None, periods=ROLLUP_PERIODS):
+    """
+    Fold freshly inserted raw rows into the rollups of `periods` (hourly
+    and daily unless given).
+
+    rows: iterable of (timestamp, value) with datetime timestamps. Rows are
+    pre-aggregated per bucket so a batch costs one multi-row upsert per
+    period. Runs on the caller's cursor so it commits together with the raw
+    insert. Tables that have not been backfilled yet are skipped with a
+    warning instead of failing the ingest. `key` is the series key for the
+    keyed rollups of the consolidated table.
+    """
+    rows = [(ts, float(value)) for ts, value in rows]
+    if not rows:
+        return
+
+    prefix = tuple(key) if key else ()
+    cols = [*SERIES_KEY[:len(prefix)], "bucket", "min_value", "max_value", "sum_value", "count", *AQI_BANDS]
+    placeholders = ", ".join(["%s"] * len(cols))
+    for period in periods:
+        query = f"""
+            INSERT INTO {rollup_table(table, period)} ({", ".join(cols)})
+            VALUES ({placeholders})
+            ON DUPLICATE KEY UPDATE {_merge_sql()}
+        """
+        try:
+            cursor.executemany(query, [prefix + agg for agg in _aggregate(rows, BUCKET_KEYS[period])])
+        except errors.ProgrammingError as e:
+            if e.errno != ER_NO_SUCH_TABLE:
+                raise
+            logger.warning(f"Rollup table for {table} missing, run backfill_rollups.py")
+            return
+
+
+def backfill_rollups(cursor, table, key=None, since=None):
+    """
+    Recompute the rollups of `table` from its raw rows. Existing buckets are
+    overwritten, so this is safe to re-run; readings ingested while it runs
+    may need another pass. With `key`, only that series of the consolidated
+    table is recomputed. With `since` (an hour boundary), only hourly
+    buckets from then on and daily buckets from its date on are rebuilt;
+    the daily ones are summed from the hourly rollup, so earlier hours of
+    that day must already be in place. Returns the number of hourly
+    buckets rebuilt.
+    """
+    create_rollup_tables(cursor, table, keyed=key is not None)
+    key_cols = "".join(f"{col}, " for col in SERIES_KEY) if key else ""
+    raw_where = [f"{col} = %s" for col in SERIES_KEY] if key else []
+    hourly_where = list(raw_where)
+    params = tuple(key) if key else ()
+    raw_params = hourly_params = params
+    if since is not None:
+        raw_where.append("timestamp >= %s")
+        raw_params = params + (since,)
+        hourly_where.append("bucket >= DATE(%s)")
+        hourly_params = params + (since,)
+    band_cols = ", ".join(AQI_BANDS)
+    overwrite = _overwrite_sql()
+
+    _, hourly_fmt = ROLLUP_PERIODS["hourly"]
+    band_sums = ", ".join(f"SUM({expr.format(v='value')})" for expr in AQI_BANDS.values())
+    cursor.execute(f"""
+        INSERT INTO {rollup_table(table, 'hourly')}
+            ({key_cols}bucket, min_value, max_value, sum_value, count, {band_cols})
+        SELECT {key_cols}DATE_FORMAT(timestamp, '{hourly_fmt}') AS b,
+               MIN(value), MAX(value), SUM(value), COUNT(*), {band_sums}
+        FROM {table}
+        {"WHERE " + " AND ".join(raw_where) if raw_where else ""}
+        GROUP BY {key_cols}b
+        ON DUPLICATE KEY UPDATE {overwrite}
+    """, raw_params)
+    # rowcount of an upsert counts changed buckets twice and unchanged ones
+    # not at all, so count the buckets themselves
+    cursor.execute(f"""
+        SELECT COUNT(DISTINCT DATE_FORMAT(timestamp, '{hourly_fmt}'))
+        FROM {table}
+        {"WHERE " + " AND ".join(raw_where) if raw_where else ""}
+    """, raw_params)
+    hours = cursor.fetchone()[0]
+
+    hourly_band_sums = ", ".join(f"SUM({col})" for col in AQI_BANDS)
+    cursor.execute(f"""
+        INSERT INTO {rollup_table(table, 'daily')}
+            ({key_cols}bucket, min_value, max_value, sum_value, count, {band_cols})
+        SELECT {key_cols}DATE(bucket) AS b,
+               MIN(min_value), MAX(max_value), SUM(sum_value), SUM(count), {hourly_band_sums}
+        FROM {rollup_table(table, 'hourly')}
+        {"WHERE " + " AND ".join(hourly_where) if hourly_where else ""}
+        GROUP BY {key_cols}b
+        ON DUPLICATE KEY UPDATE {overwrite}
+    """, hourly_params)
+    return hours
+
+
+def copy_rollups(cursor, source, target, key, period, where="", params=()):
+    """
+    Copy the buckets of an unkeyed rollup (`source`'s `period` table) into
+    the keyed rollup of `target` under series `key`, overwriting buckets
+    already there. `where` filters the source buckets. Returns rows affected.
+    """
+    cols = ["bucket", "min_value", "max_value", "sum_value", "count", *AQI_BANDS]
+    cursor.execute(f"""
+        INSERT INTO {rollup_table(target, period)} ({", ".join(SERIES_KEY)}, {", ".join(cols)})
+        SELECT %s, %s, %s, {", ".join(cols)}
+        FROM {rollup_table(source, period)}
+        {"WHERE " + where if where else ""}
+        ON DUPLICATE KEY UPDATE {_overwrite_sql()}
+    """, (*key, *params))
+    return cursor.rowcount
+
+
+def bucket_stats_sql(table, interval_hours, hourly, series_filter=None):
+    """
+    SELECT over the rollups of `table` producing the same columns as the
+    raw bucket query in store.bucket_stats_query: bucket, total, cnt and the
+    four category counts. Hourly views bucket by hour of day, longer views
+    by date. `series_filter` is an extra SQL condition for keyed rollups.
+    """
+    band_sums = ", ".join(f"SUM({col}) AS {col.replace('_count', '')}" for col in AQI_BANDS)
+    if hourly:
+        source = rollup_table(table, "hourly")
+        bucket_expr = "HOUR(bucket)"
+        window = f"bucket >= {window_start_sql(interval_hours, 'hourly')}"
+    else:
+        source = rollup_table(table, "daily")
+        bucket_expr = "bucket"
+        window = f"bucket >= {window_start_sql(interval_hours, 'daily')}"
+    if series_filter:
+        window += f" AND {series_filter}"
+    return f"""
+        SELECT {bucket_expr} AS bucket,
+               SUM(sum_value) AS total,
+               SUM(count) AS cnt,
+               {band_sums}
+        FROM {source}
+        WHERE {window}
+        GROUP BY {bucket_expr}
+    """
@@ -0,0 +1,157 @@
+import math
+from datetime import datetime
+import store
+
+# Hard caps so a single request can never pull a whole table
+MAX_POINTS = 5000
+MAX_ROWS = 10000
+
+
+def parse_time(value):
+    """Parse an ISO-8601 query parameter; None when absent or malformed."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _raw_rows(cursor, query, params):
+    cursor.execute(query, params)
+    return [{"id": row[0], "timestamp": row[1], "value": row[2]} for row in cursor.fetchall()]
+
+
+def _where(clauses):
+    return ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+
+def _series(key, column=None, start=None, end=None):
+    """FROM table, WHERE clause and params for one series, optionally time-bounded."""
+    table, clauses, params = store.source(key)
+    range_clauses, range_params = _range_clauses(column or "timestamp", start, end)
+    return table, _where(clauses + range_clauses), tuple(params) + range_params
+
+
+def tail(cursor, key, limit):
+    """The last `limit` raw rows, oldest first."""
+    table, where, params = _series(key)
+    rows = _raw_rows(cursor, f"""
+        SELECT id, timestamp, value FROM {table} {where} ORDER BY id DESC LIMIT %s
+    """, params + (min(limit, MAX_ROWS),))
+    rows.reverse()
+    return rows
+
+
+def since(cursor, key, last_id):
+    """Raw rows stored after the row with id `last_id`."""
+    table, clauses, params = store.source(key)
+    return _raw_rows(cursor, f"""
+        SELECT id, timestamp, value FROM {table} {_where(clauses + ["id > %s"])} ORDER BY id LIMIT %s
+    """, tuple(params) + (last_id, MAX_ROWS))
+
+
+def in_range(cursor, key, start=None, end=None):
+    """Raw rows with start <= timestamp <= end, capped at MAX_ROWS."""
+    table, where, params = _series(key, "timestamp", start, end)
+    return _raw_rows(cursor, f"""
+        SELECT id, timestamp, value FROM {table} {where} ORDER BY timestamp LIMIT %s
+    """, params + (MAX_ROWS,))
+
+
+def all_rows(cursor, key):
+    """Every raw row of the series (legacy unbounded dump)."""
+    table, where, params = _series(key)
+    return _raw_rows(cursor, f"SELECT id, timestamp, value FROM {table} {where}", params)
+
+
+def time_range(cursor, key, start=None, end=None):
+    table, where, params = _series(key, "timestamp", start, end)
+    cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {table} {where}", params)
+    return cursor.fetchone()
+
+
+def _range_clauses(column, start, end):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{column} <= %s")
+        params.append(end)
+    return clauses, tuple(params)
+
+
+def downsample(cursor, key, start, end, points, use_rollup=False, use_minutes=False):
+    """
+    Min/avg/max per time bucket so that [start, end] is covered by roughly
+    `points` buckets. Buckets of an hour or more are computed from the
+    hourly rollup when `use_rollup` is set. With `use_minutes`, minute
+    buckets left behind by the retention job are merged with the raw rows
+    that are still kept.
+    """
+    points = max(1, min(points, MAX_POINTS))
+    span = max((end - start).total_seconds(), 1)
+    bucket_s = max(1, math.ceil(span / points))
+
+    if use_rollup and bucket_s >= 3600:
+        bucket_s = math.ceil(bucket_s / 3600) * 3600
+        table, clauses, params = store.rollup_source(key, "hourly")
+        range_clauses, range_params = _range_clauses(
+            "bucket", start.replace(minute=0, second=0, microsecond=0), end
+        )
+        query = f"""
+            SELECT FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(bucket) / {bucket_s}) * {bucket_s}) AS b,
+                   SUM(sum_value) / SUM(count), MIN(min_value), MAX(max_value)
+            FROM {table}
+            {_where(clauses + range_clauses)}
+            GROUP BY b
+            ORDER BY b
+        """
+        params = tuple(params) + range_params
+    elif use_minutes and bucket_s >= 60:
+        bucket_s = math.ceil(bucket_s / 60) * 60
+        # Compacted raw rows only survive as minute buckets, so the two
+        # sources never overlap
+        minute_table, minute_clauses, minute_params = store.rollup_source(key, "minute")
+        range_clauses, range_params = _range_clauses(
+            "bucket", start.replace(second=0, microsecond=0), end
+        )
+        table, where, params = _series(key, "timestamp", start, end)
+        query = f"""
+            SELECT FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(t) / {bucket_s}) * {bucket_s}) AS b,
+                   SUM(s) / SUM(c), MIN(lo), MAX(hi)
+            FROM (
+                SELECT bucket AS t, sum_value AS s, count AS c, min_value AS lo, max_value AS hi
+                FROM {minute_table}
+                {_where(minute_clauses + range_clauses)}
+                UNION ALL
+                SELECT timestamp, value, 1, value, value
+                FROM {table}
+                {where}
+            ) merged
+            GROUP BY b
+            ORDER BY b
+        """
+        params = tuple(minute_params) + range_params + params
+    else:
+        table, where, params = _series(key, "timestamp", start, end)
+        query = f"""
+            SELECT FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(timestamp) / {bucket_s}) * {bucket_s}) AS b,
+                   AVG(value), MIN(value), MAX(value)
+            FROM {table}
+            {where}
+            GROUP BY b
+            ORDER BY b
+        """
+    cursor.execute(query, params)
+    return [
+        {"timestamp": row[0], "value": float(row[1]), "min": row[2], "max": row[3]}
+        for row in cursor.fetchall()
+    ], bucket_s
+
+
+def last_id(cursor, key):
+    table, where, params = _series(key)
+    cursor.execute(f"SELECT MAX(id) FROM {table} {where}", params)
+    return cursor.fetchone()[0] or 0
@@ -0,0 +1,133 @@
+import os
+from collections import OrderedDict
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# SVG trend paths for the homepage and node pages.
+#   SPARKLINE_PRECISION    decimals per coordinate in the path data
+#   SPARKLINE_MEMO_SIZE    rendered paths remembered (LRU)
+PRECISION = int(os.getenv("SPARKLINE_PRECISION", "2"))
+MEMO_SIZE = int(os.getenv("SPARKLINE_MEMO_SIZE", "256"))
+
+# Values closer than this render the same path, so they share a memo entry
+QUANTUM = 10 ** -PRECISION
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _quantize(values):
+    values = [v if v is not None else 0 for v in values]
+    return tuple(round(v / QUANTUM) for v in values)
+
+
+def _format(n):
+    coord = f"%.{PRECISION}f,%.{PRECISION}f"
+    return f"M{coord} " + " ".join([f"C{coord} {coord} {coord}"] * (n - 1))
+
+
+def _scaled(values, height):
+    if sum(values) == 0:
+        values = [1 for _ in values]
+    max_val = max(values)
+    return [height - (v / max_val * height + 0.000001) for v in values]
+
+
+def _paths_numpy(rows, width, height):
+    """
+    All paths of equally long series at once. rows: (m, n) array of values.
+    Each Catmull-Rom segment i uses points i-1, i, i+1, i+2 (clamped at the
+    ends), which become the Bezier controls p1 + (p2 - p0) / 6 and
+    p2 - (p3 - p1) / 6.
+    """
+    m, n = rows.shape
+    flat = rows.sum(axis=1) == 0
+    rows = np.where(flat[:, None], 1.0, rows)
+    y = height - (rows / rows.max(axis=1, keepdims=True) * height + 0.000001)
+    x = np.broadcast_to(np.arange(n) * (width / (n - 1)), (m, n))
+
+    pts = np.stack([x, y], axis=-1)                    # (m, n, 2)
+    prev = np.concatenate([pts[:, :1], pts[:, :-2]], axis=1)
+    cur = pts[:, :-1]
+    nxt = pts[:, 1:]
+    after = np.concatenate([pts[:, 2:], pts[:, -1:]], axis=1)
+    c1 = cur + (nxt - prev) / 6
+    c2 = nxt - (after - cur) / 6
+
+    segments = np.concatenate([c1, c2, nxt], axis=-1)  # (m, n-1, 6)
+    coords = np.concatenate([pts[:, 0], segments.reshape(m, -1)], axis=1)
+    fmt = _format(n)
+    return [fmt % tuple(row) for row in coords.tolist()]
+
+
+def _path_python(values, width, height):
+    n = len(values)
+    scaled = _scaled(values, height)
+    step = width / (n - 1)
+    pts = [(i * step, scaled[i]) for i in range(n)]
+    coords = [*pts[0]]
+    for i in range(n - 1):
+        p0 = pts[i - 1] if i > 0 else pts[i]
+        p1, p2 = pts[i], pts[i + 1]
+        p3 = pts[i + 2] if i + 2 < n else pts[i + 1]
+        coords += [p1[0] + (p2[0] - p0[0]) / 6, p1[1] + (p2[1] - p0[1]) / 6,
+                   p2[0] - (p3[0] - p1[0]) / 6, p2[1] - (p3[1] - p1[1]) / 6,
+                   p2[0], p2[1]]
+    return _format(n) % tuple(coords)
+
+
+def _remember(key, paths):
+    with _memo_lock:
+        _memo[key] = paths
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def generate_smooth_paths(series, width=472, height=150):
+    """
+    Render many trend lines in one call. Returns one (area_path, line_path)
+    per series, in order. Series already rendered at the same size are
+    served from the memo; the rest are computed together, one vectorized
+    pass per series length.
+    """
+    results = [None] * len(series)
+    pending = {}
+    for i, values in enumerate(series):
+        if len(values) < 2:
+            raise ValueError("Need at least 2 points")
+        key = (_quantize(values), width, height)
+        with _memo_lock:
+            hit = _memo.get(key)
+            if hit is not None:
+                _memo.move_to_end(key)
+        if hit is not None:
+            results[i] = hit
+        else:
+            pending.setdefault(key, []).append(i)
+
+    by_length = {}
+    for key in pending:
+        by_length.setdefault(len(key[0]), []).append(key)
+
+    for n, keys in by_length.items():
+        values = [[q * QUANTUM for q in key[0]] for key in keys]
+        if np is not None:
+            lines = _paths_numpy(np.array(values, dtype=float), width, height)
+        else:
+            lines = [_path_python(v, width, height) for v in values]
+        for key, line in zip(keys, lines):
+            paths = (line + f" V{height} H0 Z", line)
+            _remember(key, paths)
+            for i in pending[key]:
+                results[i] = paths
+    return results
+
+
+def generate_smooth_path(values, width=472, height=150):
+    """SVG (area_path, line_path) of a smooth Catmull-Rom curve through values."""
+    return generate_smooth_paths([values], width, height)[0]
@@ -0,0 +1,54 @@
+// Decoder for the binary time-series format served when a request sends
+// `Accept: application/vnd.aqi.columnar` (see webapp/encoding.py).
+const COLUMNAR_MIME = 'application/vnd.aqi.columnar';
+
+function decodeColumnar(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(
+        view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3)
+    );
+    if (magic !== 'AQTS') {
+        throw new Error('Not a columnar time-series payload');
+    }
+
+    const width = view.getUint8(5);
+    const columnCount = view.getUint16(6, true);
+    const rowCount = view.getUint32(8, true);
+    const metaLength = view.getUint32(12, true);
+
+    const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 16, metaLength)));
+
+    // Sections are 8-byte aligned, so the typed arrays are views, not copies
+    let offset = 16 + metaLength;
+    const timestamps = new Float64Array(buffer, offset, rowCount);
+    offset += rowCount * 8;
+
+    const ValueArray = width === 4 ? Float32Array : Float64Array;
+    const columns = {};
+    for (let i = 0; i < columnCount; i++) {
+        columns[meta.columns[i]] = new ValueArray(buffer, offset, rowCount);
+        offset += rowCount * width;
+    }
+
+    return { meta, timestamps, columns, length: rowCount };
+}
+
+// Timestamps are the stored wall-clock time; rebuild them as local Dates so
+// they plot the same way as the ISO strings of the JSON responses.
+function columnarDate(ms) {
+    const d = new Date(ms);
+    return new Date(
+        d.getUTCFullYear(), d.getUTCMonth(), d.getUTCDate(),
+        d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds(), d.getUTCMilliseconds()
+    );
+}
+
+async function fetchColumnar(url, precision = 64) {
+    const accept = precision === 32 ? `${COLUMNAR_MIME}; precision=32` : COLUMNAR_MIME;
+    const response = await fetch(url, { headers: { 'Accept': `${accept}, application/json;q=0.5` } });
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.startsWith(COLUMNAR_MIME)) {
+        return { json: await response.json() };
+    }
+    return decodeColumnar(await response.arrayBuffer());
+}
@@ -3,6 +3,13 @@ let updateIntervalId = null;
 let sensorData = {};
 let maxDataPoints = 50;
 let measurements = []; 
+let seriesState = {};
+let liveStream = null;
+let seriesIndex = {};
+let pendingReadings = {};
+// While a live stream is open, a slow cursor poll still runs to pick up
+// readings that other server processes stored (they are not pushed here)
+const catchUpInterval = 60000;
 
 for (let i = 1; i <= 20; i++) {
     sensorData[i] = {
@@ -29,56 +36,40 @@ document.addEventListener('DOMContentLoaded', function() {
 async function initializeDashboard() {
     try {
         showLoading(true);
-        const response = await fetch(`/api/get_sensor_mapping/${nodeId}`);
-        const data = await response.json();
-        const mapping_ = data.mapping;
-
-        const mapping = {};
-        for (const [key, values] of Object.entries(mapping_)) {
-            const [sensorId, measurementId] = key.split(",");
-            if (!mapping[sensorId]) mapping[sensorId] = {};
-            mapping[sensorId][measurementId] = values;
-        }
+        // Sensors, measurements and units in one request
+        const response = await fetch(`/api/node/${nodeId}/manifest`);
+        const manifest = await response.json();
 
-        const nodeResponse = await fetch(`/api/node/${nodeId}`);
-        const nodeData = await nodeResponse.json();
-        
-        if (!nodeData.sensors || !Array.isArray(nodeData.sensors)) {
-            showError('No sensors found for node 1');
+        if (!manifest.sensors || manifest.sensors.length === 0) {
+            showError(`No sensors found for node ${nodeId}`);
+            showLoading(false);
             return;
         }
-        
-        // Fetch measurements for each sensor
-        const measurementPromises = nodeData.sensors.map(async (sensorId) => {
-            try {
-                const sensorResponse = await fetch(`/api/sensor/${nodeId}/${sensorId}`);
-                const sensorData = await sensorResponse.json();
-                
-                // API returns {measurements: [id1, id2, id3, ...]}
-                if (sensorData.measurements && Array.isArray(sensorData.measurements)) {
-                    return sensorData.measurements.map(measurementId => ({
-                        nodeId: nodeId,
-                        sensorId: sensorId,
-                        measurementId: measurementId,
-                        measurementName: mapping[sensorId][measurementId][0] || '',
-                        unit: mapping[sensorId][measurementId][1] || '',
-                        sensorType: mapping[sensorId][measurementId][2] || ''
-                    }));
-                }
-                return [];
-            } catch (error) {
-                console.error(`Error fetching measurements for sensor ${sensorId}:`, error);
-                return [];
-            }
-        });
-        
-        const allMeasurements = await Promise.all(measurementPromises);
-        measurements = allMeasurements.flat();
+
+        measurements = manifest.sensors.flatMap(sensor =>
+            sensor.measurements.map(m => ({
+                nodeId: nodeId,
+                sensorId: sensor.sensor_id,
+                measurementId: m.measurement_id,
+                measurementName: m.name || '',
+                unit: m.unit || '',
+                sensorType: sensor.sensor_type || '',
+                latest: m.latest
+            }))
+        );
         
         console.log('Total measurements found:', measurements.length);
         
         createGraphs();
-        
+
+        // Subscribe before loading so readings stored meanwhile are not missed
+        measurements.forEach((m, index) => {
+            seriesIndex[`${m.sensorId},${m.measurementId}`] = index;
+        });
+        if (autoUpdate) {
+            openLiveStream();
+        }
+
         await loadAllMeasurementData();
         
         showLoading(false);
@@ -113,6 +104,9 @@ function createMeasurementCard(measurement, index) {
     card.className = 'sensor-card';
     card.id = `measurement-card-${index}`;
     
+    // Shown until the series itself has loaded
+    const latestValue = measurement.latest ? measurement.latest.value.toFixed(2) : '--';
+
     const cardHeader = document.createElement('div');
     cardHeader.className = 'sensor-header';
     cardHeader.innerHTML = `
@@ -127,7 +121,7 @@ function createMeasurementCard(measurement, index) {
             <span class="sensor-subtitle">${measurement.sensorType}</span>
         </div>
         <div class="sensor-value-container" id="value-container-${index}">
-            <span class="sensor-value" id="current-value-${index}">--</span>
+            <span class="sensor-value" id="current-value-${index}">${latestValue}</span>
             <span class="sensor-unit">${measurement.unit}</span>
         </div>
     `;
@@ -155,25 +149,34 @@ async function loadAllMeasurementData() {
 
 async function loadMeasurementData(measurement, index) {
     try {
-        const response = await fetch(
-            `/api/measurement/${measurement.nodeId}/${measurement.sensorId}/${measurement.measurementId}`
-        );
-        const result = await response.json();
+        const state = seriesState[index];
+        const baseUrl = `/api/measurement/${measurement.nodeId}/${measurement.sensorId}/${measurement.measurementId}`;
+
+        // First load fetches the tail, later polls only rows after the cursor
+        const url = state ? `${baseUrl}?since=${state.cursor}` : `${baseUrl}?limit=${maxDataPoints}`;
+        const result = await fetchColumnar(url);
         
-        if (result.data && Array.isArray(result.data)) {
-            const timestamps = result.data.map(d => new Date(d.timestamp));
-            const values = result.data.map(d => d.value);
-            
-            // Keep only last maxDataPoints
-            const startIdx = Math.max(0, timestamps.length - maxDataPoints);
-            const slicedTimestamps = timestamps.slice(startIdx);
-            const slicedValues = values.slice(startIdx);
-            
-            updatePlot(index, slicedTimestamps, slicedValues, measurement);
+        if (result.columns) {
+            const timestamps = Array.from(result.timestamps, columnarDate);
+            const values = Array.from(result.columns.value);
+
+            const merged = state || { timestamps: [], values: [], cursor: 0 };
+            const added = mergeReadings(merged, timestamps, values);
+            merged.cursor = result.meta.cursor ?? merged.cursor;
+            seriesState[index] = merged;
+
+            if (!state || added > 0) {
+                updatePlot(index, merged.timestamps, merged.values, measurement);
+            }
+            if (pendingReadings[index]) {
+                const pending = pendingReadings[index];
+                delete pendingReadings[index];
+                appendReadings(index, pending.timestamps, pending.values);
+            }
             
             // Update current value display
-            if (values.length > 0) {
-                const currentValue = values[values.length - 1];
+            if (merged.values.length > 0) {
+                const currentValue = merged.values[merged.values.length - 1];
                 const valueElement = document.getElementById(`current-value-${index}`);
                 if (valueElement) {
                     valueElement.textContent = currentValue.toFixed(2);
@@ -186,6 +189,29 @@ async function loadMeasurementData(measurement, index) {
     }
 }
 
+// Merge polled rows into a series by time. The cursor is not advanced by
+// pushed readings, so a poll may return rows the stream already delivered;
+// those are skipped. Returns how many rows were new.
+function mergeReadings(state, timestamps, values) {
+    const known = new Set(state.timestamps.map(ts => ts.getTime()));
+    const rows = state.timestamps.map((ts, i) => [ts, state.values[i]]);
+    let added = 0;
+    timestamps.forEach((ts, i) => {
+        if (!known.has(ts.getTime())) {
+            known.add(ts.getTime());
+            rows.push([ts, values[i]]);
+            added++;
+        }
+    });
+    rows.sort((a, b) => a[0] - b[0]);
+
+    // Keep only last maxDataPoints
+    const kept = rows.slice(Math.max(0, rows.length - maxDataPoints));
+    state.timestamps = kept.map(row => row[0]);
+    state.values = kept.map(row => row[1]);
+    return added;
+}
+
 function updatePlot(index, timestamps, values, measurement) {
     const plotDiv = document.getElementById(`plot-${index}`);
     if (!plotDiv) return;
@@ -233,18 +259,128 @@ function updatePlot(index, timestamps, values, measurement) {
     Plotly.newPlot(plotDiv, [trace], layout, config);
 }
 
+// Append pushed readings to a plot without refetching its history
+function appendReadings(index, timestamps, values) {
+    const state = seriesState[index];
+    if (!state) {
+        // Initial load still running; applied once it has finished
+        const pending = pendingReadings[index] || (pendingReadings[index] = { timestamps: [], values: [] });
+        pending.timestamps.push(...timestamps);
+        pending.values.push(...values);
+        return;
+    }
+
+    // Skip readings the initial load already returned
+    const last = state.timestamps.length ? state.timestamps[state.timestamps.length - 1] : null;
+    const x = [];
+    const y = [];
+    timestamps.forEach((ts, i) => {
+        if (last === null || ts > last) {
+            x.push(ts);
+            y.push(values[i]);
+        }
+    });
+    if (x.length === 0) return;
+
+    state.timestamps = state.timestamps.concat(x).slice(-maxDataPoints);
+    state.values = state.values.concat(y).slice(-maxDataPoints);
+
+    const plotDiv = document.getElementById(`plot-${index}`);
+    if (plotDiv && plotDiv.data) {
+        Plotly.extendTraces(plotDiv, { x: [x], y: [y] }, [0], maxDataPoints);
+    }
+    const valueElement = document.getElementById(`current-value-${index}`);
+    if (valueElement) {
+        valueElement.textContent = y[y.length - 1].toFixed(2);
+    }
+}
+
+// Start over from the latest rows, e.g. after readings were missed
+function reloadAllMeasurementData() {
+    seriesState = {};
+    pendingReadings = {};
+    return loadAllMeasurementData();
+}
+
+function openLiveStream() {
+    if (!window.EventSource) {
+        setupAutoUpdate(currentInterval());
+        return;
+    }
+    closeLiveStream();
+
+    const stream = new EventSource(`/api/stream/${nodeId}`);
+    let dropped = false;
+    let received = false;
+    liveStream = stream;
+    setupAutoUpdate(currentInterval());
+
+    stream.addEventListener('readings', (event) => {
+        const batches = {};
+        for (const [sensorId, measurementId, ts, value] of JSON.parse(event.data).readings) {
+            const index = seriesIndex[`${sensorId},${measurementId}`];
+            if (index === undefined) continue;
+            const batch = batches[index] || (batches[index] = { timestamps: [], values: [] });
+            batch.timestamps.push(new Date(ts));
+            batch.values.push(value);
+            received = true;
+        }
+        for (const [index, batch] of Object.entries(batches)) {
+            appendReadings(index, batch.timestamps, batch.values);
+        }
+        updateGlobalLastUpdate();
+    });
+
+    // The server dropped readings for us; reload rather than show a gap
+    stream.addEventListener('resync', () => reloadAllMeasurementData());
+
+    stream.onopen = () => {
+        if (dropped) {
+            dropped = false;
+            reloadAllMeasurementData();
+        }
+    };
+
+    stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED) {
+            // Refused (e.g. too many streams): fall back to polling
+            liveStream = null;
+            if (received) {
+                reloadAllMeasurementData();
+            }
+            setupAutoUpdate(currentInterval());
+        } else {
+            // The browser reconnects by itself; catch up once it has
+            dropped = true;
+        }
+    };
+}
+
+function closeLiveStream() {
+    if (liveStream) {
+        liveStream.close();
+        liveStream = null;
+    }
+}
+
+function currentInterval() {
+    return parseInt(document.getElementById('updateIntervalSelect')?.value) || 5000;
+}
+
 function setupAutoUpdate(interval) {
     // Clear existing interval
     if (updateIntervalId) {
         clearInterval(updateIntervalId);
+        updateIntervalId = null;
     }
     
-    // Set up new interval if auto-update is enabled
     if (autoUpdate) {
+        // With a live stream the poll only has to catch up, so it can be slow
+        const every = liveStream ? Math.max(interval, catchUpInterval) : interval;
         updateIntervalId = setInterval(() => {
             loadAllMeasurementData();
             updateGlobalLastUpdate();
-        }, interval);
+        }, every);
     }
 }
 
@@ -254,10 +390,11 @@ function toggleAutoUpdate() {
     
     if (autoUpdate) {
         btn.textContent = 'Pause';
-        const interval = parseInt(document.getElementById('updateIntervalSelect').value);
-        setupAutoUpdate(interval);
+        reloadAllMeasurementData();
+        openLiveStream();
     } else {
         btn.textContent = 'Resume';
+        closeLiveStream();
         if (updateIntervalId) {
             clearInterval(updateIntervalId);
             updateIntervalId = null;
@@ -266,7 +403,7 @@ function toggleAutoUpdate() {
 }
 
 function refreshAllSensors() {
-    loadAllMeasurementData();
+    reloadAllMeasurementData();
     updateGlobalLastUpdate();
 }
 
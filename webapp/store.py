@@ -0,0 +1,408 @@
+import os
+from datetime import date
+from rollups import (
+    ROLLUP_PERIODS, SERIES_KEY, SERIES_KEY_DDL, rollup_table, rollup_tables, create_rollup_tables,
+    update_rollups, backfill_rollups, bucket_stats_sql, window_start_sql,
+)
+
+# Storage layout for sensor readings, chosen with STORAGE_LAYOUT:
+#   tables        one {node}_{sensor}_{measurement} table per measurement,
+#                 each with its own rollup tables (default)
+#   consolidated  a single Measurement table keyed by (node_id, sensor_id,
+#                 measurement_id, timestamp) and range-partitioned by month,
+#                 with keyed Measurement_hourly/_daily rollups
+#
+# Every read and write of readings goes through this module so the rest of
+# the webapp does not care which layout is live. A series is identified by
+# its key tuple (node_id, sensor_id, measurement_id).
+LAYOUT = os.getenv("STORAGE_LAYOUT", "tables")
+MEASUREMENT_TABLE = "Measurement"
+
+
+# Secondary index of every per-measurement table. Latest-value lookups scan
+# it backwards and window aggregates read it without touching the rows.
+TIMESTAMP_INDEX = "idx_timestamp_value"
+TIMESTAMP_INDEX_COLUMNS = ("timestamp", "value")
+
+
+def consolidated():
+    return LAYOUT == "consolidated"
+
+
+def measurement_table(node_id, sensor_id, measurement_id):
+    return f"{node_id}_{sensor_id}_{measurement_id}"
+
+
+def _key_where(key):
+    return [f"{col} = %s" for col in SERIES_KEY], list(key)
+
+
+def source(key):
+    """(table, where clauses, params) selecting the raw rows of one series."""
+    if consolidated():
+        return (MEASUREMENT_TABLE, *_key_where(key))
+    return measurement_table(*key), [], []
+
+
+def rollup_source(key, period):
+    """Same as source() for the hourly or daily rollup of one series."""
+    if consolidated():
+        return (rollup_table(MEASUREMENT_TABLE, period), *_key_where(key))
+    return rollup_table(measurement_table(*key), period), [], []
+
+
+def _fetch(cursor, query, params=()):
+    """Run a query and return plain tuples, whatever kind of cursor is passed."""
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    if rows and isinstance(rows[0], dict):
+        return [tuple(row.values()) for row in rows]
+    return rows
+
+
+def existing_tables(cursor, tables):
+    """
+    Return the subset of `tables` that exist in the current database, using a
+    single information_schema lookup instead of probing each table.
+    """
+    if not tables:
+        return set()
+    placeholders = ", ".join(["%s"] * len(tables))
+    return {row[0] for row in _fetch(cursor, f"""
+        SELECT TABLE_NAME AS table_name
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+    """, tuple(tables))}
+
+
+def provisioned(cursor, keys):
+    """
+    Split `keys` into the series that have raw storage and the series whose
+    rollups exist, in one lookup. In the consolidated layout every series
+    lives in the shared tables, so only those need to exist.
+    """
+    keys = list(keys)
+    if consolidated():
+        existing = existing_tables(cursor, [MEASUREMENT_TABLE, *rollup_tables(MEASUREMENT_TABLE)])
+        stored = set(keys) if MEASUREMENT_TABLE in existing else set()
+        rolled = stored if len(existing) == 1 + len(rollup_tables(MEASUREMENT_TABLE)) else set()
+        return stored, rolled
+
+    tables = {key: measurement_table(*key) for key in keys}
+    existing = existing_tables(cursor, [t for tbl in tables.values() for t in [tbl, *rollup_tables(tbl)]])
+    stored = {key for key, tbl in tables.items() if tbl in existing}
+    rolled = {key for key in stored if all(t in existing for t in rollup_tables(tables[key]))}
+    return stored, rolled
+
+
+def has_rollups(cursor, key):
+    _, rolled = provisioned(cursor, [key])
+    return key in rolled
+
+
+def has_minute_rollup(cursor, key):
+    """Whether the retention job has created minute aggregates for the series."""
+    table, _, _ = rollup_source(key, "minute")
+    return table in existing_tables(cursor, [table])
+
+
+def latest_values_query(keys):
+    """
+    One UNION ALL of per-series `ORDER BY timestamp DESC LIMIT 1` lookups,
+    tagged with the series key so the result can be mapped back. Columns:
+    node_id, sensor_id, measurement_id, value, timestamp.
+    """
+    parts, params = [], []
+    for key in keys:
+        table, where, key_params = source(key)
+        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+        parts.append(
+            f"(SELECT %s AS node_id, %s AS sensor_id, %s AS measurement_id, value, timestamp "
+            f"FROM {table} {where_sql} ORDER BY timestamp DESC LIMIT 1)"
+        )
+        params.extend([*key, *key_params])
+    return " UNION ALL ".join(parts), tuple(params)
+
+
+def latest_values(cursor, keys):
+    """{key: (value, timestamp)} of the newest reading of each series."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    query, params = latest_values_query(keys)
+    return {
+        (str(row[0]), int(row[1]), int(row[2])): (row[3], row[4])
+        for row in _fetch(cursor, query, params)
+    }
+
+
+def _raw_bucket_stats_sql(key, interval_hours, bucket_expr):
+    table, where, params = source(key)
+    where = where + [f"timestamp >= NOW() - INTERVAL {int(interval_hours)} HOUR"]
+    return f"""
+        SELECT {bucket_expr} AS bucket,
+               SUM(value) AS total,
+               COUNT(*) AS cnt,
+               SUM(value < 50) AS good,
+               SUM(value >= 50 AND value <= 100) AS moderate,
+               SUM(value > 100 AND value <= 200) AS unhealthy,
+               SUM(value > 200) AS hazardous
+        FROM {table}
+        WHERE {" AND ".join(where)}
+        GROUP BY bucket
+    """, params
+
+
+def bucket_stats_query(keys, interval_hours, hourly, rolled):
+    """
+    Per-bucket sum/count and AQI category counts over the given series,
+    merged across series. Per-table series are aggregated inside each table
+    first and then combined; the consolidated layout covers them all with
+    one scan of its keyed rollups. Series without rollups fall back to raw
+    rows. Returns (query, params).
+    """
+    keys = list(keys)
+    bucket_expr = "HOUR(timestamp)" if hourly else "DATE(timestamp)"
+    parts, params = [], []
+
+    if consolidated() and keys and all(key in rolled for key in keys):
+        series_filter = f"({', '.join(SERIES_KEY)}) IN ({', '.join(['(%s, %s, %s)'] * len(keys))})"
+        parts.append(bucket_stats_sql(MEASUREMENT_TABLE, interval_hours, hourly, series_filter))
+        params.extend(value for key in keys for value in key)
+    else:
+        for key in keys:
+            if key in rolled and not consolidated():
+                parts.append(bucket_stats_sql(measurement_table(*key), interval_hours, hourly))
+            else:
+                sql, raw_params = _raw_bucket_stats_sql(key, interval_hours, bucket_expr)
+                parts.append(sql)
+                params.extend(raw_params)
+
+    return f"""
+        SELECT bucket,
+               SUM(total) AS total,
+               SUM(cnt) AS cnt,
+               SUM(good) AS good,
+               SUM(moderate) AS moderate,
+               SUM(unhealthy) AS unhealthy,
+               SUM(hazardous) AS hazardous
+        FROM ({" UNION ALL ".join(parts)}) per_table
+        GROUP BY bucket
+    """, tuple(params)
+
+
+def hourly_average_query(key, hours=24, use_rollup=False):
+    """Average per hour of day over the last `hours` hours. Returns (query, params)."""
+    if use_rollup:
+        table, where, params = rollup_source(key, "hourly")
+        where = where + [f"bucket >= {window_start_sql(hours, 'hourly')}"]
+        return f"""
+            SELECT HOUR(bucket) AS hr, SUM(sum_value) / SUM(count) AS avg_val
+            FROM {table}
+            WHERE {" AND ".join(where)}
+            GROUP BY hr
+            ORDER BY hr
+        """, tuple(params)
+    table, where, params = source(key)
+    where = where + [f"timestamp >= NOW() - INTERVAL {int(hours)} HOUR"]
+    return f"""
+        SELECT HOUR(timestamp) AS hr, AVG(value) AS avg_val
+        FROM {table}
+        WHERE {" AND ".join(where)}
+        GROUP BY hr
+        ORDER BY hr
+    """, tuple(params)
+
+
+def insert_readings(cursor, key, rows):
+    """
+    Insert (timestamp, value) rows of one series with a single multi-row
+    INSERT and fold them into its rollups. Timestamps must already be
+    resolved to datetimes. The caller owns the transaction.
+    """
+    if consolidated():
+        cursor.executemany(
+            f"INSERT INTO {MEASUREMENT_TABLE} ({', '.join(SERIES_KEY)}, timestamp, value) "
+            f"VALUES (%s, %s, %s, %s, %s)",
+            [(*key, ts, value) for ts, value in rows]
+        )
+        update_rollups(cursor, MEASUREMENT_TABLE, rows, key=key)
+        return
+
+    table = measurement_table(*key)
+    cursor.executemany(
+        f"INSERT INTO {table} (timestamp, value) VALUES (%s, %s)",
+        rows
+    )
+    update_rollups(cursor, table, rows)
+
+
+def rollup_target(key):
+    """(table, key) to hand to the rollups module for one series."""
+    if consolidated():
+        return MEASUREMENT_TABLE, key
+    return measurement_table(*key), None
+
+
+def create_series_rollups(cursor, key, periods=ROLLUP_PERIODS):
+    table, series_key = rollup_target(key)
+    create_rollup_tables(cursor, table, keyed=series_key is not None, periods=periods)
+
+
+def fold_into_rollups(cursor, key, rows, periods=ROLLUP_PERIODS):
+    table, series_key = rollup_target(key)
+    update_rollups(cursor, table, rows, key=series_key, periods=periods)
+
+
+def oldest_rows(cursor, key, before, limit):
+    """
+    Up to `limit` (id, timestamp, value) raw rows older than `before`,
+    oldest first. Per-measurement tables walk the primary key, where old
+    rows come first; the consolidated table walks its (series, timestamp)
+    key.
+    """
+    table, where, params = source(key)
+    order = "timestamp" if consolidated() else "id"
+    cursor.execute(f"""
+        SELECT id, timestamp, value FROM {table}
+        WHERE {" AND ".join(where + ["timestamp < %s"])}
+        ORDER BY {order}
+        LIMIT %s
+    """, (*params, before, limit))
+    return cursor.fetchall()
+
+
+def count_older(cursor, key, before, period=None):
+    """Raw rows (or buckets of the `period` rollup) older than `before`."""
+    if period:
+        table, where, params = rollup_source(key, period)
+        column = "bucket"
+    else:
+        table, where, params = source(key)
+        column = "timestamp"
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM {table} WHERE {" AND ".join(where + [f"{column} < %s"])}
+    """, (*params, before))
+    return cursor.fetchone()[0]
+
+
+def delete_rows(cursor, key, ids):
+    table, where, params = source(key)
+    cursor.execute(f"""
+        DELETE FROM {table}
+        WHERE {" AND ".join(where + [f"id IN ({', '.join(['%s'] * len(ids))})"])}
+    """, (*params, *ids))
+    return cursor.rowcount
+
+
+def delete_rollup_buckets(cursor, key, period, before, limit):
+    """Delete up to `limit` buckets of one rollup older than `before`."""
+    table, where, params = rollup_source(key, period)
+    cursor.execute(f"""
+        DELETE FROM {table}
+        WHERE {" AND ".join(where + ["bucket < %s"])}
+        ORDER BY bucket
+        LIMIT %s
+    """, (*params, before, limit))
+    return cursor.rowcount
+
+
+def table_sizes(cursor, tables):
+    """{table: (rows estimate, avg row bytes, data + index bytes)} from information_schema."""
+    if not tables:
+        return {}
+    placeholders = ", ".join(["%s"] * len(tables))
+    return {row[0]: (row[1] or 0, row[2] or 0, (row[3] or 0) + (row[4] or 0)) for row in _fetch(cursor, f"""
+        SELECT TABLE_NAME, TABLE_ROWS, AVG_ROW_LENGTH, DATA_LENGTH, INDEX_LENGTH
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+    """, tuple(tables))}
+
+
+def backfill_series_rollups(cursor, key):
+    """Recompute the rollups of one series from its raw rows."""
+    if consolidated():
+        return backfill_rollups(cursor, MEASUREMENT_TABLE, key=key)
+    return backfill_rollups(cursor, measurement_table(*key))
+
+
+# -----------------------------------------------------------------------------
+# Consolidated layout DDL
+# -----------------------------------------------------------------------------
+
+def _month_start(day, offset=0):
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _partition(month):
+    bound = _month_start(month, 1)
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{bound:%Y-%m-%d}')"
+
+
+def create_measurement_store(cursor, first_month=None, months_ahead=3):
+    """
+    Create the consolidated Measurement table and its keyed rollups.
+
+    Readings are clustered by series and time, so a series scan is one
+    primary key range. `id` stays as the monotonic polling cursor of the
+    series API. Monthly partitions run from `first_month` to `months_ahead`
+    months past today, and a catch-all pmax takes anything later until
+    ensure_partitions() splits it; compact_measurements.py does that on
+    every run, so it has to be scheduled.
+    """
+    today = date.today()
+    first = _month_start(first_month or today)
+    last = _month_start(today, months_ahead)
+    months = []
+    while first <= last:
+        months.append(first)
+        first = _month_start(first, 1)
+    partitions = ",\n            ".join([_partition(m) for m in months] + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {MEASUREMENT_TABLE} (
+        {SERIES_KEY_DDL},
+        timestamp DATETIME NOT NULL,
+        id BIGINT NOT NULL AUTO_INCREMENT,
+        value DOUBLE NOT NULL,
+        PRIMARY KEY ({", ".join(SERIES_KEY)}, timestamp, id),
+        KEY idx_id (id),
+        KEY idx_series_id ({", ".join(SERIES_KEY)}, id)
+        )
+        PARTITION BY RANGE COLUMNS(timestamp) (
+            {partitions}
+        );""")
+    create_rollup_tables(cursor, MEASUREMENT_TABLE, keyed=True)
+
+
+def partition_names(cursor):
+    return [row[0] for row in _fetch(cursor, """
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (MEASUREMENT_TABLE,))]
+
+
+def ensure_partitions(cursor, months_ahead=3):
+    """
+    Split pmax so monthly partitions exist up to `months_ahead` months from
+    now. Returns the names of the partitions added.
+    """
+    names = partition_names(cursor)
+    monthly = sorted(n for n in names if n != "pmax")
+    if not monthly:
+        return []
+    newest = date(int(monthly[-1][1:5]), int(monthly[-1][5:7]), 1)
+    target = _month_start(date.today(), months_ahead)
+
+    months = []
+    month = _month_start(newest, 1)
+    while month <= target:
+        months.append(month)
+        month = _month_start(month, 1)
+    if not months:
+        return []
+
+    parts = ", ".join([_partition(m) for m in months] + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+    cursor.execute(f"ALTER TABLE {MEASUREMENT_TABLE} REORGANIZE PARTITION pmax INTO ({parts})")
+    return [f"p{m:%Y%m}" for m in months]
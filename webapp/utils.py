@@ -1,6 +1,8 @@
 import mysql.connector
-import os
-from dotenv import load_dotenv
+from db import get_connection
+import store
+import registry
+from sparkline import generate_smooth_path
 
 def get_index_stats_dummy():
     import random
@@ -45,36 +47,24 @@ def get_index_stats_dummy():
 
 def get_node_stats(node_id):
     result = {}
-    
-    load_dotenv()
-    db_config = {
-        'host': os.getenv('DB_HOST'),
-        'user': os.getenv('DB_USER'),
-        'password': os.getenv('DB_PASSWORD'),
-        'database': os.getenv('DB_NAME')
-    }
 
     conn = None
     cursor = None
 
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        cursor.execute("SELECT node_id, sensor_id, measurement_id, measurement_name, unit FROM Sensor WHERE node_id = %s", (node_id,))
-        sensors = cursor.fetchall()
+        sensors = registry.node_measurements(node_id)
+        keys = registry.node_keys(node_id)
+        aqi_key = (str(node_id), 1, 1)
+        stored, rolled = registry.provisioned(keys + [aqi_key])
 
+        # Latest value of every measurement in one round trip
+        latest = store.latest_values(cursor, [key for key in keys if key in stored])
         sensor_values = []
-        for sensor in sensors:
-            tbl_name = f"{sensor['node_id']}_{sensor['sensor_id']}_{sensor['measurement_id']}"
-            cursor.execute(f"""
-                SELECT value
-                FROM {tbl_name}
-                ORDER BY timestamp DESC
-                LIMIT 1
-            """)
-            row = cursor.fetchone()
-            value = row["value"] if row else None
+        for sensor, key in zip(sensors, keys):
+            value = latest[key][0] if key in latest else None
             sensor_values.append({
                 "name": sensor["measurement_name"],
                 "unit": sensor["unit"],
@@ -83,14 +73,8 @@ def get_node_stats(node_id):
 
         result["measurements"] = sensor_values
 
-        tbl_name = f"{node_id}_1_1"
-        cursor.execute(f"""
-            SELECT HOUR(timestamp) AS hr, AVG(value) AS avg_val
-            FROM {tbl_name}
-            WHERE timestamp >= NOW() - INTERVAL 24 HOUR
-            GROUP BY hr
-            ORDER BY hr
-        """)
+        query, params = store.hourly_average_query(aqi_key, 24, use_rollup=aqi_key in rolled)
+        cursor.execute(query, params)
         rows = cursor.fetchall()
 
         hourly_aqi = [None] * 24
@@ -127,26 +111,24 @@ def get_node_stats(node_id):
 
 
 def get_index_stats(interval_hours=24):
-    if interval_hours not in [24, 168, 720]:
-        interval_hours = 24
     """
     Get AQI statistics for the specified time interval.
-    
+
+    All node tables are read in two queries (latest values, bucketed
+    averages) regardless of how many nodes exist, with the node list and
+    provisioning state coming from the registry; averaging and category
+    counting happen in MySQL, from the hourly/daily rollups where they have
+    been provisioned.
+
     Args:
         interval_hours: Time interval in hours (24 for 1 day, 168 for 7 days, 720 for 30 days)
-    
-    Recommended indexes:
-        CREATE INDEX idx_timestamp ON {node_table} (timestamp DESC);
-        CREATE INDEX idx_timestamp_value ON {node_table} (timestamp, value);
-    """
-    load_dotenv()
 
-    db_config = {
-        'host': os.getenv('DB_HOST'),
-        'user': os.getenv('DB_USER'),
-        'password': os.getenv('DB_PASSWORD'),
-        'database': os.getenv('DB_NAME')
-    }
+    The latest-value and raw-window queries rely on the (timestamp, value)
+    index that initialize_node creates; db_scripts/audit_indexes.py adds
+    it to older tables.
+    """
+    if interval_hours not in [24, 168, 720]:
+        interval_hours = 24
 
     # Initialize result with all required keys including worst1-worst5
     result = {
@@ -172,146 +154,119 @@ def get_index_stats(interval_hours=24):
     cursor = None
 
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
         # -------------------------------------------------------------
         # 1. Load node metadata
         # -------------------------------------------------------------
-        cursor.execute("SELECT node_id, location FROM Node")
-        nodes = cursor.fetchall()
-        
+        nodes = registry.nodes()
+
         if not nodes:
             return result  # Return initialized result instead of error
-            
-        node_locations = {n["node_id"]: n["location"] for n in nodes}
-        node_ids = list(node_locations.keys())
-        node_tables = [f"{nid}_1_1" for nid in node_ids]
 
-        result['active_nodes'] = len(node_tables)
+        node_locations = {node_id: n["location"] for node_id, n in nodes.items()}
+        node_keys = [(str(nid), 1, 1) for nid in node_locations]
+
+        result['active_nodes'] = len(node_keys)
+
+        # Skip nodes whose AQI series has not been provisioned yet
+        stored, rolled = registry.provisioned(node_keys)
+        for key in node_keys:
+            if key not in stored:
+                print(f"Error querying table {store.measurement_table(*key)}: table does not exist")
+        node_keys = [key for key in node_keys if key in stored]
+
+        if not node_keys:
+            result['aqi_trend_path'] = generate_smooth_path([0] * 24)
+            result['aqi_time'] = [f"{str(h).zfill(2)}" for h in range(0, 25, 4)]
+            return result
 
         # -------------------------------------------------------------
-        # 2. OPTIMIZED: Get latest value and interval data for each node
+        # 2. Latest value of every node in one round trip
         # -------------------------------------------------------------
         latest_values = {}
-        trend_data = []
-        category_values = []
-
-        for node_id, tbl in zip(node_ids, node_tables):
-            try:
-                # Get latest value
-                cursor.execute(f"""
-                    SELECT value, timestamp
-                    FROM {tbl}
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                """)
-                latest_row = cursor.fetchone()
-                
-                if latest_row and latest_row["value"] is not None:
-                    latest_values[node_id] = {
-                        "value": latest_row["value"],
-                        "timestamp": latest_row["timestamp"],
-                        "location": node_locations.get(node_id, "Unknown")
-                    }
-                
-                # Get interval data for trend and categories
-                cursor.execute(f"""
-                    SELECT value, timestamp
-                    FROM {tbl}
-                    WHERE timestamp >= NOW() - INTERVAL {interval_hours} HOUR
-                    ORDER BY timestamp ASC
-                """)
-                
-                interval_rows = cursor.fetchall()
-                for row in interval_rows:
-                    if row["value"] is not None:
-                        trend_data.append({"timestamp": row["timestamp"], "value": row["value"]})
-                        category_values.append(row["value"])
-                        
-            except mysql.connector.Error as e:
-                print(f"Error querying table {tbl}: {e}")
-                continue
+        for key, (value, timestamp) in store.latest_values(cursor, node_keys).items():
+            if value is not None:
+                latest_values[key[0]] = {
+                    "value": value,
+                    "timestamp": timestamp,
+                    "location": node_locations.get(key[0], "Unknown")
+                }
+
+        # -------------------------------------------------------------
+        # 3. Bucketed averages and category counts in one round trip
+        #    (hourly for 24h, daily for longer periods)
+        # -------------------------------------------------------------
+        hourly = interval_hours <= 24
+        query, params = store.bucket_stats_query(node_keys, interval_hours, hourly, rolled)
+        cursor.execute(query, params)
+        buckets = {}
+        categories = {'good': 0, 'moderate': 0, 'unhealthy': 0, 'hazardous': 0}
+        for row in cursor.fetchall():
+            if row["cnt"]:
+                buckets[row["bucket"]] = float(row["total"]) / int(row["cnt"])
+            for key in categories:
+                categories[key] += int(row[key] or 0)
 
         # -------------------------------------------------------------
-        # 3. Calculate average AQI
+        # 4. Calculate average AQI
         # -------------------------------------------------------------
         if latest_values:
             avg_aqi = sum(d["value"] for d in latest_values.values()) / len(latest_values)
             result['avg_aqi'] = round(avg_aqi, 2)
 
         # -------------------------------------------------------------
-        # 4. Build AQI trend (hourly or daily based on interval)
+        # 5. Build AQI trend (hourly or daily based on interval)
         # -------------------------------------------------------------
-        if trend_data:
-            from collections import defaultdict
+        if buckets:
             from datetime import datetime, timedelta
-            
-            # Determine grouping (hourly for 24h, daily for longer periods)
-            if interval_hours <= 24:
-                # Hourly grouping
-                hourly_avg = defaultdict(list)
-                
-                for item in trend_data:
-                    hour = item["timestamp"].hour
-                    hourly_avg[hour].append(item["value"])
-                
+
+            if hourly:
                 trend_values = []
                 for h in range(24):
-                    if h in hourly_avg:
-                        trend_values.append(sum(hourly_avg[h]) / len(hourly_avg[h]))
+                    if h in buckets:
+                        trend_values.append(buckets[h])
                     elif trend_values:
                         trend_values.append(trend_values[-1])
                     else:
                         trend_values.append(0)
-                
+
                 result['aqi_time'] = [f"{str(h).zfill(2)}" for h in range(0, 25, 4)]
-            
+
             else:
                 # Daily grouping for 7 days or 30 days
-                daily_avg = defaultdict(list)
-                
-                for item in trend_data:
-                    day = item["timestamp"].date()
-                    daily_avg[day].append(item["value"])
-                
-                # Calculate number of days
                 num_days = min(interval_hours // 24, 30)
                 trend_values = []
-                
+
                 end_date = datetime.now().date()
                 for i in range(num_days):
                     day = end_date - timedelta(days=num_days - 1 - i)
-                    if day in daily_avg:
-                        trend_values.append(sum(daily_avg[day]) / len(daily_avg[day]))
+                    if day in buckets:
+                        trend_values.append(buckets[day])
                     elif trend_values:
                         trend_values.append(trend_values[-1])
                     else:
                         trend_values.append(0)
-                
+
                 # Time labels for days
-                if num_days <= 7:
-                    result['aqi_time'] = [f"Day {i+1}" for i in range(0, num_days, max(1, num_days // 6))]
-                else:
-                    result['aqi_time'] = [f"Day {i+1}" for i in range(0, num_days, max(1, num_days // 6))]
-            
+                result['aqi_time'] = [f"Day {i+1}" for i in range(0, num_days, max(1, num_days // 6))]
+
             result['aqi_trend_path'] = generate_smooth_path(trend_values)
         else:
             result['aqi_trend_path'] = generate_smooth_path([0] * 24)
             result['aqi_time'] = [f"{str(h).zfill(2)}" for h in range(0, 25, 4)]
 
         # -------------------------------------------------------------
-        # 5. Calculate AQI category percentages
+        # 6. Calculate AQI category percentages
         # -------------------------------------------------------------
-        if category_values:
-            total = len(category_values)
-            result['good'] = round(sum(1 for v in category_values if v < 50) * 100.0 / total, 2)
-            result['moderate'] = round(sum(1 for v in category_values if 50 <= v <= 100) * 100.0 / total, 2)
-            result['unhealthy'] = round(sum(1 for v in category_values if 100 < v <= 200) * 100.0 / total, 2)
-            result['hazardous'] = round(sum(1 for v in category_values if v > 200) * 100.0 / total, 2)
+        total = sum(categories.values())
+        if total:
+            for key, count in categories.items():
+                result[key] = round(count * 100.0 / total, 2)
 
         # -------------------------------------------------------------
-        # 6. Worst 5 nodes by latest AQI
+        # 7. Worst 5 nodes by latest AQI
         # -------------------------------------------------------------
         worst_list = [
             {
@@ -322,7 +277,7 @@ def get_index_stats(interval_hours=24):
             }
             for node_id, data in latest_values.items()
         ]
-        
+
         worst_list.sort(key=lambda x: x["aqi"], reverse=True)
         worst_list = worst_list[:5]
 
@@ -342,13 +297,14 @@ def get_index_stats(interval_hours=24):
                 }
 
         # -------------------------------------------------------------
-        # 7. Optional: Count alerts (AQI > threshold)
+        # 8. Optional: Count alerts (AQI > threshold)
         # -------------------------------------------------------------
         result['alerts'] = sum(1 for v in latest_values.values() if v["value"] > 100)
 
     except mysql.connector.Error as e:
         print("Database error:", e)
-        # Return the initialized result even on error
+        # Return the initialized result even on error, marked so it is not cached
+        result["error"] = str(e)
         return result
 
     finally:
@@ -358,53 +314,3 @@ def get_index_stats(interval_hours=24):
             conn.close()
 
     return result
-
-
-def generate_smooth_path(values, width=472, height=150):
-    values = [v if v is not None else 0 for v in values]
-    if sum(values) == 0:
-        values = [1 for _ in values]
-    n = len(values)
-    if n < 2:
-        raise ValueError("Need at least 2 points")
-
-    # Normalize Y values (invert SVG Y axis)
-    max_val = max(values)
-    scaled = [height - (v / max_val * height + 0.000001) for v in values]
-
-    # Evenly spaced X values
-    step = width / (n - 1)
-    pts = [(i * step, scaled[i]) for i in range(n)]
-
-    def catmull_rom_to_bezier(p0, p1, p2, p3):
-        """
-        Convert 4 Catmull-Rom points into 2 Bézier control points.
-        """
-        c1 = (p1[0] + (p2[0] - p0[0]) / 6,
-              p1[1] + (p2[1] - p0[1]) / 6)
-
-        c2 = (p2[0] - (p3[0] - p1[0]) / 6,
-              p2[1] - (p3[1] - p1[1]) / 6)
-
-        return c1, c2
-
-    # Start
-    d = [f"M{pts[0][0]},{pts[0][1]}"]
-
-    # Build smooth curve
-    for i in range(n - 1):
-        p0 = pts[i - 1] if i > 0 else pts[i]
-        p1 = pts[i]
-        p2 = pts[i + 1]
-        p3 = pts[i + 2] if i + 2 < n else pts[i + 1]
-
-        c1, c2 = catmull_rom_to_bezier(p0, p1, p2, p3)
-
-        d.append(f"C{c1[0]},{c1[1]} {c2[0]},{c2[1]} {p2[0]},{p2[1]}")
-
-    line_path = " ".join(d)
-
-    # Area path (close shape)
-    area_path = line_path + f" V{height} H0 Z"
-
-    return area_path, line_path
\ No newline at end of file
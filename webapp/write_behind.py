@@ -0,0 +1,244 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import timedelta
+from mysql.connector import Error, errors
+from db import get_connection
+from ingest import insert_readings, measurement_table, resolve_timestamps, db_now
+from cache import invalidate_node
+from pubsub import publish
+
+logger = logging.getLogger(__name__)
+
+# Opt-in write-behind buffer for single-reading uploads:
+#   INGEST_WRITE_BEHIND     1 to enable
+#   INGEST_QUEUE_SIZE       readings held in memory before post_data falls back to a direct write
+#   INGEST_FLUSH_SIZE       flush as soon as this many readings are waiting
+#   INGEST_FLUSH_INTERVAL   otherwise flush at least this often (seconds)
+#   INGEST_FLUSH_RETRIES    attempts per batch before it is put back on the queue
+ENABLED = os.getenv("INGEST_WRITE_BEHIND", "0") == "1"
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "20000"))
+FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1"))
+FLUSH_RETRIES = max(1, int(os.getenv("INGEST_FLUSH_RETRIES", "3")))
+
+# Lock wait timeout and deadlock: InnoDB may have rolled back the whole
+# transaction, not just the failed statement
+TRANSACTION_ERRORS = {1205, 1213}
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_flusher = None
+_flusher_lock = threading.Lock()
+_stopping = threading.Event()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "accepted": 0,
+    "rejected_full": 0,
+    "flushed": 0,
+    "failed": 0,
+    "retries": 0,
+    "requeued": 0,
+    "flushes": 0,
+    "flush_last_s": 0.0,
+    "flush_max_s": 0.0,
+    "flush_total_s": 0.0,
+}
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run, name="ingest-flusher", daemon=True)
+            _flusher.start()
+
+
+def enqueue(node_id, sensor_id, measurement_id, timestamp, value):
+    """
+    Queue one reading for the background flusher. Returns False when the
+    queue is full so the caller can write synchronously instead. Readings
+    without a timestamp keep their arrival time on the monotonic clock and
+    are stamped at flush time from the database's NOW(), back-dated by how
+    long they were queued, so both ingest paths use the database clock.
+    """
+    _ensure_flusher()
+    try:
+        _queue.put_nowait(((node_id, sensor_id, measurement_id), timestamp, value, time.monotonic()))
+    except queue.Full:
+        with _stats_lock:
+            _stats["rejected_full"] += 1
+        return False
+    with _stats_lock:
+        _stats["accepted"] += 1
+    return True
+
+
+def _drain(max_items, wait):
+    items = []
+    deadline = time.monotonic() + wait
+    while len(items) < max_items:
+        timeout = deadline - time.monotonic()
+        try:
+            items.append(_queue.get(timeout=max(timeout, 0)) if timeout > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+def _aborts_transaction(err):
+    return err.errno in TRANSACTION_ERRORS or isinstance(err, (errors.OperationalError, errors.InterfaceError))
+
+
+def _stamp(cursor, grouped):
+    """{key: [(timestamp, value)]} from queued (timestamp|None, value, received) rows."""
+    now = None
+    if any(ts is None for rows in grouped.values() for ts, _, _ in rows):
+        now = db_now(cursor)
+        at = time.monotonic()
+    stamped = {
+        key: [(ts if ts is not None else (now - timedelta(seconds=at - received)).replace(microsecond=0), value)
+              for ts, value, received in rows]
+        for key, rows in grouped.items()
+    }
+    resolve_timestamps(cursor, stamped)
+    return stamped
+
+
+def _write_once(grouped):
+    """
+    One attempt at writing a batch in a single transaction. Returns
+    ({key: rows} committed, rows dropped). A statement error only drops
+    the rows of its own measurement table, undone via a savepoint; errors
+    that can abort the transaction are raised after a rollback.
+    """
+    written = {}
+    dropped = 0
+    connection = None
+    cursor = None
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+        for key, rows in _stamp(cursor, grouped).items():
+            cursor.execute("SAVEPOINT reading_batch")
+            try:
+                insert_readings(cursor, key, rows)
+                written[key] = rows
+            except Error as e:
+                if _aborts_transaction(e):
+                    raise
+                cursor.execute("ROLLBACK TO SAVEPOINT reading_batch")
+                dropped += len(rows)
+                logger.error(f"Dropping {len(rows)} readings for {measurement_table(*key)}: {e}")
+        connection.commit()
+        return written, dropped
+    except Error:
+        if connection:
+            try:
+                connection.rollback()
+            except Error:
+                pass
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+
+def _requeue(items):
+    """Put a batch back for a later flush; returns how many did not fit."""
+    for i, item in enumerate(items):
+        try:
+            _queue.put_nowait(item)
+        except queue.Full:
+            return len(items) - i
+    return 0
+
+
+def _write(items, requeue=True):
+    """
+    Write one drained batch, one multi-row insert per measurement table.
+    Readings only count as flushed, and are only published, once their
+    transaction has committed. A batch that keeps failing is put back on
+    the queue (or dropped, at shutdown or when the queue is full).
+    """
+    grouped = {}
+    for key, timestamp, value, received in items:
+        grouped.setdefault(key, []).append((timestamp, value, received))
+
+    start = time.monotonic()
+    written = {}
+    failed = 0
+    for attempt in range(FLUSH_RETRIES):
+        try:
+            written, failed = _write_once(grouped)
+            break
+        except Error as e:
+            logger.warning(f"Write-behind flush of {len(items)} readings failed "
+                           f"(attempt {attempt + 1}/{FLUSH_RETRIES}): {e}")
+            if attempt + 1 < FLUSH_RETRIES:
+                with _stats_lock:
+                    _stats["retries"] += 1
+                time.sleep(min(FLUSH_INTERVAL, 0.1 * 2 ** attempt))
+    else:
+        lost = _requeue(items) if requeue else len(items)
+        with _stats_lock:
+            _stats["requeued"] += len(items) - lost
+        failed = lost
+        if lost:
+            logger.error(f"Dropping {lost} readings after {FLUSH_RETRIES} failed flush attempts")
+        if requeue:
+            # Give the database a moment before the batch comes round again
+            _stopping.wait(FLUSH_INTERVAL)
+
+    flushed = sum(len(rows) for rows in written.values())
+    elapsed = time.monotonic() - start
+    with _stats_lock:
+        _stats["flushed"] += flushed
+        _stats["failed"] += failed
+        _stats["flushes"] += 1
+        _stats["flush_last_s"] = elapsed
+        _stats["flush_total_s"] += elapsed
+        _stats["flush_max_s"] = max(_stats["flush_max_s"], elapsed)
+
+    for node_id in {key[0] for key in written}:
+        invalidate_node(node_id)
+    publish(written)
+
+
+def _run():
+    while not _stopping.is_set():
+        items = _drain(FLUSH_SIZE, FLUSH_INTERVAL)
+        if items:
+            _write(items)
+
+
+def flush_all():
+    """Drain everything still queued; registered to run at interpreter exit."""
+    _stopping.set()
+    if _flusher is not None:
+        _flusher.join(timeout=FLUSH_INTERVAL * 2)
+    while True:
+        items = _drain(FLUSH_SIZE, 0)
+        if not items:
+            break
+        _write(items, requeue=False)
+
+
+atexit.register(flush_all)
+
+
+def write_behind_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["enabled"] = ENABLED
+    stats["queue_depth"] = _queue.qsize()
+    stats["queue_capacity"] = QUEUE_SIZE
+    stats["flush_avg_s"] = stats["flush_total_s"] / stats["flushes"] if stats["flushes"] else 0.0
+    return stats